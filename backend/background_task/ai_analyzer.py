@@ -1,127 +1,194 @@
-import os
+import asyncio
 import json
-import motor.motor_asyncio
-from dotenv import load_dotenv
-import google.generativeai as genai
+import numpy as np
 from fastapi import BackgroundTasks
-from typing import List
-
-from .pinecone_indexer import index_locations 
-
-load_dotenv(dotenv_path='../.env')
-
-MONGO_DB_URL = os.getenv("MONGO_DB_URL")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-if not all([MONGO_DB_URL, GEMINI_API_KEY]):
-    raise ValueError("One or more environment variables (Mongo, Gemini) are missing.")
-
-genai.configure(api_key=GEMINI_API_KEY)
-generation_model = genai.GenerativeModel("gemini-1.5-flash-latest")
-
+from typing import Dict, List, Optional
+
+from db import location_repository, vibe_aggregates
+from services.clients import get_generation_model, EMBEDDING_MODEL
+from services.pipeline_stats import pipeline_stats, StageRun
+from services.review_dedup import map_stage_lines
+from services.snapshot_cache import snapshot_cache
+from services.vibe_tagger import (
+    VibeTagger, load_tagger, summary_prompt, map_reduce_calls, vibe_tagging, analysis_llm_calls_avoided,
+    SUMMARY_REVIEWS, TAGGER_MIN_REVIEWS
+)
+from .population import mark_population_stage_for_locations
+from .pinecone_indexer import index_locations, indexable_reviews, embed_documents, embed_calls
 
 REVIEWS_PER_BATCH = 30 
 
-async def get_ai_response_as_json(prompt: str) -> dict:
+async def get_ai_response_as_json(prompt: str, run: Optional[StageRun] = None) -> dict:
 
     try:
-        response = await generation_model.generate_content_async(prompt)
+        response = await get_generation_model().generate_content_async(prompt)
         json_text = response.text.strip().replace("```json", "").replace("```", "")
-        return json.loads(json_text)
+        result = json.loads(json_text)
+        if run:
+            run.call("llm")
+        return result
     except (json.JSONDecodeError, ValueError) as e:
         print(f"      - Warning: Could not parse LLM response as JSON. Error: {e}")
+        if run:
+            run.failure("llm")
         return None
     except Exception as e:
         print(f"      - An unexpected error occurred calling the LLM: {e}")
+        if run:
+            run.failure("llm")
         return None
 
-async def analyze_locations(location_ids: List, background_tasks: BackgroundTasks):
-
-    print(f"BACKGROUND TASK (2/3): Starting AI analysis for {len(location_ids)} locations.")
-    mongo_client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_DB_URL)
-    collection = mongo_client.vibe_navigator.locations
+async def _map_reduce_analysis(location: dict, review_lines: List[str], run: StageRun) -> Optional[dict]:
 
-    cursor = collection.find({"_id": {"$in": location_ids}})
-    locations_to_process = await cursor.to_list(length=None)
+    partial_summaries = []
+    print(f"    - Mapping {len(review_lines)} distinct reviews in batches of {REVIEWS_PER_BATCH}...")
     
-    processed_ids_for_next_step = []
+    for i in range(0, len(review_lines), REVIEWS_PER_BATCH):
+        review_texts = "\n".join(review_lines[i:i+REVIEWS_PER_BATCH])
 
-    for location in locations_to_process:
-        print(f"\n  > Analyzing '{location['name']}' with {len(location['raw_reviews'])} reviews...")
-        all_reviews = location['raw_reviews']
-        
-        partial_summaries = []
-        print(f"    - Mapping reviews in batches of {REVIEWS_PER_BATCH}...")
-        
-        for i in range(0, len(all_reviews), REVIEWS_PER_BATCH):
-            batch_reviews = all_reviews[i:i+REVIEWS_PER_BATCH]
-            review_texts = "\n".join([f"- {r['text']}" for r in batch_reviews if r.get('text')])
-
-            if not review_texts:
-                continue
-
-            map_prompt = f"""
-                        Analyze the following batch of reviews for "{location['name']}".
-                        Identify key themes, vibes, and standout points (e.g., "fast service", "great coffee", "noisy", "aesthetic decor").
-                        Do not write a long summary. List the key points as a concise bulleted list.
-
-                        Reviews:
-                        {review_texts}
-
-                        Key points from this batch:
-                        """
-            try:
-                response = await generation_model.generate_content_async(map_prompt)
-                partial_summaries.append(response.text)
-                print(f"      - Processed batch {i//REVIEWS_PER_BATCH + 1}...")
-            except Exception as e:
-                print(f"      - Error processing a review batch for '{location['name']}': {e}")
-                continue
-        
-        if not partial_summaries:
-            print(f"     Could not generate any partial summaries for '{location['name']}'. Skipping analysis for this location.")
+        if not review_texts:
             continue
 
-        print("    - Reducing partial summaries into a final Vibe Card...")
-        combined_points = "\n".join(partial_summaries)
+        map_prompt = f"""
+                    Analyze the following batch of reviews for "{location['name']}".
+                    Identify key themes, vibes, and standout points (e.g., "fast service", "great coffee", "noisy", "aesthetic decor").
+                    Do not write a long summary. List the key points as a concise bulleted list.
+
+                    Reviews:
+                    {review_texts}
+
+                    Key points from this batch:
+                    """
+        try:
+            with run.batch("map", batch=i//REVIEWS_PER_BATCH + 1, reviews=len(review_lines[i:i+REVIEWS_PER_BATCH])):
+                response = await get_generation_model().generate_content_async(map_prompt)
+            run.call("llm")
+            partial_summaries.append(response.text)
+            print(f"      - Processed batch {i//REVIEWS_PER_BATCH + 1}...")
+        except Exception as e:
+            run.failure("llm")
+            print(f"      - Error processing a review batch for '{location['name']}': {e}")
+            continue
+    
+    if not partial_summaries:
+        print(f"     Could not generate any partial summaries for '{location['name']}'. Skipping analysis for this location.")
+        return None
 
-        reduce_prompt = f"""
-                            You are a witty and insightful city guide. You have been given a list of key points summarized from different batches of reviews for a location.
-                            Your task is to synthesize these points into a final, polished Vibe Card analysis.
+    print("    - Reducing partial summaries into a final Vibe Card...")
+    combined_points = "\n".join(partial_summaries)
 
-                            Location Name: "{location['name']}"
+    reduce_prompt = f"""
+                        You are a witty and insightful city guide. You have been given a list of key points summarized from different batches of reviews for a location.
+                        Your task is to synthesize these points into a final, polished Vibe Card analysis.
 
-                            Summarized Key Points from all reviews:
-                            {combined_points}
+                        Location Name: "{location['name']}"
 
-                            Based ONLY on the key points provided, perform the following tasks and respond with ONLY a valid JSON object:
-                            1.  **vibe_summary:** Write a final, playful, 1-2 sentence summary of the location's overall vibe.
-                            2.  **vibe_tags:** Generate a final list of the 4-5 most important, one-word, lowercase tags.
-                            3.  **emojis:** Choose 3 emojis that best represent the final vibe as a single string.
+                        Summarized Key Points from all reviews:
+                        {combined_points}
 
-                            Your output MUST be a single JSON object. Example:
-                            {{
-                            "vibe_summary": "A bustling paradise for book lovers with mountains of books, though it can get a bit crowded. The smell of old paper is a treat!",
-                            "vibe_tags": ["cozy", "crowded", "books", "treasure-hunt"],
-                            "emojis": "📚❤️ bustling"
-                            }}
-                            """
-        final_analysis = await get_ai_response_as_json(reduce_prompt)
+                        Based ONLY on the key points provided, perform the following tasks and respond with ONLY a valid JSON object:
+                        1.  **vibe_summary:** Write a final, playful, 1-2 sentence summary of the location's overall vibe.
+                        2.  **vibe_tags:** Generate a final list of the 4-5 most important, one-word, lowercase tags.
+                        3.  **emojis:** Choose 3 emojis that best represent the final vibe as a single string.
 
+                        Your output MUST be a single JSON object. Example:
+                        {{
+                        "vibe_summary": "A bustling paradise for book lovers with mountains of books, though it can get a bit crowded. The smell of old paper is a treat!",
+                        "vibe_tags": ["cozy", "crowded", "books", "treasure-hunt"],
+                        "emojis": "📚❤️ bustling"
+                        }}
+                        """
+    with run.batch("reduce", partials=len(partial_summaries)):
+        final_analysis = await get_ai_response_as_json(reduce_prompt, run)
+    if final_analysis:
+        final_analysis["tag_source"] = "llm"
+    return final_analysis
+
+async def _local_analysis(location: dict, tagger: VibeTagger, precomputed_vectors: Dict[str, List[float]],
+                          run: StageRun) -> Optional[dict]:
+    # Tags from review embeddings; the LLM only writes the summary. Returns
+    # None when the tagger isn't confident, so the caller falls back to map/reduce.
+    reviews = indexable_reviews(location)
+    if len(reviews) < TAGGER_MIN_REVIEWS:
+        return None
+    try:
+        with run.batch("embed", reviews=len(reviews)):
+            vectors = await asyncio.to_thread(embed_documents, [text for _, text in reviews])
+        run.call("embed", embed_calls(len(reviews)))
+    except Exception as e:
+        run.failure("embed")
+        print(f"      - Could not embed reviews for local tagging: {e}")
+        return None
+    precomputed_vectors.update((vector_id, values) for (vector_id, _), values in zip(reviews, vectors))
+
+    result = tagger.tag(np.array(vectors))
+    if not result.confident:
+        print(f"    - Local tags {result.tags} not confident (separation {result.separation:.3f}). Using map/reduce.")
+        return None
+
+    print(f"    - Tagged locally as {result.tags}. Asking the LLM for the summary only...")
+    central = tagger.central_reviews(np.array(vectors), SUMMARY_REVIEWS)
+    with run.batch("summary", tags=",".join(result.tags)):
+        analysis = await get_ai_response_as_json(summary_prompt(location['name'], result.tags, [reviews[i][1] for i in central]), run)
+    if not analysis:
+        return None
+    analysis["vibe_tags"] = result.tags
+    analysis["tag_source"] = "local"
+    return analysis
+
+async def analyze_locations(location_ids: List, background_tasks: BackgroundTasks,
+                            new_reviews_from: Optional[Dict[str, int]] = None):
+
+    print(f"BACKGROUND TASK (2/3): Starting AI analysis for {len(location_ids)} locations.")
+    # Refreshed locations (new_reviews_from given) aren't part of a population job.
+    refresh = new_reviews_from is not None
+    locations_to_process = await location_repository.find_for_analysis(location_ids)
+    
+    processed_ids_for_next_step = []
+    precomputed_vectors: Dict[str, List[float]] = {}
+    llm_calls_avoided = 0
+    tagger = await load_tagger(EMBEDDING_MODEL)
+
+    for location in locations_to_process:
+        print(f"\n  > Analyzing '{location['name']}' with {len(location['raw_reviews'])} reviews...")
+        review_lines = map_stage_lines(location['raw_reviews'])
+        pipeline_stats.observe_queue_wait("wait_analyze", location, "new", "analyzed")
+        run = pipeline_stats.start("analyze", [location["_id"]], location=location["name"], reviews=len(review_lines))
+
+        final_analysis = None
+        if tagger is not None:
+            final_analysis = await _local_analysis(location, tagger, precomputed_vectors, run)
         if final_analysis:
-            await collection.update_one(
-                {"_id": location["_id"]},
-                {"$set": {"ai_analysis": final_analysis, "processing_status": "analyzed"}}
-            )
+            avoided = map_reduce_calls(len(review_lines), REVIEWS_PER_BATCH) - 1
+            llm_calls_avoided += avoided
+            analysis_llm_calls_avoided.inc(avoided)
+        else:
+            final_analysis = await _map_reduce_analysis(location, review_lines, run)
+        await pipeline_stats.finish(run, ok=bool(final_analysis), error=None if final_analysis else "no analysis")
+        if final_analysis:
+            vibe_tagging.inc(source=final_analysis["tag_source"])
+            previous_tags = await location_repository.set_analysis(location["_id"], final_analysis)
+            await vibe_aggregates.apply_analysis_change(location, previous_tags, final_analysis.get("vibe_tags"))
+            if new_reviews_from and set(previous_tags) != set(final_analysis.get("vibe_tags") or []):
+                # Older vectors carry the old tags in their metadata: re-index all of them.
+                new_reviews_from.pop(str(location["_id"]), None)
+            snapshot_cache.invalidate(location["city"], location["category"])
             processed_ids_for_next_step.append(location["_id"])
             print(f"     Analysis complete for '{location['name']}'. Status set to 'analyzed'.")
+        elif refresh and (location.get("ai_analysis") or {}).get("vibe_tags"):
+            # Still index the appended reviews, under the tags the location
+            # already has until a later analysis succeeds.
+            processed_ids_for_next_step.append(location["_id"])
+            print(f"     Failed to re-analyze '{location['name']}'. Indexing its new reviews with the current tags.")
         else:
             print(f"     Failed to generate final analysis for '{location['name']}'.")
     
     if processed_ids_for_next_step:
-        print(f"\nAI analysis stage complete. Triggering Pinecone indexing for {len(processed_ids_for_next_step)} successfully analyzed locations.")
-        background_tasks.add_task(index_locations, processed_ids_for_next_step)
+        print(f"\nAI analysis stage complete ({llm_calls_avoided} map/reduce calls avoided by local tagging). Triggering Pinecone indexing for {len(processed_ids_for_next_step)} locations.")
+        if not refresh:
+            await mark_population_stage_for_locations(locations_to_process, "indexing")
+        background_tasks.add_task(index_locations, processed_ids_for_next_step, precomputed_vectors, new_reviews_from)
     else:
         print("\nAI analysis stage complete. No locations were successfully analyzed to pass to the next stage.")
-    
-    mongo_client.close()
\ No newline at end of file
+        if not refresh:
+            await mark_population_stage_for_locations(locations_to_process, "failed")
\ No newline at end of file
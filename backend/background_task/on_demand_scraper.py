@@ -1,15 +1,36 @@
+import asyncio
+import os
 import time
 import re
+from datetime import datetime, timedelta, timezone
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from fastapi import BackgroundTasks
-from typing import List
+from typing import Dict, List, Optional, Set, Tuple
 
-from db.mongo import get_location_collection
+from db import location_repository, vibe_aggregates
+from db.mongo import to_geo_point
+from scraper.place_ids import canonical_place_id
+from services.pipeline_stats import pipeline_stats
+from services.review_dedup import mark_duplicates, find_duplicates
+from services.snapshot_cache import snapshot_cache
+from .population import mark_population_stage
 from .ai_analyzer import analyze_locations
+from .pinecone_indexer import index_locations
+
+MAX_REVIEWS_PER_PLACE = 15
+PLACES_PER_SEARCH = 2
+# Places scraped this recently (by any search) aren't opened again; they are
+# only tagged with the new category.
+SCRAPE_FRESH_HOURS = int(os.getenv("SCRAPE_FRESH_HOURS", "24"))
+REFRESH_MAX_NEW_REVIEWS = int(os.getenv("REFRESH_MAX_NEW_REVIEWS", "50"))
+REFRESH_MAX_SCROLLS = 10
+# A refresh re-runs the analysis only when the new reviews are at least this
+# share of the location's reviews; otherwise they are just embedded and indexed.
+REANALYZE_NEW_REVIEW_FRACTION = float(os.getenv("REANALYZE_NEW_REVIEW_FRACTION", "0.2"))
 
 def get_scraper_driver():
     options = webdriver.ChromeOptions()
@@ -29,6 +50,231 @@ def get_scraper_driver():
     driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
     return driver
 
+def _open_reviews_tab(driver, newest_first: bool = False):
+    reviews_button_xpath = "//button[contains(@aria-label, 'Reviews for') or .//span[text()='Reviews']]"
+    review_button = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH, reviews_button_xpath)))
+    driver.execute_script("arguments[0].click();", review_button)
+    time.sleep(2)
+    if newest_first:
+        try:
+            sort_button = WebDriverWait(driver, 5).until(EC.element_to_be_clickable(
+                (By.XPATH, "//button[@aria-label='Sort reviews' or @data-value='Sort']")))
+            sort_button.click()
+            newest = WebDriverWait(driver, 5).until(EC.element_to_be_clickable(
+                (By.XPATH, "//div[@role='menuitemradio'][.//div[text()='Newest']]")))
+            newest.click()
+            time.sleep(2)
+        except Exception as e:
+            # Still correct without it, just scrolls further before hitting known reviews.
+            print(f"      - Could not sort reviews by newest: {e}")
+    scrollable_div_xpath = "//div[contains(@class, 'm6QErb') and @role='main']"
+    return WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH, scrollable_div_xpath)))
+
+def _scrape_reviews(driver, known_review_ids: Set[str], max_reviews: int,
+                    newest_first: bool = False, max_scrolls: int = 5) -> Tuple[List[dict], List[str]]:
+    # Returns the reviews whose data-review-id isn't in known_review_ids, and
+    # every review id the page showed. With newest_first, scrolling stops as
+    # soon as a known review comes into view: everything below it is older.
+    reviews_data: List[dict] = []
+    review_ids: List[str] = []
+    try:
+        scrollable_div = _open_reviews_tab(driver, newest_first)
+        for scroll in range(max_scrolls + 1):
+            elements = {}
+            for el in driver.find_elements(By.XPATH, "//div[@data-review-id]"):
+                # Nested elements repeat the id; the outer review card comes first.
+                elements.setdefault(el.get_attribute("data-review-id"), el)
+            reached_known = newest_first and any(review_id in known_review_ids for review_id in elements)
+            if reached_known or len(elements) >= max_reviews or scroll == max_scrolls:
+                break
+            driver.execute_script("arguments[0].scrollTop = arguments[0].scrollHeight;", scrollable_div)
+            time.sleep(1.5)
+
+        for review_id, el in list(elements.items())[:max_reviews]:
+            if not review_id:
+                continue
+            review_ids.append(review_id)
+            if review_id in known_review_ids:
+                if newest_first:
+                    break
+                continue
+            try:
+                author = el.find_element(By.CSS_SELECTOR, ".d4r55").text.strip()
+                review_text = el.find_element(By.CSS_SELECTOR, ".wiI7pd").text.strip()
+                if review_text:
+                    reviews_data.append({"text": review_text, "source": "Google Maps", "author": author, "review_id": review_id})
+            except Exception: continue
+    except Exception:
+        pass
+    return reviews_data, review_ids
+
+def _search_places(driver, query: str) -> List[Tuple[Optional[str], str]]:
+    # (canonical place id, url) of the top PLACES_PER_SEARCH distinct places.
+    search_url = f"https://www.google.com/maps/search/{query.replace(' ', '+')}?hl=en"
+    driver.get(search_url)
+
+    try:
+        cookie_button_xpath = "//form[contains(@action, 'consent')]//button"
+        cookie_buttons = WebDriverWait(driver, 5).until(EC.presence_of_all_elements_located((By.XPATH, cookie_button_xpath)))
+        reject_button = next((b for b in cookie_buttons if "Reject" in b.text), None)
+        if reject_button: reject_button.click()
+        else: cookie_buttons[0].click()
+    except Exception:
+        pass
+
+    result_panel_xpath = "//div[contains(@aria-label, 'Results for')]"
+    WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH, result_panel_xpath)))
+    result_links = driver.find_elements(By.XPATH, f"{result_panel_xpath}//a[contains(@href, 'google.com/maps/place/')]")
+    places = {}
+    for url in [link.get_attribute('href') for link in result_links if link.get_attribute('href')]:
+        place_id = canonical_place_id(url)
+        places.setdefault(place_id or url, (place_id, url))
+    print(f"  > Found {len(places)} potential new locations.")
+    return list(places.values())[:PLACES_PER_SEARCH]
+
+def _scrape_places(driver, places: List[Tuple[Optional[str], str]], city: str, category: str) -> List[dict]:
+    # Selenium is blocking, so this runs in a worker thread and only hands
+    # back plain location documents.
+    location_docs: List[dict] = []
+
+    for place_id, url in places:
+        try:
+            driver.get(url)
+            name = WebDriverWait(driver, 10).until(EC.visibility_of_element_located((By.XPATH, "//h1"))).text
+            print(f"\n    >> Processing URL for: {name}")
+            
+            reviews_data, seen_review_ids = _scrape_reviews(driver, known_review_ids=set(), max_reviews=MAX_REVIEWS_PER_PLACE)
+
+            if not reviews_data:
+                print(f"    >> SKIPPING {name} due to zero reviews found.")
+                continue
+
+            print(f"    >> Successfully scraped {len(reviews_data)} reviews for {name}. Preparing to save.")
+          
+            try:
+                address_xpath = "//button[@data-item-id='address']//div[contains(@class, 'fontBodyMedium')]"
+                address_element = WebDriverWait(driver, 5).until(EC.visibility_of_element_located((By.XPATH, address_xpath)))
+                address = address_element.text.strip()
+                print("      - Found address using simplified selector.")
+            except Exception as e:
+                print(f"      - Failed to fetch address. Saving as 'N/A'. Error: {e}")
+                address = "N/A"
+
+            lat, lon = 0.0, 0.0
+            match = re.search(r'!3d(-?\d+\.\d+)!4d(-?\d+\.\d+)', driver.current_url)
+            if match: lat, lon = float(match.group(1)), float(match.group(2))
+
+
+            location_doc = {
+                "name": name, "city": city.lower(), "category": category.lower(),
+                "categories": [category.lower()],
+                "address": address, "coordinates": {"lat": lat, "lon": lon},
+                "raw_reviews": reviews_data,
+                "seen_review_ids": seen_review_ids,
+                "source_url": url,
+                "processing_status": "new" 
+            }
+            if place_id:
+                location_doc["place_id"] = place_id
+            geo_point = to_geo_point(location_doc["coordinates"])
+            if geo_point:
+                location_doc["geo"] = geo_point
+            location_docs.append(location_doc)
+
+        except Exception as e:
+            print(f"     An error occurred processing a single URL. Error: {e}")
+            continue
+
+    return location_docs
+
+def _open_place(driver, location: dict):
+    url = location.get("source_url")
+    if not url:
+        # Scraped before source URLs were stored: search for the place itself.
+        query = f"{location['name']} {location.get('city', '')}".strip()
+        url = f"https://www.google.com/maps/search/{query.replace(' ', '+')}?hl=en"
+    driver.get(url)
+    try:
+        WebDriverWait(driver, 10).until(EC.visibility_of_element_located((By.XPATH, "//h1")))
+    except Exception:
+        first_result = driver.find_element(By.XPATH, "//a[contains(@href, 'google.com/maps/place/')]")
+        driver.get(first_result.get_attribute("href"))
+        WebDriverWait(driver, 10).until(EC.visibility_of_element_located((By.XPATH, "//h1")))
+
+def refresh_places(locations: List[dict]) -> List[Optional[Tuple[List[dict], List[str]]]]:
+    # Newest reviews of each location down to the first one already seen.
+    # One browser for the whole batch; None where a place couldn't be opened.
+    driver = get_scraper_driver()
+    results = []
+    try:
+        for location in locations:
+            try:
+                _open_place(driver, location)
+                print(f"\n    >> Refreshing reviews for: {location['name']}")
+                results.append(_scrape_reviews(
+                    driver, set(location.get("seen_review_ids") or []), REFRESH_MAX_NEW_REVIEWS,
+                    newest_first=True, max_scrolls=REFRESH_MAX_SCROLLS
+                ))
+            except Exception as e:
+                print(f"     Could not refresh '{location['name']}'. Error: {e}")
+                results.append(None)
+    finally:
+        driver.quit()
+    return results
+
+async def merge_new_reviews(location: dict, reviews: List[dict], page_review_ids: List[str]) -> Optional[Tuple[int, int]]:
+    # Appends the reviews not stored yet (by data-review-id, or by text for
+    # reviews scraped before ids were kept). Returns (index of the first
+    # appended review, count appended), or None if nothing was appended.
+    existing = location.get("raw_reviews") or []
+    known_ids = set(location.get("seen_review_ids") or [])
+    known_texts = {(review.get("text") or "").strip() for review in existing}
+    new_reviews = []
+    for review in reviews:
+        text = review["text"].strip()
+        if review.get("review_id") in known_ids or text in known_texts:
+            continue
+        known_texts.add(text)
+        new_reviews.append(review)
+
+    start = len(existing)
+    if new_reviews:
+        # Near-duplicates are marked against every stored review too; the
+        # stored reviews' own marks don't change.
+        representatives = find_duplicates([review.get("text") or "" for review in existing + new_reviews])
+        for offset, review in enumerate(new_reviews):
+            representative = representatives[start + offset]
+            if representative is None:
+                review.pop("duplicate_of", None)
+            else:
+                review["duplicate_of"] = representative
+
+    if not await location_repository.append_reviews(location["_id"], new_reviews, page_review_ids, start):
+        print(f"     > '{location['name']}' changed while refreshing; dropping {len(new_reviews)} scraped reviews.")
+        return None
+    if not new_reviews:
+        return None
+    print(f"     > Appended {len(new_reviews)} new reviews to '{location['name']}'.")
+    return start, len(new_reviews)
+
+def plan_new_reviews(location: dict, start: int, added: int, to_analyze: Dict, to_index: Dict):
+    has_tags = bool((location.get("ai_analysis") or {}).get("vibe_tags"))
+    if not has_tags or added / (start + added) >= REANALYZE_NEW_REVIEW_FRACTION:
+        to_analyze[location["_id"]] = start
+    else:
+        to_index[location["_id"]] = start
+
+def queue_new_reviews(to_analyze: Dict, to_index: Dict, background_tasks: BackgroundTasks):
+    # Only the appended reviews are embedded; older vector ids stay valid.
+    if to_analyze:
+        print(f"  > Re-analyzing {len(to_analyze)} refreshed locations.")
+        background_tasks.add_task(analyze_locations, list(to_analyze), background_tasks,
+                                  {str(location_id): start for location_id, start in to_analyze.items()})
+    if to_index:
+        print(f"  > Indexing new reviews of {len(to_index)} refreshed locations.")
+        background_tasks.add_task(index_locations, list(to_index), None,
+                                  {str(location_id): start for location_id, start in to_index.items()})
+
 async def scrape_and_populate_db(
     query: str, 
     city: str, 
@@ -37,103 +283,66 @@ async def scrape_and_populate_db(
 ):
     
     print(f"BACKGROUND TASK (1/3): Starting on-demand scrape for '{query}'...")
-    driver = get_scraper_driver()
-    
-    new_location_ids: List = []
+    await mark_population_stage(city, category, "scraping")
+    run = pipeline_stats.start("scrape", query=query, city=city, category=category)
 
     try:
-        search_url = f"https://www.google.com/maps/search/{query.replace(' ', '+')}?hl=en"
-        driver.get(search_url)
-
-        try:
-            cookie_button_xpath = "//form[contains(@action, 'consent')]//button"
-            cookie_buttons = WebDriverWait(driver, 5).until(EC.presence_of_all_elements_located((By.XPATH, cookie_button_xpath)))
-            reject_button = next((b for b in cookie_buttons if "Reject" in b.text), None)
-            if reject_button: reject_button.click()
-            else: cookie_buttons[0].click()
-        except Exception:
-            pass
-
-        result_panel_xpath = "//div[contains(@aria-label, 'Results for')]"
-        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH, result_panel_xpath)))
-        result_links = driver.find_elements(By.XPATH, f"{result_panel_xpath}//a[contains(@href, 'google.com/maps/place/')]")
-        unique_urls = list(dict.fromkeys([link.get_attribute('href') for link in result_links if link.get_attribute('href')]))
-        print(f"  > Found {len(unique_urls)} potential new locations.")
-
-        for url in unique_urls[:2]: 
+        with run.batch("browser"):
+            driver = await asyncio.to_thread(get_scraper_driver)
             try:
-                driver.get(url)
-                name = WebDriverWait(driver, 10).until(EC.visibility_of_element_located((By.XPATH, "//h1"))).text
-                print(f"\n    >> Processing URL for: {name}")
-                
-                reviews_data = []
-                try:
-                    reviews_button_xpath = "//button[contains(@aria-label, 'Reviews for') or .//span[text()='Reviews']]"
-                    review_button = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH, reviews_button_xpath)))
-                    driver.execute_script("arguments[0].click();", review_button)
-                    time.sleep(2)
-                    scrollable_div_xpath = "//div[contains(@class, 'm6QErb') and @role='main']"
-                    scrollable_div = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH, scrollable_div_xpath)))
-                    for _ in range(5):
-                        driver.execute_script("arguments[0].scrollTop = arguments[0].scrollHeight;", scrollable_div)
-                        time.sleep(1.5)
-                    review_elements = driver.find_elements(By.XPATH, "//div[@data-review-id]")
-                    for el in review_elements[:15]:
-                        try:
-                            author = el.find_element(By.CSS_SELECTOR, ".d4r55").text.strip()
-                            review_text = el.find_element(By.CSS_SELECTOR, ".wiI7pd").text.strip()
-                            if review_text: reviews_data.append({"text": review_text, "source": "Google Maps", "author": author})
-                        except Exception: continue
-                except Exception:
-                    pass
-
-                if not reviews_data:
-                    print(f"    >> SKIPPING {name} due to zero reviews found.")
-                    continue
-
-                print(f"    >> Successfully scraped {len(reviews_data)} reviews for {name}. Preparing to save.")
-              
-                try:
-                    address_xpath = "//button[@data-item-id='address']//div[contains(@class, 'fontBodyMedium')]"
-                    address_element = WebDriverWait(driver, 5).until(EC.visibility_of_element_located((By.XPATH, address_xpath)))
-                    address = address_element.text.strip()
-                    print("      - Found address using simplified selector.")
-                except Exception as e:
-                    print(f"      - Failed to fetch address. Saving as 'N/A'. Error: {e}")
-                    address = "N/A"
-
-                lat, lon = 0.0, 0.0
-                match = re.search(r'!3d(-?\d+\.\d+)!4d(-?\d+\.\d+)', driver.current_url)
-                if match: lat, lon = float(match.group(1)), float(match.group(2))
-
-
-                location_doc = {
-                    "name": name, "city": city.lower(), "category": category.lower(),
-                    "address": address, "coordinates": {"lat": lat, "lon": lon},
-                    "raw_reviews": reviews_data,
-                    "processing_status": "new" 
-                }
-                
-                location_collection = await get_location_collection()
-                
-                db_result = await location_collection.update_one(
-                    {'name': name, 'city': city.lower()}, 
-                    {'$set': location_doc}, 
-                    upsert=True
-                )
-                
-                if db_result.upserted_id:
-                    new_location_ids.append(db_result.upserted_id)
-
-                print(f"     > Upserted '{name}' into the database.")
+                places = await asyncio.to_thread(_search_places, driver, query)
+                fresh = await location_repository.find_fresh_place_ids(
+                    [place_id for place_id, _ in places if place_id],
+                    datetime.now(timezone.utc) - timedelta(hours=SCRAPE_FRESH_HOURS))
+                if fresh:
+                    for location in await location_repository.add_category(list(fresh), category):
+                        await vibe_aggregates.apply_category_added(location, category)
+                    print(f"  > Skipping {len(fresh)} places scraped in the last {SCRAPE_FRESH_HOURS}h; tagged them '{category.lower()}'.")
+                location_docs = await asyncio.to_thread(
+                    _scrape_places, driver, [place for place in places if place[0] not in fresh], city, category)
+            finally:
+                await asyncio.to_thread(driver.quit)
+        run.call("places", len(location_docs))
+    except Exception as e:
+        print(f"\nScrape task failed for '{query}': {e}")
+        run.failure("browser")
+        await pipeline_stats.finish(run, ok=False, error=str(e))
+        await mark_population_stage(city, category, "failed", error=str(e))
+        return
+
+    new_location_ids: List = []
+    to_analyze: Dict = {}
+    to_index: Dict = {}
+
+    for location_doc in location_docs:
+        existing = await location_repository.find_scraped_for_refresh(location_doc)
+        if existing:
+            await location_repository.upsert_scraped(location_doc, existing["_id"])
+            await vibe_aggregates.apply_category_added(existing, category)
+            appended = await merge_new_reviews(existing, location_doc["raw_reviews"], location_doc["seen_review_ids"])
+            if appended:
+                plan_new_reviews(existing, *appended, to_analyze, to_index)
+            continue
+
+        duplicates = mark_duplicates(location_doc["raw_reviews"])
+        if duplicates:
+            print(f"     > Marked {duplicates} near-duplicate reviews for '{location_doc['name']}'.")
+        upserted_id = await location_repository.upsert_scraped(location_doc)
+        if upserted_id:
+            new_location_ids.append(upserted_id)
+
+        print(f"     > Upserted '{location_doc['name']}' into the database.")
+    queue_new_reviews(to_analyze, to_index, background_tasks)
+
+    snapshot_cache.invalidate(city, category)
+    # Only new locations get the scrape stage on their timeline.
+    run.location_ids = new_location_ids
+    await pipeline_stats.finish(run)
 
-            except Exception as e:
-                print(f"     An error occurred processing a single URL. Error: {e}")
-                continue
-    finally:
-        driver.quit()
     if new_location_ids:
         print(f"\nScrape task complete. Triggering AI analysis for {len(new_location_ids)} new locations.")
+        await mark_population_stage(city, category, "analyzing", scraped=len(location_docs), new_locations=len(new_location_ids))
         background_tasks.add_task(analyze_locations, new_location_ids, background_tasks)
     else:
-        print("\nScrape task complete. No new locations were added to the database.")
\ No newline at end of file
+        print("\nScrape task complete. No new locations were added to the database.")
+        await mark_population_stage(city, category, "done", scraped=len(location_docs), new_locations=0)
@@ -1,95 +1,148 @@
-import os
 import asyncio
-import motor.motor_asyncio
-from dotenv import load_dotenv
+import math
 import google.generativeai as genai
-from pinecone import Pinecone
-from typing import List
-
-load_dotenv(dotenv_path='../.env')
-
-MONGO_DB_URL = os.getenv("MONGO_DB_URL")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY") 
-PINECONE_INDEX_NAME = "vibe-navigator"
-
-if not all([MONGO_DB_URL, GEMINI_API_KEY, PINECONE_API_KEY, PINECONE_INDEX_NAME]):
-    raise ValueError("One or more environment variables (Mongo, Gemini, Pinecone) are missing.")
-
-genai.configure(api_key=GEMINI_API_KEY)
-pc = Pinecone(api_key=PINECONE_API_KEY)
-pinecone_index = pc.Index(PINECONE_INDEX_NAME)
-
-EMBEDDING_MODEL = "models/embedding-001"
-
-async def index_locations(location_ids: List):
+from typing import Dict, List, Optional, Tuple
+
+from db import location_repository
+from services.clients import configure_genai, get_pinecone_index, EMBEDDING_MODEL
+from services.lexical_index import lexical_index
+from services.pipeline_stats import pipeline_stats
+from services.reply_cache import reply_cache
+from services.review_dedup import is_representative
+from services.snapshot_cache import snapshot_cache
+from .population import mark_population_stage_for_locations
+
+EMBED_BATCH_SIZE = 100
+
+def indexable_reviews(location: dict, start: int = 0) -> List[Tuple[str, str]]:
+    # (vector_id, text) for every review from index `start` on that gets a vector.
+    location_id_str = str(location['_id'])
+    reviews = []
+    for review_index, review in enumerate(location.get("raw_reviews", [])):
+        if review_index < start:
+            continue
+        review_text = review.get("text")
+        if not review_text or len(review_text.split()) < 5:
+            continue
+        if not is_representative(review):
+            continue
+        reviews.append((f"{location_id_str}#{review_index}", review_text))
+    return reviews
+
+def vector_metadata(location: dict) -> dict:
+    return {
+        "location_id": str(location['_id']),
+        "location_name": location.get("name", "Unknown Location"),
+        "city": location.get("city", "unknown").lower(),
+        "category": location.get("category", "misc").lower(),
+        "tags": (location.get("ai_analysis") or {}).get("vibe_tags", [])
+    }
+
+def embed_documents(texts: List[str]) -> List[List[float]]:
+    configure_genai()
+    embeddings = []
+    for i in range(0, len(texts), EMBED_BATCH_SIZE):
+        response = genai.embed_content(
+            model=EMBEDDING_MODEL,
+            content=texts[i:i+EMBED_BATCH_SIZE],
+            task_type="RETRIEVAL_DOCUMENT"
+        )
+        embeddings.extend(response['embedding'])
+    return embeddings
+
+def embed_calls(text_count: int) -> int:
+    return math.ceil(text_count / EMBED_BATCH_SIZE)
+
+async def index_locations(location_ids: List, precomputed_vectors: Optional[Dict[str, List[float]]] = None,
+                          new_reviews_from: Optional[Dict[str, int]] = None):
+    # new_reviews_from: location id -> index of its first appended review, for
+    # refreshed locations whose older reviews are already in Pinecone.
 
     print(f"BACKGROUND TASK (3/3): Starting Pinecone indexing for {len(location_ids)} locations.")
-    mongo_client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_DB_URL)
-    collection = mongo_client.vibe_navigator.locations
-
-    cursor = collection.find({"_id": {"$in": location_ids}})
-    locations_to_process = await cursor.to_list(length=None)
+    locations_to_process = await location_repository.find_for_indexing(location_ids)
+    precomputed_vectors = precomputed_vectors or {}
+    # Refreshes aren't part of a population job, even when every location
+    # ended up fully re-indexed (an empty new_reviews_from).
+    refresh = new_reviews_from is not None
+    new_reviews_from = new_reviews_from or {}
     
     if not locations_to_process:
         print("  - No locations found for the given IDs. Ending indexing task.")
         return
 
+    for location in locations_to_process:
+        pipeline_stats.observe_queue_wait("wait_index", location, "analyzed", "indexed")
+    run = pipeline_stats.start("index", [location["_id"] for location in locations_to_process],
+                               locations=len(locations_to_process))
+
     vectors_to_process = []
     
     for location in locations_to_process:
         location_id_str = str(location['_id'])
-        for review_index, review in enumerate(location.get("raw_reviews", [])):
-            review_text = review.get("text")
-            if not review_text or len(review_text.split()) < 5:
-                continue
-            
-            vector_id = f"{location_id_str}#{review_index}"
-
+        for vector_id, review_text in indexable_reviews(location, new_reviews_from.get(location_id_str, 0)):
             vectors_to_process.append({
                 "id": vector_id,
-                "text": review_text
+                "text": review_text,
+                "metadata": vector_metadata(location)
             })
 
     if not vectors_to_process:
         print("  - No valid reviews found in the provided locations. Ending indexing task.")
+        await pipeline_stats.finish(run)
+        if not refresh:
+            await mark_population_stage_for_locations(locations_to_process, "done")
         return
         
-    print(f"  > Found {len(vectors_to_process)} total reviews to embed and index. Processing in batches...")
+    # The analyzer already embedded the reviews it tagged locally.
+    reused = sum(1 for item in vectors_to_process if item['id'] in precomputed_vectors)
+    print(f"  > Found {len(vectors_to_process)} total reviews to index ({reused} already embedded). Processing in batches...")
+
+    # Runs inside the API process: keep the SDK calls off the event loop.
+    pinecone_index = await asyncio.to_thread(get_pinecone_index)
 
-    batch_size = 100 
+    batch_size = EMBED_BATCH_SIZE
+    failed_batches = 0
     for i in range(0, len(vectors_to_process), batch_size):
         batch = vectors_to_process[i:i+batch_size]
-        texts_to_embed = [item['text'] for item in batch]
         
         try:
-            response = genai.embed_content(
-                model=EMBEDDING_MODEL,
-                content=texts_to_embed,
-                task_type="RETRIEVAL_DOCUMENT"
-            )
-            embeddings = response['embedding']
+            missing = [item for item in batch if item['id'] not in precomputed_vectors]
+            if missing:
+                with run.batch("embed", batch=i//batch_size + 1, reviews=len(missing)):
+                    embeddings = await asyncio.to_thread(embed_documents, [item['text'] for item in missing])
+                run.call("embed", embed_calls(len(missing)))
+                for item, values in zip(missing, embeddings):
+                    precomputed_vectors[item['id']] = values
 
             pinecone_vectors = []
-            for j, item in enumerate(batch):
+            for item in batch:
                 pinecone_vectors.append({
                     "id": item['id'],
-                    "values": embeddings[j],
-                    
+                    "values": precomputed_vectors[item['id']],
+                    "metadata": item['metadata']
                 })
 
-            pinecone_index.upsert(vectors=pinecone_vectors)
+            with run.batch("upsert", batch=i//batch_size + 1, vectors=len(pinecone_vectors)):
+                await asyncio.to_thread(pinecone_index.upsert, vectors=pinecone_vectors)
+            run.call("upsert")
             print(f"    - Upserted batch {i//batch_size + 1} to Pinecone.")
 
         except Exception as e:
+            run.failure("batch")
+            failed_batches += 1
             print(f"    -  An error occurred during batch {i//batch_size + 1} processing: {e}")
             continue
 
-    await collection.update_many(
-        {"_id": {"$in": location_ids}},
-        {"$set": {"processing_status": "indexed"}}
-    )
+    for location in locations_to_process:
+        lexical_index.add_location(location)
+
+    for city in {location.get("city", "unknown").lower() for location in locations_to_process}:
+        reply_cache.invalidate_city(city)
+
+    await location_repository.set_status_many(location_ids, "indexed")
+    await pipeline_stats.finish(run, ok=not failed_batches, error=f"{failed_batches} failed batches" if failed_batches else None)
+    snapshot_cache.invalidate_locations(locations_to_process)
+    if not refresh:
+        await mark_population_stage_for_locations(locations_to_process, "done")
     print(f"   Status for {len(location_ids)} locations updated to 'indexed' in MongoDB.")
-    print(" PIPELINE COMPLETE: New locations are now fully live and searchable.")
-    
-    mongo_client.close()
\ No newline at end of file
+    print(" PIPELINE COMPLETE: New locations are now fully live and searchable.")
\ No newline at end of file
@@ -0,0 +1,117 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from fastapi import BackgroundTasks
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from db import location_repository
+from db.mongo import get_population_jobs_collection
+
+# One population job per (city, category). The job document doubles as a
+# lock shared by every API worker: only the request that manages to flip it
+# to "running" starts the scrape -> analyze -> index pipeline.
+
+POPULATION_LEASE_MINUTES = int(os.getenv("POPULATION_LEASE_MINUTES", "30"))
+# A finished job that still left the slice empty isn't retried before this.
+POPULATION_RETRY_HOURS = int(os.getenv("POPULATION_RETRY_HOURS", "24"))
+# A failed job waits POPULATION_FAILED_RETRY_MINUTES before it can be claimed
+# again, doubling with every consecutive failure up to POPULATION_RETRY_HOURS,
+# so a slice that never scrapes doesn't relaunch Chrome on every cache miss.
+POPULATION_FAILED_RETRY_MINUTES = int(os.getenv("POPULATION_FAILED_RETRY_MINUTES", "5"))
+
+
+def failed_retry_delay(failures: int) -> timedelta:
+    minutes = POPULATION_FAILED_RETRY_MINUTES * 2 ** max(0, failures - 1)
+    return min(timedelta(minutes=minutes), timedelta(hours=POPULATION_RETRY_HOURS))
+
+
+def population_job_id(city: str, category: str) -> str:
+    return f"{city.lower()}|{category.lower()}"
+
+
+async def try_start_population(city: str, category: str, background_tasks: BackgroundTasks) -> bool:
+    jobs = await get_population_jobs_collection()
+    now = datetime.now(timezone.utc)
+    try:
+        await jobs.find_one_and_update(
+            {
+                "_id": population_job_id(city, category),
+                "$or": [
+                    {"status": "failed", "retry_after": {"$lt": now}},
+                    # Jobs that failed before retry_after was kept.
+                    {"status": "failed", "retry_after": {"$exists": False}},
+                    {"status": "running", "lease_until": {"$lt": now}},
+                    {"status": "done", "finished_at": {"$lt": now - timedelta(hours=POPULATION_RETRY_HOURS)}},
+                ]
+            },
+            {
+                "$set": {
+                    "city": city.lower(), "category": category.lower(),
+                    "status": "running", "stage": "queued",
+                    "started_at": now, "updated_at": now,
+                    "lease_until": now + timedelta(minutes=POPULATION_LEASE_MINUTES),
+                },
+                "$unset": {"finished_at": "", "error": ""}
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Another request/worker holds the job (or it finished recently).
+        return False
+
+    # Imported here: the scraper pulls in selenium, which the API only needs
+    # once a population job actually starts.
+    from .on_demand_scraper import scrape_and_populate_db
+
+    print(f"Cache miss for {city}/{category}. Starting on-demand population.")
+    background_tasks.add_task(scrape_and_populate_db, f"{category} in {city}", city, category, background_tasks)
+    return True
+
+
+async def mark_population_stage(city: str, category: str, stage: str, error: Optional[str] = None, **counts):
+    jobs = await get_population_jobs_collection()
+    now = datetime.now(timezone.utc)
+    update = {"stage": stage, "updated_at": now}
+    update.update(counts)
+    if stage in ("done", "failed"):
+        update["status"] = stage
+        update["finished_at"] = now
+    if error:
+        update["error"] = error
+    job_id = population_job_id(city, category)
+    if stage == "failed":
+        # retry_after is set with the status, then pushed back by the failure count.
+        update["retry_after"] = now + failed_retry_delay(1)
+        job = await jobs.find_one_and_update({"_id": job_id}, {"$set": update, "$inc": {"failures": 1}},
+                                             return_document=ReturnDocument.AFTER)
+        if job:
+            await jobs.update_one({"_id": job_id}, {"$set": {"retry_after": now + failed_retry_delay(job["failures"])}})
+        return
+    if stage == "done":
+        await jobs.update_one({"_id": job_id}, {"$set": update, "$unset": {"failures": "", "retry_after": ""}})
+        return
+    await jobs.update_one({"_id": job_id}, {"$set": update})
+
+
+async def mark_population_stage_for_locations(locations: List[dict], stage: str):
+    for city, category in {(loc.get("city", ""), loc.get("category", "")) for loc in locations}:
+        await mark_population_stage(city, category, stage)
+
+
+async def get_population_status(city: str, category: str) -> dict:
+    jobs = await get_population_jobs_collection()
+    job = await jobs.find_one({"_id": population_job_id(city, category)}, {"_id": 0, "lease_until": 0})
+
+    counts = await location_repository.count_by_status(city, category)
+
+    return {
+        "city": city.lower(),
+        "category": category.lower(),
+        "status": job["status"] if job else "idle",
+        "stage": job.get("stage") if job else None,
+        "job": job,
+        "locations": {status: counts.get(status, 0) for status in ("new", "analyzed", "indexed")},
+    }
@@ -0,0 +1,111 @@
+import asyncio
+import math
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from fastapi import BackgroundTasks
+
+from db import location_repository
+from services import place_popularity
+from services.pipeline_stats import pipeline_stats
+from .on_demand_scraper import refresh_places, merge_new_reviews, plan_new_reviews, queue_new_reviews
+
+# Re-scrapes stored locations for reviews posted since the last scrape.
+# Locations are due once REFRESH_MIN_AGE_HOURS old and ranked by
+# staleness x popularity (retrieval hits), so popular places are refreshed
+# more often. A lease on the location keeps API workers from refreshing the
+# same one twice.
+
+REVIEW_REFRESH_ENABLED = os.getenv("REVIEW_REFRESH_ENABLED", "false").lower() in ("1", "true", "yes")
+REFRESH_MIN_AGE_HOURS = float(os.getenv("REFRESH_MIN_AGE_HOURS", "24"))
+REFRESH_INTERVAL_MINUTES = float(os.getenv("REFRESH_INTERVAL_MINUTES", "30"))
+REFRESH_BATCH_SIZE = int(os.getenv("REFRESH_BATCH_SIZE", "5"))
+REFRESH_LEASE_MINUTES = 30
+# Locations without a recorded scrape time count as this old.
+UNKNOWN_AGE_HOURS = 24 * 30
+
+
+def refresh_priority(location: dict, now: datetime) -> float:
+    scraped_at = location.get("last_scraped_at") or ((location.get("pipeline") or {}).get("status_at") or {}).get("new")
+    if scraped_at is None:
+        age_hours = UNKNOWN_AGE_HOURS
+    else:
+        if scraped_at.tzinfo is None:
+            scraped_at = scraped_at.replace(tzinfo=timezone.utc)
+        age_hours = (now - scraped_at).total_seconds() / 3600
+    retrievals = (location.get("popularity") or {}).get("retrievals", 0)
+    return age_hours / REFRESH_MIN_AGE_HOURS * (1 + math.log1p(retrievals))
+
+
+async def pick_due_locations(limit: int) -> List:
+    await place_popularity.flush()
+    now = datetime.now(timezone.utc)
+    candidates = [
+        (refresh_priority(location, now), location["_id"])
+        async for location in location_repository.iter_refresh_candidates(now - timedelta(hours=REFRESH_MIN_AGE_HOURS))
+    ]
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+    return [location_id for _, location_id in candidates[:limit]]
+
+
+async def refresh_locations(location_ids: List, background_tasks: BackgroundTasks) -> Dict[str, int]:
+    claimed = []
+    for location_id in location_ids:
+        if await location_repository.claim_for_refresh(location_id, REFRESH_LEASE_MINUTES):
+            location = await location_repository.find_for_refresh(location_id)
+            if location:
+                claimed.append(location)
+    if not claimed:
+        return {"refreshed": 0, "new_reviews": 0}
+
+    print(f"REVIEW REFRESH: Checking {len(claimed)} locations for new reviews.")
+    run = pipeline_stats.start("scrape", locations=len(claimed), refresh=True)
+    try:
+        with run.batch("browser"):
+            results = await asyncio.to_thread(refresh_places, claimed)
+    except Exception as e:
+        print(f"Review refresh failed: {e}")
+        run.failure("browser")
+        await pipeline_stats.finish(run, ok=False, error=str(e))
+        return {"refreshed": 0, "new_reviews": 0}
+
+    to_analyze: Dict = {}
+    to_index: Dict = {}
+    new_reviews = 0
+    for location, result in zip(claimed, results):
+        if result is None:
+            run.failure("places")
+            continue
+        run.call("places")
+        reviews, page_review_ids = result
+        appended = await merge_new_reviews(location, reviews, page_review_ids)
+        if appended:
+            new_reviews += appended[1]
+            plan_new_reviews(location, *appended, to_analyze, to_index)
+    run.location_ids = list(to_analyze) + list(to_index)
+    await pipeline_stats.finish(run)
+
+    queue_new_reviews(to_analyze, to_index, background_tasks)
+    print(f"REVIEW REFRESH: {new_reviews} new reviews on {len(to_analyze) + len(to_index)} locations "
+          f"({len(to_analyze)} re-analyzed, {len(to_index)} indexed only).")
+    return {"refreshed": len(claimed), "new_reviews": new_reviews}
+
+
+async def run_refresh_cycle(limit: int = REFRESH_BATCH_SIZE) -> Dict[str, int]:
+    # Outside a request, so the analysis/indexing tasks run here before returning.
+    background_tasks = BackgroundTasks()
+    summary = await refresh_locations(await pick_due_locations(limit), background_tasks)
+    await background_tasks()
+    return summary
+
+
+async def refresh_scheduler():
+    while True:
+        try:
+            await run_refresh_cycle()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Review refresh cycle failed: {e}")
+        await asyncio.sleep(REFRESH_INTERVAL_MINUTES * 60)
@@ -0,0 +1,121 @@
+import argparse
+import asyncio
+import random
+import time
+
+from benchmark import fakes
+from benchmark.corpus import THINGS, VIBES
+from benchmark.run_benchmark import percentile
+
+# Query embedding one call per request vs the micro-batcher, against the
+# fake Gemini embed_content (lognormal latency per call plus --per-text-ms
+# per text in the batch).
+#
+#   cd backend
+#   python -m benchmark.bench_embed_batching --concurrency 1,8,32,128
+
+POISON_TEXT = "<unembeddable>"
+
+
+async def run_level(embed, concurrency: int, total: int, rng: random.Random):
+    latencies = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for n in remaining:
+            query = f"{rng.choice(VIBES)} place with good {rng.choice(THINGS)} #{n}"
+            start = time.perf_counter()
+            try:
+                await embed(query)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "rps": len(latencies) / wall if wall else 0.0,
+        "p50": percentile(latencies, 50) * 1000,
+        "p95": percentile(latencies, 95) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+        "errors": errors,
+    }
+
+
+async def check_isolation(batcher_class, embed_many):
+    # One unembeddable text in a batch fails only its own request.
+    def flaky(texts):
+        if POISON_TEXT in texts:
+            raise ValueError("invalid content")
+        return embed_many(texts)
+
+    batcher = batcher_class("isolation", flaky, window_ms=20)
+    results = await asyncio.gather(*(batcher.embed(text) for text in ["cozy cafe", POISON_TEXT, "quiet park"]),
+                                   return_exceptions=True)
+    failed = [isinstance(result, Exception) for result in results]
+    print(f"\nError isolation: {'ok' if failed == [False, True, False] else 'FAILED'} "
+          f"(failed per request: {failed}, upstream calls: {batcher.upstream_calls})")
+
+
+async def check_outage(batcher_class, size: int):
+    # An upstream outage costs one batch call and one retry, not one call per text.
+    def down(texts):
+        raise ConnectionError("upstream unavailable")
+
+    batcher = batcher_class("outage", down, window_ms=20)
+    results = await asyncio.gather(*(batcher.embed(f"query {n}") for n in range(size)), return_exceptions=True)
+    failed = sum(isinstance(result, Exception) for result in results)
+    print(f"Upstream outage: {'ok' if batcher.upstream_calls == 2 else 'FAILED'} "
+          f"({failed}/{size} requests failed, upstream calls: {batcher.upstream_calls})")
+
+
+async def main_async(args):
+    fake_genai, _ = fakes.install(embed_latency_ms=args.embed_latency_ms, seed=args.seed)
+    import google.generativeai as genai
+    from services.clients import EMBEDDING_MODEL
+    from services.embed_batcher import EmbeddingBatcher
+
+    def embed_many(texts):
+        response = genai.embed_content(model=EMBEDDING_MODEL, content=texts, task_type="RETRIEVAL_QUERY")
+        time.sleep(args.per_text_ms * len(texts) / 1000)
+        return response["embedding"]
+
+    async def per_request(text):
+        return (await asyncio.to_thread(embed_many, [text]))[0]
+
+    print(f"{'mode':<12}{'conc':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'calls':>8}{'errors':>8}")
+    for concurrency in args.concurrency:
+        for mode in ("per-request", "batched"):
+            if mode == "batched":
+                batcher = EmbeddingBatcher("bench", embed_many, window_ms=args.window_ms, max_size=args.max_batch)
+                embed = batcher.embed
+            else:
+                embed = per_request
+            calls_before = fake_genai.embed_calls
+            row = await run_level(embed, concurrency, args.requests, random.Random(args.seed))
+            calls = fake_genai.embed_calls - calls_before
+            print(f"{mode:<12}{concurrency:>6}{row['rps']:>10.1f}{row['p50']:>10.1f}{row['p95']:>10.1f}"
+                  f"{row['p99']:>10.1f}{calls:>8}{row['errors']:>8}")
+
+    await check_isolation(EmbeddingBatcher, embed_many)
+    await check_outage(EmbeddingBatcher, args.max_batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request vs micro-batched query embedding.")
+    parser.add_argument("--concurrency", type=lambda v: [int(x) for x in v.split(",")], default=[1, 8, 32, 128])
+    parser.add_argument("--requests", type=int, default=512, help="Embeddings per concurrency level and mode.")
+    parser.add_argument("--embed-latency-ms", type=float, default=80)
+    parser.add_argument("--per-text-ms", type=float, default=0.5, help="Extra upstream time per text in a call.")
+    parser.add_argument("--window-ms", type=float, default=5)
+    parser.add_argument("--max-batch", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import json
+import random
+import time
+from collections import Counter
+
+from benchmark.corpus import generate_corpus
+from services.review_dedup import dedup_report, mark_duplicates
+
+# Embedding inputs and map-prompt tokens saved by near-duplicate marking.
+#
+#   cd backend
+#   python -m benchmark.bench_review_dedup --duplicate-rate 0.2
+#   python -m benchmark.bench_review_dedup --data ../scraper/data.json
+#
+# The synthetic corpus gets copy-pasted reviews with small edits (case,
+# punctuation, a word added) injected at --duplicate-rate, so recall on the
+# injected copies is reported too. --data measures a scraped data.json as is.
+
+EMBED_BATCH_SIZE = 100
+REVIEWS_PER_MAP_CALL = 30
+EDITS = [
+    lambda text: text.lower(),
+    lambda text: text.rstrip(".") + "!!",
+    lambda text: text + " Would recommend.",
+    lambda text: "Honestly, " + text,
+]
+
+
+def inject_duplicates(corpus, rate: float, rng: random.Random) -> int:
+    injected = 0
+    for location in corpus:
+        reviews = location["raw_reviews"]
+        originals = list(reviews)
+        for _ in range(round(len(originals) * rate)):
+            source = rng.choice(originals)
+            reviews.append({**source, "text": rng.choice(EDITS)(source["text"]), "injected": True})
+            injected += 1
+    return injected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Near-duplicate review savings.")
+    parser.add_argument("--data", default="", help="A scraper data.json to measure instead of the synthetic corpus.")
+    parser.add_argument("--duplicate-rate", type=float, default=0.2)
+    parser.add_argument("--locations-per-slice", type=int, default=10)
+    parser.add_argument("--reviews-per-location", type=int, default=15)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.data:
+        with open(args.data, encoding="utf-8") as f:
+            corpus = json.load(f)
+        injected = 0
+    else:
+        corpus = generate_corpus(args.locations_per_slice, args.reviews_per_location, seed=args.seed)
+        injected = inject_duplicates(corpus, args.duplicate_rate, random.Random(args.seed))
+
+    totals = Counter()
+    timings = []
+    map_calls_before = map_calls_after = 0
+    found_injected = false_positives = 0
+    for location in corpus:
+        reviews = location.get("raw_reviews") or []
+        start = time.perf_counter()
+        mark_duplicates(reviews)
+        timings.append((time.perf_counter() - start) * 1000)
+        report = dedup_report(reviews)
+        totals.update(report)
+        map_calls_before += -(-sum(1 for r in reviews if r.get("text")) // REVIEWS_PER_MAP_CALL)
+        map_calls_after += -(-(report["reviews"] - report["duplicates"]) // REVIEWS_PER_MAP_CALL)
+        for review in reviews:
+            if review.get("duplicate_of") is not None:
+                if review.get("injected"):
+                    found_injected += 1
+                else:
+                    false_positives += 1
+
+    timings.sort()
+    embed_calls = lambda n: -(-n // EMBED_BATCH_SIZE)
+    print(f"Locations: {len(corpus)}  reviews: {totals['reviews']}  marked duplicates: {totals['duplicates']}")
+    if injected:
+        print(f"Injected copies found: {found_injected}/{injected}  other reviews marked: {false_positives}")
+    print(f"Reviews embedded:      {totals['embedded_before']:>8} -> {totals['embedded_after']:<8}"
+          f"(embed API calls at batch {EMBED_BATCH_SIZE}: {embed_calls(totals['embedded_before'])} -> {embed_calls(totals['embedded_after'])})")
+    print(f"Map-prompt tokens:     {totals['map_tokens_before']:>8} -> {totals['map_tokens_after']:<8}"
+          f"(saved {1 - totals['map_tokens_after'] / max(1, totals['map_tokens_before']):.1%})")
+    print(f"Map LLM calls:         {map_calls_before:>8} -> {map_calls_after}")
+    print(f"Dedup time per location: p50 {timings[len(timings) // 2]:.2f} ms, max {timings[-1]:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
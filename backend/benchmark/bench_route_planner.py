@@ -0,0 +1,45 @@
+import random
+import time
+
+from services.route_planner import plan_route, route_length_km
+
+# Latency of the local tour-ordering step (haversine matrix + weighted
+# nearest-neighbour + 2-opt) as the candidate pool grows.
+#
+#   cd backend
+#   python -m benchmark.bench_route_planner
+
+CANDIDATE_COUNTS = [10, 25, 50, 100, 200]
+REPEATS = 200
+CITY_CENTER = (18.5204, 73.8567)
+
+
+def make_candidates(n: int, rng: random.Random):
+    return [{
+        "name": f"Place {i}",
+        "score": rng.random() * 2,
+        "coordinates": {
+            "lat": CITY_CENTER[0] + rng.uniform(-0.1, 0.1),
+            "lon": CITY_CENTER[1] + rng.uniform(-0.1, 0.1),
+        },
+    } for i in range(n)]
+
+
+def main():
+    rng = random.Random(7)
+    print(f"{'candidates':>10}{'p50 ms':>10}{'p99 ms':>10}{'route km':>10}")
+    for n in CANDIDATE_COUNTS:
+        timings = []
+        length = 0.0
+        for _ in range(REPEATS):
+            candidates = make_candidates(n, rng)
+            start = time.perf_counter()
+            stops = plan_route(candidates)
+            timings.append((time.perf_counter() - start) * 1000)
+            length += route_length_km(stops)
+        timings.sort()
+        print(f"{n:>10}{timings[len(timings) // 2]:>10.3f}{timings[int(len(timings) * 0.99) - 1]:>10.3f}{length / REPEATS:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import time
+
+import numpy as np
+
+from benchmark.corpus import generate_corpus
+from benchmark.fakes import fake_embedding
+from services.vibe_tagger import VibeTagger, evaluate
+
+# Agreement of local centroid tagging with the corpus' LLM-style tags, and
+# the analysis LLM calls it avoids, on a held-out split of the synthetic
+# corpus embedded with the deterministic fake embeddings.
+#
+#   cd backend
+#   python -m benchmark.bench_vibe_tagger --reviews-per-location 40
+
+REVIEWS_PER_BATCH = 30  # background_task.ai_analyzer
+HOLDOUT_EVERY = 5
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local vibe tagger agreement and LLM calls avoided.")
+    parser.add_argument("--locations-per-slice", type=int, default=20)
+    parser.add_argument("--reviews-per-location", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.locations_per_slice, args.reviews_per_location, seed=args.seed)
+    samples = [
+        (np.array([fake_embedding(r["text"]) for r in location["raw_reviews"]]),
+         location["ai_analysis"]["vibe_tags"], len(location["raw_reviews"]))
+        for location in corpus
+    ]
+    train = [s for i, s in enumerate(samples) if i % HOLDOUT_EVERY]
+    holdout = samples[::HOLDOUT_EVERY]
+
+    start = time.perf_counter()
+    tagger = VibeTagger.build([s[0] for s in train], [s[1] for s in train])
+    build_ms = (time.perf_counter() - start) * 1000
+
+    timings = []
+    for vectors, _, _ in holdout:
+        start = time.perf_counter()
+        tagger.tag(vectors)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+
+    report = evaluate(tagger, holdout, REVIEWS_PER_BATCH)
+    print(f"Prototypes: {len(tagger.tags)} tags from {len(train)} locations in {build_ms:.1f} ms")
+    print(f"Held out: {report['locations']} locations, {report['confident']} tagged locally "
+          f"({report['confident'] / report['locations']:.0%})")
+    print(f"Agreement with LLM tags: precision {report['precision']:.2f}  recall {report['recall']:.2f}  "
+          f"jaccard {report['jaccard']:.2f}")
+    print(f"Analysis LLM calls: {report['llm_calls_before']} -> {report['llm_calls_after']} "
+          f"({report['llm_calls_before'] - report['llm_calls_after']} avoided)")
+    print(f"Tagging time per location: p50 {timings[len(timings) // 2]:.3f} ms, max {timings[-1]:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
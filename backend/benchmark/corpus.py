@@ -0,0 +1,67 @@
+import random
+from typing import Dict, List
+
+from bson import ObjectId
+
+# Synthetic locations shaped like scraper/data.json, with enough vocabulary
+# overlap between reviews that lexical and vector retrieval both have signal.
+
+CITY_CENTERS = {
+    "pune": (18.5204, 73.8567),
+    "mumbai": (19.0760, 72.8777),
+    "bangalore": (12.9716, 77.5946),
+    "goa": (15.2993, 74.1240),
+}
+CATEGORIES = ["cafes", "parks", "bars", "bookstores", "restaurants"]
+VIBES = [
+    "cozy", "quiet", "lively", "aesthetic", "romantic", "crowded", "peaceful",
+    "artsy", "budget", "rooftop", "green", "vintage", "noisy", "chill",
+]
+THINGS = [
+    "coffee", "music", "service", "seating", "decor", "staff", "books", "view",
+    "cocktails", "breakfast", "sunset", "garden", "crowd", "wifi", "dessert",
+]
+TEMPLATES = [
+    "Such a {vibe} spot with great {thing}, we stayed for hours and loved the {thing2}.",
+    "The {thing} here is amazing and the whole place feels {vibe} and {vibe2}.",
+    "Came on a weekend, it was {vibe2} but the {thing} made up for it. Very {vibe} overall.",
+    "If you want something {vibe}, this is it. Good {thing}, okay {thing2}, friendly people.",
+    "Not the best {thing} in town but the {vibe} atmosphere and {thing2} are worth the visit.",
+]
+
+
+def _review(rng: random.Random, vibes: List[str]) -> Dict:
+    template = rng.choice(TEMPLATES)
+    text = template.format(
+        vibe=rng.choice(vibes), vibe2=rng.choice(VIBES),
+        thing=rng.choice(THINGS), thing2=rng.choice(THINGS),
+    )
+    return {"text": text, "source": "Synthetic", "author": f"Reviewer {rng.randint(1, 9999)}"}
+
+
+def generate_corpus(locations_per_slice: int = 10, reviews_per_location: int = 15, seed: int = 7) -> List[Dict]:
+    rng = random.Random(seed)
+    locations = []
+    for city, (lat, lon) in CITY_CENTERS.items():
+        for category in CATEGORIES:
+            for n in range(locations_per_slice):
+                vibes = rng.sample(VIBES, 3)
+                location_lat = round(lat + rng.uniform(-0.08, 0.08), 6)
+                location_lon = round(lon + rng.uniform(-0.08, 0.08), 6)
+                locations.append({
+                    "_id": ObjectId(),
+                    "name": f"{vibes[0].title()} {category.title()} {n} {city.title()}",
+                    "city": city,
+                    "category": category,
+                    "address": f"{rng.randint(1, 300)} Synthetic Road, {city.title()}",
+                    "coordinates": {"lat": location_lat, "lon": location_lon},
+                    "geo": {"type": "Point", "coordinates": [location_lon, location_lat]},
+                    "raw_reviews": [_review(rng, vibes) for _ in range(reviews_per_location)],
+                    "ai_analysis": {
+                        "vibe_summary": f"A {vibes[0]} and {vibes[1]} {category[:-1]} with a {vibes[2]} streak.",
+                        "vibe_tags": vibes,
+                        "emojis": "✨☕🌿",
+                    },
+                    "processing_status": "indexed",
+                })
+    return locations
@@ -0,0 +1,181 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from itertools import combinations
+from typing import Dict, List
+
+from benchmark.corpus import generate_corpus
+from benchmark.run_benchmark import percentile, setup_app
+
+# Retrieval quality vs latency for find_relevant_reviews_with_pinecone.
+#
+#   cd backend
+#   python -m benchmark.eval_retrieval --configs hybrid,vector,lexical,top_k_10
+#
+# The golden set is (city, query, relevant location) triples, one JSON object
+# per line: {"city": ..., "query": ..., "category": ..., "location": <name>}.
+# Without --golden it is generated from the seeded corpus: a query names two
+# vibes and a category, and every location of that category in the city
+# tagged with both vibes is relevant. --write-golden saves it so later runs
+# (or a hand-edited copy) score against the same set.
+#
+# Retrieval results are reviews; they are collapsed to their locations in
+# rank order before scoring. recall@k is the share of relevant locations
+# found in the first k, MRR the mean of 1/rank of the first relevant one.
+
+RECALL_AT = (1, 3, 5)
+
+# name -> keyword arguments for the retrieval call. `category` (bool) passes
+# the golden query's category as the metadata filter; `cold_cache` empties
+# the location hydration cache before every query.
+CONFIGS = {
+    "hybrid": {},
+    "vector": {"backends": ("vector",)},
+    "lexical": {"backends": ("lexical",)},
+    "top_k_3": {"top_k": 3},
+    "top_k_10": {"top_k": 10},
+    "category_filter": {"category": True},
+    "budget_100ms": {"budget_ms": 100},
+    "cold_cache": {"cold_cache": True},
+}
+DEFAULT_CONFIGS = "hybrid,vector,lexical,top_k_3,top_k_10,category_filter,budget_100ms"
+
+
+def generate_golden(corpus: List[Dict], queries: int, seed: int) -> List[Dict]:
+    # Every distinct (city, category, vibe pair) in the corpus is a candidate
+    # query; at most `queries` of them are sampled.
+    rng = random.Random(seed)
+    keys = sorted({(location["city"], location["category"], *pair)
+                   for location in corpus
+                   for pair in combinations(sorted(location["ai_analysis"]["vibe_tags"]), 2)})
+    if queries > len(keys):
+        print(f"Only {len(keys)} distinct golden queries in the corpus (asked for {queries}).")
+    triples = []
+    for city, category, *vibes in rng.sample(keys, min(queries, len(keys))):
+        query = f"{vibes[0]} and {vibes[1]} {category}"
+        for location in corpus:
+            if (location["city"], location["category"]) == (city, category) \
+                    and set(vibes) <= set(location["ai_analysis"]["vibe_tags"]):
+                triples.append({"city": city, "query": query, "category": category, "location": location["name"]})
+    return triples
+
+
+def load_golden(path: str) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def group_queries(triples: List[Dict], location_ids: Dict[str, str]) -> List[Dict]:
+    grouped = defaultdict(set)
+    unknown = 0
+    for triple in triples:
+        location_id = location_ids.get(triple["location"])
+        if location_id is None:
+            unknown += 1
+            continue
+        grouped[(triple["city"], triple["query"], triple.get("category"))].add(location_id)
+    if unknown:
+        print(f"Ignoring {unknown} golden triples whose location isn't in the corpus.")
+    return [{"city": city, "query": query, "category": category, "relevant": relevant}
+            for (city, query, category), relevant in grouped.items()]
+
+
+def ranked_locations(reviews: List[Dict]) -> List[str]:
+    return list(dict.fromkeys(review["location_id"] for review in reviews))
+
+
+async def evaluate(name: str, config: Dict, queries: List[Dict], fake_genai, fake_index) -> Dict:
+    from services import gemini_rag
+    from services.location_cache import location_cache
+
+    options = {k: v for k, v in config.items() if k not in ("category", "cold_cache")}
+    location_cache.clear()
+    embed_calls, query_calls = fake_genai.embed_calls, fake_index.query_calls
+    hits = {k: 0 for k in RECALL_AT}
+    relevant_total, reciprocal_ranks, latencies, results = 0, [], [], []
+
+    for item in queries:
+        if config.get("cold_cache"):
+            location_cache.clear()
+        start = time.perf_counter()
+        reviews = await gemini_rag.find_relevant_reviews_with_pinecone(
+            query=item["query"], city=item["city"],
+            category=item["category"] if config.get("category") else None, **options)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        ranking = ranked_locations(reviews)
+        results.append(len(ranking))
+        relevant_total += len(item["relevant"])
+        for k in RECALL_AT:
+            hits[k] += len(item["relevant"].intersection(ranking[:k]))
+        first = next((rank for rank, location_id in enumerate(ranking, 1) if location_id in item["relevant"]), None)
+        reciprocal_ranks.append(1 / first if first else 0.0)
+
+    latencies.sort()
+    return {
+        "config": name,
+        **{f"recall@{k}": hits[k] / relevant_total for k in RECALL_AT},
+        "mrr": sum(reciprocal_ranks) / len(queries),
+        "locations": sum(results) / len(queries),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "embeds": (fake_genai.embed_calls - embed_calls) / len(queries),
+        "pinecone": (fake_index.query_calls - query_calls) / len(queries),
+    }
+
+
+async def main_async(args):
+    app, fake_genai, fake_index = await setup_app(args)
+
+    corpus = generate_corpus(args.locations_per_slice, args.reviews_per_location, seed=args.seed)
+    triples = load_golden(args.golden) if args.golden else generate_golden(corpus, args.queries, args.seed)
+    if args.write_golden:
+        with open(args.write_golden, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(triple) + "\n" for triple in triples)
+        print(f"Wrote {len(triples)} golden triples to {args.write_golden}.")
+
+    # Corpus ObjectIds are fresh every run; golden sets refer to locations by name.
+    from db.mongo import get_location_collection
+    collection = await get_location_collection()
+    location_ids = {location["name"]: str(location["_id"]) async for location in collection.find({}, {"name": 1})}
+    queries = group_queries(triples, location_ids)
+    if not queries:
+        print("No golden queries to run.")
+        return
+    print(f"Golden set: {len(queries)} queries, {sum(len(q['relevant']) for q in queries)} relevant locations.")
+
+    recall_headers = "".join(f"{'R@' + str(k):>7}" for k in RECALL_AT)
+    print(f"\n{'config':<18}{recall_headers}{'MRR':>7}{'locs':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'embeds':>8}{'pinecone':>9}")
+    for name in args.configs.split(","):
+        if name not in CONFIGS:
+            print(f"{name:<18}unknown config (choose from {', '.join(CONFIGS)})")
+            continue
+        row = await evaluate(name, CONFIGS[name], queries, fake_genai, fake_index)
+        recalls = "".join(f"{row[f'recall@{k}']:>7.3f}" for k in RECALL_AT)
+        print(f"{name:<18}{recalls}{row['mrr']:>7.3f}{row['locations']:>6.1f}"
+              f"{row['p50']:>9.1f}{row['p95']:>9.1f}{row['p99']:>9.1f}{row['embeds']:>8.2f}{row['pinecone']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retrieval quality (recall@k, MRR) vs latency.")
+    parser.add_argument("--configs", default=DEFAULT_CONFIGS, help=f"Comma-separated, from: {', '.join(CONFIGS)}")
+    parser.add_argument("--golden", help="JSONL golden triples (city, query, category, location name).")
+    parser.add_argument("--write-golden", help="Save the golden set used to this JSONL file.")
+    parser.add_argument("--queries", type=int, default=100, help="Generated golden queries.")
+    parser.add_argument("--locations-per-slice", type=int, default=20)
+    parser.add_argument("--reviews-per-location", type=int, default=15)
+    parser.add_argument("--embed-latency-ms", type=float, default=80)
+    parser.add_argument("--pinecone-latency-ms", type=float, default=40)
+    parser.add_argument("--mongo-url", default=None, help="Local MongoDB instead of mongomock (reseeded).")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    args.generate_latency_ms = 0
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# In-process stand-ins for the Gemini SDK and the Pinecone index, so the API
+# can be load-tested without network access. Call install() BEFORE importing
+# any app module: the app resolves `genai.*` and `Pinecone` at import time.
+
+EMBEDDING_DIM = 768
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+class LatencyModel:
+    # Lognormal latency around a median, which matches the long right tail of
+    # real API calls better than a fixed sleep.
+
+    def __init__(self, median_ms: float = 0.0, sigma: float = 0.35, seed: Optional[int] = None):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.rng = random.Random(seed)
+
+    def sample(self) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        return self.median_ms * self.rng.lognormvariate(0, self.sigma) / 1000
+
+    def sleep(self):
+        delay = self.sample()
+        if delay:
+            time.sleep(delay)
+
+    async def async_sleep(self):
+        delay = self.sample()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+def fake_embedding(text: str, dim: int = EMBEDDING_DIM) -> List[float]:
+    # Feature-hashed bag of words: deterministic across runs, and texts that
+    # share words end up close, so retrieval results are still meaningful.
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in _TOKEN_RE.findall(text.lower()):
+        digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dim
+        sign = 1.0 if digest[4] & 1 else -1.0
+        vector[bucket] += sign
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector.tolist()
+
+
+class FakeGenAI:
+    def __init__(self, embed_latency: LatencyModel, generate_latency: LatencyModel):
+        self.embed_latency = embed_latency
+        self.generate_latency = generate_latency
+        self.embed_calls = 0
+        self.embed_texts = 0
+        self.generate_calls = 0
+
+    def configure(self, **kwargs):
+        pass
+
+    def get_model(self, name: str):
+        self.embed_latency.sleep()
+        return {"name": name}
+
+    def embed_content(self, model: str, content, task_type: str = None, **kwargs) -> Dict:
+        self.embed_latency.sleep()
+        self.embed_calls += 1
+        if isinstance(content, list):
+            self.embed_texts += len(content)
+            return {"embedding": [fake_embedding(text) for text in content]}
+        self.embed_texts += 1
+        return {"embedding": fake_embedding(content)}
+
+    def GenerativeModel(self, model_name: str, system_instruction: Optional[str] = None, **kwargs):
+        return _FakeGenerativeModel(self, system_instruction)
+
+
+class _FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _FakeGenerativeModel:
+    def __init__(self, owner: FakeGenAI, system_instruction: Optional[str]):
+        self.owner = owner
+        self.system_instruction = system_instruction or ""
+
+    def _reply(self, prompt: str) -> _FakeResponse:
+        self.owner.generate_calls += 1
+        if "JSON" in prompt:
+            words = [w for w in _TOKEN_RE.findall(prompt.lower()) if len(w) > 4][:5]
+            return _FakeResponse(json.dumps({
+                "vibe_summary": "A synthetic spot with a synthetic vibe.",
+                "vibe_tags": words or ["cozy"],
+                "emojis": "✨☕🌿",
+            }))
+        size = len(self.system_instruction) + len(prompt)
+        return _FakeResponse(f"Here is a plan built from {size} characters of context.")
+
+    async def generate_content_async(self, prompt: str):
+        await self.owner.generate_latency.async_sleep()
+        return self._reply(prompt)
+
+    def generate_content(self, prompt: str):
+        self.owner.generate_latency.sleep()
+        return self._reply(prompt)
+
+    def start_chat(self, history=None):
+        return _FakeChatSession(self)
+
+
+class _FakeChatSession:
+    def __init__(self, model: _FakeGenerativeModel):
+        self.model = model
+
+    async def send_message_async(self, message: str):
+        return await self.model.generate_content_async(message)
+
+
+class FakePineconeIndex:
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+        self.ids: List[str] = []
+        self.metadata: List[Dict] = []
+        self.vectors = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        self.query_calls = 0
+        self.upsert_calls = 0
+
+    def upsert(self, vectors: List[Dict], **kwargs):
+        self.latency.sleep()
+        self.upsert_calls += 1
+        positions = {vector_id: i for i, vector_id in enumerate(self.ids)}
+        new_rows = []
+        for item in vectors:
+            values = np.asarray(item["values"], dtype=np.float32)
+            if item["id"] in positions:
+                self.vectors[positions[item["id"]]] = values
+                self.metadata[positions[item["id"]]] = item.get("metadata", {})
+            else:
+                self.ids.append(item["id"])
+                self.metadata.append(item.get("metadata", {}))
+                new_rows.append(values)
+        if new_rows:
+            self.vectors = np.vstack([self.vectors, np.asarray(new_rows)])
+
+    def _matches_filter(self, metadata: Dict, metadata_filter: Optional[Dict]) -> bool:
+        if not metadata_filter:
+            return True
+        for key, expected in metadata_filter.items():
+            if isinstance(expected, dict) and "$in" in expected:
+                if metadata.get(key) not in expected["$in"]:
+                    return False
+            elif isinstance(expected, dict) and "$eq" in expected:
+                if metadata.get(key) != expected["$eq"]:
+                    return False
+            elif metadata.get(key) != expected:
+                return False
+        return True
+
+    def query(self, vector, top_k: int = 10, include_metadata: bool = False,
+              include_values: bool = False, filter: Optional[Dict] = None, **kwargs) -> Dict:
+        self.latency.sleep()
+        self.query_calls += 1
+        rows = [i for i, meta in enumerate(self.metadata) if self._matches_filter(meta, filter)]
+        if not rows:
+            return {"matches": []}
+        scores = self.vectors[rows] @ np.asarray(vector, dtype=np.float32)
+        order = np.argsort(-scores)[:top_k]
+        matches = []
+        for position in order:
+            row = rows[position]
+            match = {"id": self.ids[row], "score": float(scores[position])}
+            if include_metadata:
+                match["metadata"] = self.metadata[row]
+            if include_values:
+                match["values"] = self.vectors[row].tolist()
+            matches.append(match)
+        return {"matches": matches}
+
+    def fetch(self, ids: List[str], **kwargs):
+        self.latency.sleep()
+        positions = {vector_id: i for i, vector_id in enumerate(self.ids)}
+        return SimpleNamespace(vectors={
+            vector_id: SimpleNamespace(id=vector_id, values=self.vectors[positions[vector_id]].tolist(),
+                                       metadata=self.metadata[positions[vector_id]])
+            for vector_id in ids if vector_id in positions
+        })
+
+    def describe_index_stats(self) -> Dict:
+        return {"total_vector_count": len(self.ids), "dimension": EMBEDDING_DIM}
+
+
+class FakePinecone:
+    index: Optional[FakePineconeIndex] = None
+
+    def __init__(self, api_key: str = None, **kwargs):
+        pass
+
+    def Index(self, name: str):
+        return FakePinecone.index
+
+    def list_indexes(self):
+        return []
+
+
+def install(embed_latency_ms: float = 80, generate_latency_ms: float = 600,
+            pinecone_latency_ms: float = 40, seed: int = 7):
+    import os
+    import google.generativeai as genai
+    import pinecone
+
+    fake_genai = FakeGenAI(
+        embed_latency=LatencyModel(embed_latency_ms, seed=seed),
+        generate_latency=LatencyModel(generate_latency_ms, seed=seed + 1),
+    )
+    genai.configure = fake_genai.configure
+    genai.embed_content = fake_genai.embed_content
+    genai.GenerativeModel = fake_genai.GenerativeModel
+    genai.get_model = fake_genai.get_model
+
+    FakePinecone.index = FakePineconeIndex(LatencyModel(pinecone_latency_ms, seed=seed + 2))
+    pinecone.Pinecone = FakePinecone
+
+    os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")
+    os.environ.setdefault("PINECONE_API_KEY", "offline-benchmark")
+    return fake_genai, FakePinecone.index
@@ -0,0 +1,165 @@
+import argparse
+import asyncio
+import os
+import random
+import time
+from typing import Callable, Dict, List
+
+from benchmark import fakes
+from benchmark.corpus import CATEGORIES, CITY_CENTERS, THINGS, VIBES, generate_corpus
+
+# Offline throughput benchmark for the API.
+#
+#   cd backend
+#   python -m benchmark.run_benchmark --concurrency 1,8,32 --requests 200
+#
+# Gemini and Pinecone are replaced by benchmark.fakes with configurable
+# latency. MongoDB is mongomock-motor (pip install mongomock-motor) unless
+# --mongo-url points at a local server; the `locations` collection there is
+# wiped and reseeded.
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def setup_app(args):
+    # One benchmark client would trip the per-client rate limit immediately;
+    # concurrency limits and queueing stay as configured.
+    os.environ.setdefault("CHAT_RATE_LIMIT_PER_MINUTE", "0")
+    os.environ.setdefault("TOUR_RATE_LIMIT_PER_MINUTE", "0")
+
+    fake_genai, fake_index = fakes.install(
+        embed_latency_ms=args.embed_latency_ms,
+        generate_latency_ms=args.generate_latency_ms,
+        pinecone_latency_ms=args.pinecone_latency_ms,
+        seed=args.seed,
+    )
+
+    import main
+    from db import location_repository, vibe_aggregates
+    from db.mongo import db, get_location_collection
+    from services.lexical_index import lexical_index
+
+    if args.mongo_url:
+        import motor.motor_asyncio
+        db.client = motor.motor_asyncio.AsyncIOMotorClient(args.mongo_url)
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+        db.client = AsyncMongoMockClient()
+
+    corpus = generate_corpus(args.locations_per_slice, args.reviews_per_location, seed=args.seed)
+    collection = await get_location_collection()
+    await collection.delete_many({})
+    await collection.insert_many(corpus)
+
+    vectors = []
+    for location in corpus:
+        for review_index, review in enumerate(location["raw_reviews"]):
+            vectors.append({
+                "id": f"{location['_id']}#{review_index}",
+                "values": fakes.fake_embedding(review["text"]),
+                "metadata": {"city": location["city"], "category": location["category"]},
+            })
+    latency, fake_index.latency = fake_index.latency, fakes.LatencyModel(0)
+    for i in range(0, len(vectors), 1000):
+        fake_index.upsert(vectors=vectors[i:i + 1000])
+    fake_index.latency = latency
+
+    await lexical_index.build(location_repository.iter_for_lexical_index())
+    await vibe_aggregates.rebuild_all()
+    print(f"Seeded {len(corpus)} locations / {len(vectors)} review vectors.")
+    return main.app, fake_genai, fake_index
+
+
+def scenarios(rng: random.Random) -> Dict[str, Callable]:
+    cities = list(CITY_CENTERS)
+
+    def locations(client):
+        return client.get("/vibes/locations", params={"city": rng.choice(cities), "category": rng.choice(CATEGORIES)})
+
+    def tags(client):
+        return client.get("/vibes/tags", params={"city": rng.choice(cities), "category": rng.choice(CATEGORIES)})
+
+    def chat(client):
+        query = f"{rng.choice(VIBES)} place with good {rng.choice(THINGS)}"
+        return client.post("/vibes/agent/chat", json={"query": query, "city": rng.choice(cities), "chat_history": []})
+
+    def tour(client):
+        return client.post("/vibes/agent/tour", json={"city": rng.choice(cities), "vibe_tags": rng.sample(VIBES, 2)})
+
+    return {"/vibes/locations": locations, "/vibes/tags": tags, "/vibes/agent/chat": chat, "/vibes/agent/tour": tour}
+
+
+async def run_level(client, make_request: Callable, concurrency: int, total: int):
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                response = await make_request(client)
+                if response.status_code >= 400:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "rps": len(latencies) / wall if wall else 0.0,
+        "p50": percentile(latencies, 50) * 1000,
+        "p95": percentile(latencies, 95) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+        "errors": errors,
+    }
+
+
+async def main_async(args):
+    import httpx
+
+    app, fake_genai, fake_index = await setup_app(args)
+    rng = random.Random(args.seed)
+    selected = scenarios(rng)
+    if args.endpoints:
+        selected = {name: fn for name, fn in selected.items() if name in args.endpoints.split(",")}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=120) as client:
+        print(f"\n{'endpoint':<22}{'conc':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for name, make_request in selected.items():
+            for concurrency in args.concurrency:
+                stats = await run_level(client, make_request, concurrency, args.requests)
+                print(f"{name:<22}{concurrency:>6}{stats['rps']:>10.1f}{stats['p50']:>10.1f}"
+                      f"{stats['p95']:>10.1f}{stats['p99']:>10.1f}{stats['errors']:>8}")
+
+    print(f"\nUpstream calls: embed={fake_genai.embed_calls} generate={fake_genai.generate_calls} "
+          f"pinecone_query={fake_index.query_calls}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline load benchmark for the Vibe Navigator API.")
+    parser.add_argument("--concurrency", type=lambda s: [int(x) for x in s.split(",")], default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint per concurrency level.")
+    parser.add_argument("--endpoints", default="", help="Comma-separated subset of endpoints to run.")
+    parser.add_argument("--embed-latency-ms", type=float, default=80)
+    parser.add_argument("--generate-latency-ms", type=float, default=600)
+    parser.add_argument("--pinecone-latency-ms", type=float, default=40)
+    parser.add_argument("--locations-per-slice", type=int, default=10)
+    parser.add_argument("--reviews-per-location", type=int, default=15)
+    parser.add_argument("--mongo-url", default="", help="Use a local MongoDB instead of mongomock-motor.")
+    parser.add_argument("--seed", type=int, default=7)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main_async(parse_args()))
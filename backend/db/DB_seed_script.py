@@ -1,12 +1,9 @@
-import motor.motor_asyncio
 import json
-import os
 import asyncio
-from dotenv import load_dotenv
 
-load_dotenv(dotenv_path='../.env')
-
-MONGO_DB_URL = os.getenv("MONGO_DB_URL")
+from db import location_repository
+from services.review_dedup import mark_duplicates
+from db.mongo import MONGO_DB_URL, connect_to_mongo, close_mongo_connection, ensure_indexes, to_geo_point
 from pathlib import Path
 BASE_DIR = Path(__file__).resolve().parent.parent
 JSON_FILE_PATH = BASE_DIR / "scraper" / "data.json"
@@ -16,13 +13,7 @@ async def seed_database():
         print("ERROR: MONGO_DB_URL not found in .env file.")
         return
 
-    print("Connecting to MongoDB...")
-    client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_DB_URL)
-    db = client.vibe_navigator 
-    collection = db.locations  
-
-    print(f"Clearing existing data from '{collection.name}' collection...")
-    await collection.delete_many({})
+    await connect_to_mongo()
 
     print(f"Loading data from {JSON_FILE_PATH}...")
     try:
@@ -40,11 +31,20 @@ async def seed_database():
         print("No data to seed.")
         return
 
-    print(f"Inserting {len(data)} documents into the database...")
-    await collection.insert_many(data)
+    duplicates = 0
+    for location in data:
+        duplicates += mark_duplicates(location.get("raw_reviews") or [])
+        geo_point = to_geo_point(location.get("coordinates") or {})
+        if geo_point:
+            location["geo"] = geo_point
+
+    print(f"Marked {duplicates} near-duplicate reviews; they won't be embedded or analyzed.")
+    print(f"Replacing the 'locations' collection with {len(data)} documents...")
+    await location_repository.replace_all(data)
+    await ensure_indexes()
 
     print("✅ Database seeding complete!")
-    client.close()
+    await close_mongo_connection()
 
 if __name__ == "__main__":
     asyncio.run(seed_database())
\ No newline at end of file
@@ -0,0 +1,26 @@
+import asyncio
+
+from db import location_repository
+from db.mongo import connect_to_mongo, close_mongo_connection, ensure_indexes, to_geo_point
+
+async def backfill_geo_points():
+
+    await connect_to_mongo()
+
+    print("Backfilling GeoJSON points from stored coordinates...")
+    updated = 0
+    skipped = 0
+    async for location in location_repository.iter_missing_geo():
+        geo_point = to_geo_point(location.get("coordinates") or {})
+        if not geo_point:
+            skipped += 1
+            continue
+        await location_repository.set_geo(location["_id"], geo_point)
+        updated += 1
+
+    await ensure_indexes()
+    print(f" Added geo points to {updated} locations ({skipped} skipped without coordinates). 2dsphere index ensured.")
+    await close_mongo_connection()
+
+if __name__ == "__main__":
+    asyncio.run(backfill_geo_points())
@@ -0,0 +1,60 @@
+import asyncio
+
+import numpy as np
+
+from background_task.ai_analyzer import REVIEWS_PER_BATCH
+from background_task.pinecone_indexer import indexable_reviews
+from db import location_repository
+from db.mongo import connect_to_mongo, close_mongo_connection
+from services.clients import get_pinecone_index, EMBEDDING_MODEL
+from services.review_dedup import map_stage_lines
+from services.vibe_tagger import VibeTagger, evaluate, save_tagger
+
+PINECONE_FETCH_BATCH = 200
+HOLDOUT_EVERY = 5
+
+def fetch_vectors(pinecone_index, vector_ids):
+    values = {}
+    for i in range(0, len(vector_ids), PINECONE_FETCH_BATCH):
+        response = pinecone_index.fetch(ids=vector_ids[i:i + PINECONE_FETCH_BATCH])
+        for vector_id, vector in response.vectors.items():
+            values[vector_id] = vector.values
+    return values
+
+async def build_tag_prototypes():
+
+    await connect_to_mongo()
+    pinecone_index = get_pinecone_index()
+
+    print("Loading LLM-tagged locations and their review vectors...")
+    samples = []
+    async for location in location_repository.iter_llm_tagged():
+        reviews = indexable_reviews(location)
+        if not reviews:
+            continue
+        values = await asyncio.to_thread(fetch_vectors, pinecone_index, [vector_id for vector_id, _ in reviews])
+        vectors = [values[vector_id] for vector_id, _ in reviews if vector_id in values]
+        if vectors:
+            samples.append((np.array(vectors), location["ai_analysis"]["vibe_tags"], len(map_stage_lines(location["raw_reviews"]))))
+
+    print(f"Found {len(samples)} locations with vectors.")
+    train = [s for i, s in enumerate(samples) if i % HOLDOUT_EVERY]
+    holdout = samples[::HOLDOUT_EVERY]
+    tagger = VibeTagger.build([s[0] for s in train], [s[1] for s in train]) if train else None
+    if tagger is None or not holdout:
+        print(" Not enough labelled locations to build tag prototypes.")
+        await close_mongo_connection()
+        return
+
+    report = evaluate(tagger, holdout, REVIEWS_PER_BATCH)
+    print(f" Held-out agreement with LLM tags on {report['confident']}/{report['locations']} confidently tagged locations: "
+          f"precision {report['precision']:.2f}, recall {report['recall']:.2f}, jaccard {report['jaccard']:.2f}.")
+    print(f" Analysis LLM calls on the held-out set: {report['llm_calls_before']} -> {report['llm_calls_after']}.")
+
+    tagger = VibeTagger.build([s[0] for s in samples], [s[1] for s in samples])
+    await save_tagger(tagger, EMBEDDING_MODEL)
+    print(f" Saved prototypes for {len(tagger.tags)} tags.")
+    await close_mongo_connection()
+
+if __name__ == "__main__":
+    asyncio.run(build_tag_prototypes())
@@ -0,0 +1,47 @@
+import argparse
+import asyncio
+from collections import Counter
+
+from db import location_repository
+from db.mongo import connect_to_mongo, close_mongo_connection
+from services.review_dedup import find_duplicates, dedup_report
+
+PINECONE_DELETE_BATCH = 1000
+
+async def dedup_reviews(prune_vectors: bool):
+
+    await connect_to_mongo()
+
+    print("Marking near-duplicate reviews on existing locations...")
+    totals = Counter()
+    updated = 0
+    duplicate_vector_ids = []
+    async for location in location_repository.iter_for_dedup():
+        reviews = location.get("raw_reviews") or []
+        marks = find_duplicates([review.get("text") or "" for review in reviews])
+        if marks != [review.get("duplicate_of") for review in reviews]:
+            await location_repository.set_duplicate_marks(location["_id"], marks)
+            updated += 1
+        for review_index, (review, mark) in enumerate(zip(reviews, marks)):
+            review["duplicate_of"] = mark
+            if mark is not None:
+                duplicate_vector_ids.append(f"{location['_id']}#{review_index}")
+        totals.update(dedup_report(reviews))
+
+    print(f" Updated marks on {updated} locations: {totals['duplicates']} of {totals['reviews']} reviews are near-duplicates.")
+    print(f" Embedding inputs: {totals['embedded_before']} -> {totals['embedded_after']}. "
+          f"Map-prompt tokens: ~{totals['map_tokens_before']} -> ~{totals['map_tokens_after']}.")
+
+    if prune_vectors and duplicate_vector_ids:
+        from services.clients import get_pinecone_index
+        pinecone_index = get_pinecone_index()
+        for i in range(0, len(duplicate_vector_ids), PINECONE_DELETE_BATCH):
+            pinecone_index.delete(ids=duplicate_vector_ids[i:i + PINECONE_DELETE_BATCH])
+        print(f" Deleted {len(duplicate_vector_ids)} duplicate review vectors from Pinecone.")
+
+    await close_mongo_connection()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mark near-duplicate reviews on every stored location.")
+    parser.add_argument("--prune-vectors", action="store_true", help="Also delete the duplicates' vectors from Pinecone.")
+    asyncio.run(dedup_reviews(parser.parse_args().prune_vectors))
@@ -0,0 +1,213 @@
+import argparse
+import asyncio
+import json
+import os
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from bson import json_util
+
+from background_task.pinecone_indexer import indexable_reviews
+from db import location_repository
+from db.build_tag_prototypes import fetch_vectors
+from db.mongo import connect_to_mongo, close_mongo_connection
+from services.clients import get_pinecone_index, EMBEDDING_MODEL
+
+# Snapshot layout, one directory per city (hive-style, so pyarrow.dataset and
+# DuckDB read it as a partitioned table):
+#
+#   <out>/manifest.json
+#   <out>/locations/city=<city>/part-0.parquet   one row per location
+#   <out>/vectors/city=<city>/part-0.parquet     one row per review vector
+#
+# Locations are read from Mongo sorted by city and written EXPORT_BATCH_SIZE
+# at a time (one row group each), together with their vectors fetched from
+# Pinecone, so memory stays flat however large the collection is.
+
+SNAPSHOT_FORMAT_VERSION = 1
+EXPORT_BATCH_SIZE = 200
+PARQUET_COMPRESSION = "zstd"
+JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS
+
+LOCATION_SCHEMA = pa.schema([
+    ("_id", pa.string()),
+    ("name", pa.string()),
+    ("category", pa.string()),
+    ("processing_status", pa.string()),
+    ("review_count", pa.int32()),
+    ("vibe_tags", pa.list_(pa.string())),
+    # Extended JSON, so ObjectIds and datetimes survive the round trip.
+    ("ai_analysis", pa.string()),
+    ("document", pa.string()),
+])
+
+
+def vector_schema(dimension: int) -> pa.Schema:
+    return pa.schema([
+        ("id", pa.string()),
+        ("location_id", pa.string()),
+        ("review_index", pa.int32()),
+        ("values", pa.list_(pa.float32(), dimension)),
+        ("location_name", pa.string()),
+        ("category", pa.string()),
+        ("tags", pa.list_(pa.string())),
+    ])
+
+
+def partition_dir(root: str, table: str, city: str) -> str:
+    return os.path.join(root, table, f"city={quote(city, safe='')}")
+
+
+def location_rows(locations):
+    rows = {name: [] for name in LOCATION_SCHEMA.names}
+    for location in locations:
+        document = {key: value for key, value in location.items() if key != "ai_analysis"}
+        analysis = location.get("ai_analysis")
+        rows["_id"].append(str(location["_id"]))
+        rows["name"].append(location.get("name"))
+        rows["category"].append(location.get("category"))
+        rows["processing_status"].append(location.get("processing_status"))
+        rows["review_count"].append(len(location.get("raw_reviews") or []))
+        rows["vibe_tags"].append((analysis or {}).get("vibe_tags") or [])
+        rows["ai_analysis"].append(json_util.dumps(analysis, json_options=JSON_OPTIONS) if analysis is not None else None)
+        rows["document"].append(json_util.dumps(document, json_options=JSON_OPTIONS))
+    return rows
+
+
+class CityWriter:
+    # Parquet writers for one city; the vectors file is opened on the first
+    # vector, once the dimension is known.
+
+    def __init__(self, root: str, city: str):
+        self.root = root
+        self.city = city
+        self.metadata = {"city": city, "embedding_model": EMBEDDING_MODEL}
+        path = partition_dir(root, "locations", city)
+        os.makedirs(path, exist_ok=True)
+        self.locations = pq.ParquetWriter(os.path.join(path, "part-0.parquet"),
+                                          LOCATION_SCHEMA.with_metadata(self.metadata),
+                                          compression=PARQUET_COMPRESSION)
+        self.vectors = None
+        self.location_count = 0
+        self.vector_count = 0
+
+    def write(self, locations, vectors, dimension):
+        self.locations.write_table(pa.Table.from_pydict(location_rows(locations), schema=LOCATION_SCHEMA))
+        self.location_count += len(locations)
+        if not vectors:
+            return
+        schema = vector_schema(dimension)
+        if self.vectors is None:
+            path = partition_dir(self.root, "vectors", self.city)
+            os.makedirs(path, exist_ok=True)
+            self.vectors = pq.ParquetWriter(os.path.join(path, "part-0.parquet"),
+                                            schema.with_metadata(self.metadata),
+                                            compression=PARQUET_COMPRESSION)
+        rows = {name: [row[name] for row in vectors] for name in schema.names}
+        self.vectors.write_table(pa.Table.from_pydict(rows, schema=schema))
+        self.vector_count += len(vectors)
+
+    def close(self):
+        self.locations.close()
+        if self.vectors is not None:
+            self.vectors.close()
+
+
+def fetch_location_vectors(pinecone_index, locations):
+    # (rows, reviews expected, dimension) for one batch of locations.
+    expected = []
+    for location in locations:
+        expected.extend((location, vector_id) for vector_id, _ in indexable_reviews(location))
+    values = fetch_vectors(pinecone_index, [vector_id for _, vector_id in expected]) if expected else {}
+    rows, dimension = [], None
+    for location, vector_id in expected:
+        vector = values.get(vector_id)
+        if vector is None:
+            continue
+        dimension = dimension or len(vector)
+        analysis = location.get("ai_analysis") or {}
+        rows.append({
+            "id": vector_id,
+            "location_id": str(location["_id"]),
+            "review_index": int(vector_id.rsplit("#", 1)[1]),
+            "values": list(vector),
+            "location_name": location.get("name", "Unknown Location"),
+            "category": location.get("category", "misc").lower(),
+            "tags": analysis.get("vibe_tags", []),
+        })
+    return rows, len(expected), dimension
+
+
+async def export_snapshot(out_dir: str, cities=None, include_vectors: bool = True):
+
+    if os.path.exists(os.path.join(out_dir, "manifest.json")):
+        print(f"ERROR: {out_dir} already holds a snapshot.")
+        return
+
+    await connect_to_mongo()
+    pinecone_index = get_pinecone_index() if include_vectors else None
+
+    print(f"Exporting locations{' and review vectors' if include_vectors else ''} to {out_dir}...")
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "embedding_model": EMBEDDING_MODEL,
+        "dimension": None,
+        "cities": {},
+    }
+    writer, batch, missing = None, [], 0
+
+    async def flush():
+        nonlocal missing
+        vectors, expected, dimension = [], 0, None
+        if include_vectors:
+            vectors, expected, dimension = await asyncio.to_thread(fetch_location_vectors, pinecone_index, batch)
+            missing += expected - len(vectors)
+            manifest["dimension"] = manifest["dimension"] or dimension
+        await asyncio.to_thread(writer.write, batch, vectors, manifest["dimension"])
+        batch.clear()
+
+    def close_city():
+        writer.close()
+        manifest["cities"][writer.city] = {"locations": writer.location_count, "vectors": writer.vector_count}
+        print(f" {writer.city}: {writer.location_count} locations, {writer.vector_count} vectors.")
+
+    async for location in location_repository.iter_for_export(cities):
+        city = location.get("city") or "unknown"
+        if writer is None or city != writer.city:
+            if writer is not None:
+                if batch:
+                    await flush()
+                close_city()
+            writer = CityWriter(out_dir, city)
+        batch.append(location)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            await flush()
+
+    if writer is not None:
+        if batch:
+            await flush()
+        close_city()
+
+    await close_mongo_connection()
+
+    if writer is None:
+        print("No locations to export.")
+        return
+
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    if missing:
+        print(f" {missing} indexable reviews had no vector in Pinecone (not indexed yet?).")
+    print(f"✅ Snapshot written to {out_dir}.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export locations, their AI analysis and review vectors to Parquet.")
+    parser.add_argument("out_dir", help="Directory to write the snapshot to.")
+    parser.add_argument("--city", action="append", dest="cities", help="Only export this city (repeatable).")
+    parser.add_argument("--no-vectors", action="store_true", help="Skip the Pinecone vectors.")
+    args = parser.parse_args()
+    asyncio.run(export_snapshot(args.out_dir, args.cities, not args.no_vectors))
@@ -0,0 +1,115 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+
+import pyarrow.parquet as pq
+from bson import json_util
+
+from db import location_repository
+from db.export_snapshot import SNAPSHOT_FORMAT_VERSION, partition_dir
+from db.mongo import connect_to_mongo, close_mongo_connection, ensure_indexes
+from services.clients import get_pinecone_index, EMBEDDING_MODEL
+
+# Loads a snapshot written by db.export_snapshot: locations are upserted by
+# _id and vectors upserted into Pinecone as stored, so no LLM or embedding
+# call is made. Files are read a record batch at a time.
+
+IMPORT_BATCH_SIZE = 500
+PINECONE_UPSERT_BATCH = 100
+
+
+def location_documents(batch):
+    documents = []
+    for document, analysis in zip(batch.column("document").to_pylist(), batch.column("ai_analysis").to_pylist()):
+        document = json_util.loads(document)
+        if analysis is not None:
+            document["ai_analysis"] = json_util.loads(analysis)
+        documents.append(document)
+    return documents
+
+
+def pinecone_vectors(batch, city: str):
+    values = batch.column("values").flatten().to_numpy().reshape(batch.num_rows, -1).tolist()
+    columns = {name: batch.column(name).to_pylist() for name in ("id", "location_id", "location_name", "category", "tags")}
+    return [{
+        "id": columns["id"][i],
+        "values": values[i],
+        "metadata": {
+            "location_id": columns["location_id"][i],
+            "location_name": columns["location_name"][i],
+            "city": city.lower(),
+            "category": columns["category"][i],
+            "tags": columns["tags"][i] or [],
+        }
+    } for i in range(batch.num_rows)]
+
+
+def partition_files(snapshot_dir: str, table: str, city: str):
+    return sorted(glob.glob(os.path.join(partition_dir(snapshot_dir, table, city), "*.parquet")))
+
+
+async def import_locations(snapshot_dir: str, city: str) -> int:
+    imported = 0
+    for path in partition_files(snapshot_dir, "locations", city):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=IMPORT_BATCH_SIZE, columns=["document", "ai_analysis"]):
+            documents = location_documents(batch)
+            await location_repository.upsert_many(documents)
+            imported += len(documents)
+    return imported
+
+
+async def import_vectors(snapshot_dir: str, city: str, pinecone_index) -> int:
+    imported = 0
+    for path in partition_files(snapshot_dir, "vectors", city):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=PINECONE_UPSERT_BATCH):
+            vectors = pinecone_vectors(batch, city)
+            await asyncio.to_thread(pinecone_index.upsert, vectors=vectors)
+            imported += len(vectors)
+    return imported
+
+
+async def import_snapshot(snapshot_dir: str, cities=None, include_vectors: bool = True, force: bool = False):
+
+    try:
+        with open(os.path.join(snapshot_dir, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        print(f"ERROR: {snapshot_dir} has no manifest.json. Is it a finished snapshot?")
+        return
+
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        print(f"ERROR: Snapshot format {manifest.get('format_version')} is not supported.")
+        return
+    if include_vectors and manifest.get("embedding_model") != EMBEDDING_MODEL and not force:
+        print(f"ERROR: Snapshot vectors come from {manifest.get('embedding_model')}, this deployment queries "
+              f"{EMBEDDING_MODEL}. Pass --no-vectors, or --force to load them anyway.")
+        return
+
+    selected = [city for city in manifest["cities"] if not cities or city in cities]
+    if not selected:
+        print("No matching cities in the snapshot.")
+        return
+
+    await connect_to_mongo()
+    pinecone_index = get_pinecone_index() if include_vectors else None
+
+    print(f"Importing {len(selected)} cities from {snapshot_dir} (snapshot of {manifest['created_at']})...")
+    for city in selected:
+        locations = await import_locations(snapshot_dir, city)
+        vectors = await import_vectors(snapshot_dir, city, pinecone_index) if include_vectors else 0
+        print(f" {city}: {locations} locations, {vectors} vectors.")
+
+    await ensure_indexes()
+    await close_mongo_connection()
+    print("✅ Snapshot imported. Run db.rebuild_vibe_aggregates and db.build_tag_prototypes to refresh the derived data.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load a Parquet snapshot into MongoDB and Pinecone without any LLM or embedding calls.")
+    parser.add_argument("snapshot_dir", help="Directory written by db.export_snapshot.")
+    parser.add_argument("--city", action="append", dest="cities", help="Only import this city (repeatable).")
+    parser.add_argument("--no-vectors", action="store_true", help="Only load MongoDB.")
+    parser.add_argument("--force", action="store_true", help="Load vectors even if the embedding model differs.")
+    args = parser.parse_args()
+    asyncio.run(import_snapshot(args.snapshot_dir, args.cities, not args.no_vectors, args.force))
@@ -0,0 +1,359 @@
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from bson import ObjectId
+from pymongo import ReplaceOne, ReturnDocument
+
+from db.mongo import get_location_collection
+
+# Every read of the `locations` collection goes through here, on the shared
+# client from db.mongo. Each query projects only the fields its caller uses;
+# raw_reviews is the bulk of a document and most paths only need its text.
+
+CARD_PROJECTION = {
+    "name": 1, "city": 1, "category": 1, "address": 1,
+    "coordinates": 1, "raw_reviews": 1, "ai_analysis": 1,
+}
+HYDRATION_PROJECTION = {"name": 1, "coordinates": 1, "raw_reviews.text": 1, "raw_reviews.author": 1}
+ANALYSIS_PROJECTION = {
+    "name": 1, "city": 1, "category": 1, "categories": 1, "ai_analysis.vibe_tags": 1,
+    "raw_reviews.text": 1, "raw_reviews.duplicate_of": 1, "pipeline.status_at": 1,
+}
+INDEXING_PROJECTION = {
+    "name": 1, "city": 1, "category": 1, "ai_analysis.vibe_tags": 1,
+    "raw_reviews.text": 1, "raw_reviews.duplicate_of": 1, "pipeline.status_at": 1,
+}
+# What the vibe aggregates need to place a location in its slices.
+AGGREGATE_PROJECTION = {"name": 1, "city": 1, "category": 1, "categories": 1, "ai_analysis.vibe_tags": 1}
+LEXICAL_PROJECTION = {"city": 1, "category": 1, "raw_reviews.text": 1, "raw_reviews.duplicate_of": 1}
+DEDUP_PROJECTION = {"raw_reviews.text": 1, "raw_reviews.duplicate_of": 1}
+NEARBY_PROJECTION = {**CARD_PROJECTION, "distance_m": 1}
+REFRESH_PROJECTION = {
+    "name": 1, "city": 1, "category": 1, "categories": 1, "source_url": 1, "seen_review_ids": 1,
+    "raw_reviews.text": 1, "raw_reviews.duplicate_of": 1, "ai_analysis.vibe_tags": 1,
+}
+
+MAX_SLICE_RESULTS = 50
+
+
+def _geo_near(lat: float, lon: float, radius_m: int, query: dict) -> dict:
+    return {"$geoNear": {
+        "near": {"type": "Point", "coordinates": [lon, lat]},
+        "key": "geo",
+        "distanceField": "distance_m",
+        "maxDistance": radius_m,
+        "spherical": True,
+        "query": query
+    }}
+
+
+def _category_match(category: str) -> dict:
+    # `category` is the one a place was first scraped for; `categories` holds
+    # every search it matched (older documents only have `category`).
+    category = category.lower()
+    return {"$or": [{"category": category}, {"categories": category}]}
+
+
+async def find_for_hydration(location_ids: List[ObjectId]) -> List[dict]:
+    collection = await get_location_collection()
+    return await collection.find({"_id": {"$in": location_ids}}, HYDRATION_PROJECTION).to_list(length=None)
+
+
+async def find_visible_in_slice(city: str, category: str, limit: int = MAX_SLICE_RESULTS) -> List[dict]:
+    # Locations still waiting for analysis stay hidden; on-demand population
+    # makes them visible one by one as they reach 'analyzed'.
+    collection = await get_location_collection()
+    db_query = {"city": city.lower(), **_category_match(category), "processing_status": {"$ne": "new"}}
+    return await collection.find(db_query, CARD_PROJECTION).limit(limit).to_list(length=limit)
+
+
+async def find_for_analysis(location_ids: List) -> List[dict]:
+    collection = await get_location_collection()
+    return await collection.find({"_id": {"$in": location_ids}}, ANALYSIS_PROJECTION).to_list(length=None)
+
+
+async def find_for_indexing(location_ids: List) -> List[dict]:
+    collection = await get_location_collection()
+    return await collection.find({"_id": {"$in": location_ids}}, INDEXING_PROJECTION).to_list(length=None)
+
+
+async def iter_for_indexing() -> AsyncIterator[dict]:
+    collection = await get_location_collection()
+    async for location in collection.find({}, INDEXING_PROJECTION):
+        yield location
+
+
+async def iter_for_lexical_index() -> AsyncIterator[dict]:
+    collection = await get_location_collection()
+    async for location in collection.find({}, LEXICAL_PROJECTION):
+        yield location
+
+
+async def find_nearby(lat: float, lon: float, radius_m: int, category: Optional[str] = None,
+                      vibe_tags: Optional[List[str]] = None, skip: int = 0, limit: int = 20) -> List[dict]:
+    db_query = {}
+    if category:
+        db_query.update(_category_match(category))
+    if vibe_tags:
+        db_query["ai_analysis.vibe_tags"] = {"$all": [tag.lower() for tag in vibe_tags]}
+
+    collection = await get_location_collection()
+    pipeline = [
+        _geo_near(lat, lon, radius_m, db_query),
+        {"$skip": skip},
+        {"$limit": limit},
+        {"$project": NEARBY_PROJECTION}
+    ]
+    return await collection.aggregate(pipeline).to_list(length=limit)
+
+
+async def find_nearby_ids(city: str, near: Tuple[float, float], radius_m: int, limit: int = 100) -> List[str]:
+    lat, lon = near
+    collection = await get_location_collection()
+    pipeline = [
+        _geo_near(lat, lon, radius_m, {"city": city.lower()}),
+        {"$limit": limit},
+        {"$project": {"_id": 1}}
+    ]
+    results = await collection.aggregate(pipeline).to_list(length=limit)
+    return [str(location["_id"]) for location in results]
+
+
+async def count_by_status(city: str, category: str) -> Dict[str, int]:
+    collection = await get_location_collection()
+    pipeline = [
+        {"$match": {"city": city.lower(), **_category_match(category)}},
+        {"$group": {"_id": {"$ifNull": ["$processing_status", "indexed"]}, "count": {"$sum": 1}}}
+    ]
+    return {row["_id"]: row["count"] async for row in collection.aggregate(pipeline)}
+
+
+async def count_pipeline_queue() -> Dict[str, int]:
+    # Locations waiting for analysis ('new') or indexing ('analyzed'), across all cities.
+    collection = await get_location_collection()
+    pipeline = [
+        {"$match": {"processing_status": {"$in": ["new", "analyzed"]}}},
+        {"$group": {"_id": "$processing_status", "count": {"$sum": 1}}}
+    ]
+    return {row["_id"]: row["count"] async for row in collection.aggregate(pipeline)}
+
+
+def _status_update(status: str) -> dict:
+    # pipeline.status_at.<status> is when the location entered that status;
+    # the pipeline stats measure queue waits from it.
+    return {"processing_status": status, f"pipeline.status_at.{status}": datetime.now(timezone.utc)}
+
+
+def _scraped_match(location_doc: dict) -> dict:
+    # Branches of a chain share a name, so places are matched on place_id.
+    # Rows stored before place ids were kept only match by name, and adopt
+    # the place_id of the first scrape that finds them.
+    by_name = {"name": location_doc["name"], "city": location_doc["city"]}
+    place_id = location_doc.get("place_id")
+    if not place_id:
+        return by_name
+    return {"$or": [{"place_id": place_id}, {**by_name, "place_id": {"$exists": False}}]}
+
+
+async def upsert_scraped(location_doc: dict, location_id: Optional[ObjectId] = None) -> Optional[ObjectId]:
+    # Reviews and status are only written on insert: existing locations get
+    # new reviews appended (append_reviews) so positional vector ids stay valid.
+    # A place found again by another category search keeps its first category
+    # and adds the new one to `categories`.
+    on_insert_fields = ("raw_reviews", "seen_review_ids", "processing_status", "category")
+    update = {key: value for key, value in location_doc.items() if key not in on_insert_fields + ("categories",)}
+    update["last_scraped_at"] = datetime.now(timezone.utc)
+    on_insert = {key: location_doc[key] for key in on_insert_fields if key in location_doc}
+    if "processing_status" in on_insert:
+        on_insert.update(_status_update(on_insert["processing_status"]))
+    categories = location_doc.get("categories") or [location_doc["category"]]
+    collection = await get_location_collection()
+    result = await collection.update_one(
+        {"_id": location_id} if location_id is not None else _scraped_match(location_doc),
+        {"$set": update, "$setOnInsert": on_insert, "$addToSet": {"categories": {"$each": categories}}},
+        upsert=True
+    )
+    return result.upserted_id
+
+
+async def find_fresh_place_ids(place_ids: List[str], scraped_after: datetime) -> Set[str]:
+    collection = await get_location_collection()
+    query = {"place_id": {"$in": place_ids}, "last_scraped_at": {"$gte": scraped_after}}
+    return {location["place_id"] async for location in collection.find(query, {"place_id": 1})}
+
+
+async def add_category(place_ids: List[str], category: str) -> List[dict]:
+    # Returns the locations that gained the category, as they were before, so
+    # the caller can add them to the category's vibe aggregate.
+    category = category.lower()
+    collection = await get_location_collection()
+    added = []
+    async for location in collection.find({"place_id": {"$in": place_ids}, "categories": {"$ne": category}},
+                                          AGGREGATE_PROJECTION):
+        result = await collection.update_one({"_id": location["_id"], "categories": {"$ne": category}},
+                                             {"$addToSet": {"categories": category}})
+        if result.modified_count:
+            added.append(location)
+    return added
+
+
+async def find_for_refresh(location_id) -> Optional[dict]:
+    collection = await get_location_collection()
+    return await collection.find_one({"_id": location_id}, REFRESH_PROJECTION)
+
+
+async def find_scraped_for_refresh(location_doc: dict) -> Optional[dict]:
+    collection = await get_location_collection()
+    # A row with the place_id wins over a legacy row of the same name.
+    return await collection.find_one(_scraped_match(location_doc), REFRESH_PROJECTION, sort=[("place_id", -1)])
+
+
+async def append_reviews(location_id, reviews: List[dict], review_ids: List[str], expected_count: int) -> bool:
+    # Appends after the expected_count reviews the caller read; fails (False)
+    # if someone else appended in between, so indexes never shift.
+    update = {
+        "$addToSet": {"seen_review_ids": {"$each": review_ids}},
+        "$set": {"last_scraped_at": datetime.now(timezone.utc)},
+        "$unset": {"refresh_lease_until": ""},
+    }
+    if reviews:
+        update["$push"] = {"raw_reviews": {"$each": reviews}}
+    collection = await get_location_collection()
+    result = await collection.update_one(
+        {"_id": location_id, f"raw_reviews.{expected_count}": {"$exists": False}}, update
+    )
+    return result.matched_count == 1
+
+
+async def claim_for_refresh(location_id, lease_minutes: int) -> bool:
+    now = datetime.now(timezone.utc)
+    collection = await get_location_collection()
+    result = await collection.update_one(
+        {"_id": location_id, "$or": [
+            {"refresh_lease_until": {"$exists": False}}, {"refresh_lease_until": {"$lt": now}}
+        ]},
+        {"$set": {"refresh_lease_until": now + timedelta(minutes=lease_minutes)}}
+    )
+    return result.modified_count == 1
+
+
+async def iter_refresh_candidates(scraped_before: datetime) -> AsyncIterator[dict]:
+    # Locations through the pipeline that weren't scraped since scraped_before
+    # (or never recorded a scrape time).
+    collection = await get_location_collection()
+    query = {
+        "processing_status": {"$ne": "new"},
+        "$or": [{"last_scraped_at": {"$lt": scraped_before}}, {"last_scraped_at": {"$exists": False}}],
+    }
+    async for location in collection.find(query, {"last_scraped_at": 1, "popularity": 1, "pipeline.status_at.new": 1}):
+        yield location
+
+
+async def add_retrievals(counts: Dict[str, int]):
+    collection = await get_location_collection()
+    for location_id, count in counts.items():
+        await collection.update_one({"_id": ObjectId(location_id)}, {"$inc": {"popularity.retrievals": count}})
+
+
+async def set_analysis(location_id, analysis: dict, status: Optional[str] = "analyzed") -> List[str]:
+    # Returns the vibe tags the location had before, so callers can apply the
+    # difference to the per-city vibe aggregates.
+    update = {"ai_analysis": analysis}
+    if status:
+        update.update(_status_update(status))
+    collection = await get_location_collection()
+    previous = await collection.find_one_and_update(
+        {"_id": location_id}, {"$set": update},
+        projection={"ai_analysis.vibe_tags": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    return ((previous or {}).get("ai_analysis") or {}).get("vibe_tags") or []
+
+
+async def set_status_many(location_ids: List, status: str):
+    collection = await get_location_collection()
+    await collection.update_many({"_id": {"$in": location_ids}}, {"$set": _status_update(status)})
+
+
+async def record_pipeline_stage(location_ids: List, stage: str, timing: dict,
+                                calls: Dict[str, int], failures: Dict[str, int]):
+    # Last run of each stage under pipeline.stages.<stage>; call and failure
+    # counts accumulate across runs.
+    update = {"$set": {f"pipeline.stages.{stage}": {**timing, "calls": calls, "failures": failures}}}
+    increments = {f"pipeline.calls.{stage}.{kind}": count for kind, count in calls.items()}
+    increments.update({f"pipeline.failures.{stage}.{kind}": count for kind, count in failures.items()})
+    if increments:
+        update["$inc"] = increments
+    collection = await get_location_collection()
+    await collection.update_many({"_id": {"$in": location_ids}}, update)
+
+
+async def iter_analyzed_tags() -> AsyncIterator[dict]:
+    collection = await get_location_collection()
+    query = {"ai_analysis.vibe_tags.0": {"$exists": True}}
+    async for location in collection.find(query, AGGREGATE_PROJECTION):
+        yield location
+
+
+async def iter_llm_tagged() -> AsyncIterator[dict]:
+    collection = await get_location_collection()
+    query = {"ai_analysis.vibe_tags.0": {"$exists": True}, "ai_analysis.tag_source": {"$ne": "local"}}
+    async for location in collection.find(query, INDEXING_PROJECTION):
+        yield location
+
+
+async def iter_for_dedup() -> AsyncIterator[dict]:
+    collection = await get_location_collection()
+    async for location in collection.find({}, DEDUP_PROJECTION):
+        yield location
+
+
+async def set_duplicate_marks(location_id, marks: List[Optional[int]]):
+    # marks[i] is the representative index of review i, or None.
+    update = {}
+    for index, representative in enumerate(marks):
+        if representative is None:
+            update.setdefault("$unset", {})[f"raw_reviews.{index}.duplicate_of"] = ""
+        else:
+            update.setdefault("$set", {})[f"raw_reviews.{index}.duplicate_of"] = representative
+    if update:
+        collection = await get_location_collection()
+        await collection.update_one({"_id": location_id}, update)
+
+
+async def find_without_analysis() -> List[dict]:
+    collection = await get_location_collection()
+    return await collection.find({"ai_analysis": {"$exists": False}}, ANALYSIS_PROJECTION).to_list(length=None)
+
+
+async def iter_missing_geo() -> AsyncIterator[dict]:
+    collection = await get_location_collection()
+    async for location in collection.find({"geo": {"$exists": False}}, {"coordinates": 1}):
+        yield location
+
+
+async def set_geo(location_id, geo_point: dict):
+    collection = await get_location_collection()
+    await collection.update_one({"_id": location_id}, {"$set": {"geo": geo_point}})
+
+
+async def iter_for_export(cities: Optional[List[str]] = None) -> AsyncIterator[dict]:
+    # Whole documents, grouped by city so the snapshot writer holds one city at a time.
+    collection = await get_location_collection()
+    query = {"city": {"$in": cities}} if cities else {}
+    async for location in collection.find(query).sort([("city", 1), ("_id", 1)]):
+        yield location
+
+
+async def upsert_many(documents: List[dict]):
+    if not documents:
+        return
+    collection = await get_location_collection()
+    await collection.bulk_write([ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in documents], ordered=False)
+
+
+async def replace_all(documents: List[dict]):
+    collection = await get_location_collection()
+    await collection.delete_many({})
+    if documents:
+        await collection.insert_many(documents)
@@ -1,23 +1,125 @@
 import motor.motor_asyncio
 from dotenv import load_dotenv
 import os
+from pymongo import monitoring
+
+from services.metrics import registry, Gauge, Counter
+
 load_dotenv()
 MONGO_DB_URL = os.getenv("MONGO_DB_URL")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "vibe_navigator")
+
+# Pool and timeout settings for the one client shared by the API, the
+# background pipeline and the offline scripts.
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "2"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000"))
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primaryPreferred")
+
+mongo_pool_connections = registry.register(Gauge(
+    "vibe_mongo_pool_connections", "Open connections in the Mongo pool, by server."))
+mongo_pool_checked_out = registry.register(Gauge(
+    "vibe_mongo_pool_checked_out", "Connections currently checked out of the Mongo pool, by server."))
+mongo_pool_checkout_failures = registry.register(Counter(
+    "vibe_mongo_pool_checkout_failures_total", "Failed Mongo pool checkouts, by reason."))
+mongo_pool_max_size = registry.register(Gauge(
+    "vibe_mongo_pool_max_size", "Configured maxPoolSize of the shared Mongo client."))
+
+
+class _PoolMetricsListener(monitoring.ConnectionPoolListener):
+    @staticmethod
+    def _server(event) -> str:
+        host, port = event.address
+        return f"{host}:{port}"
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_created(self, event):
+        mongo_pool_connections.inc(1, server=self._server(event))
+    def connection_ready(self, event): pass
+    def connection_closed(self, event):
+        mongo_pool_connections.inc(-1, server=self._server(event))
+    def connection_check_out_started(self, event): pass
+    def connection_check_out_failed(self, event):
+        mongo_pool_checkout_failures.inc(reason=str(event.reason))
+    def connection_checked_out(self, event):
+        mongo_pool_checked_out.inc(1, server=self._server(event))
+    def connection_checked_in(self, event):
+        mongo_pool_checked_out.inc(-1, server=self._server(event))
+
 
 class DataBase:
     client: motor.motor_asyncio.AsyncIOMotorClient = None
 
 db = DataBase()
 
+def get_client() -> motor.motor_asyncio.AsyncIOMotorClient:
+    if db.client is None:
+        db.client = motor.motor_asyncio.AsyncIOMotorClient(
+            MONGO_DB_URL,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+            waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+            readPreference=MONGO_READ_PREFERENCE,
+            event_listeners=[_PoolMetricsListener()],
+        )
+        mongo_pool_max_size.set(MONGO_MAX_POOL_SIZE)
+    return db.client
+
+def get_database():
+    return get_client()[MONGO_DB_NAME]
+
 async def get_location_collection():
-    return db.client.vibe_navigator.get_collection("locations")
+    return get_database().get_collection("locations")
+
+async def get_population_jobs_collection():
+    return get_database().get_collection("population_jobs")
+
+async def get_vibe_aggregates_collection():
+    return get_database().get_collection("vibe_aggregates")
+
+async def get_tag_prototypes_collection():
+    return get_database().get_collection("tag_prototypes")
+
+async def get_chat_sessions_collection():
+    return get_database().get_collection("chat_sessions")
 
 async def connect_to_mongo():
     print("Connecting to MongoDB...")
-    db.client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_DB_URL)
+    get_client()
     print("Connection successful.")
 
 async def close_mongo_connection():
     print("Closing MongoDB connection...")
-    db.client.close()
-    print("Connection closed.")
\ No newline at end of file
+    if db.client is not None:
+        db.client.close()
+        db.client = None
+    print("Connection closed.")
+
+def to_geo_point(coordinates: dict):
+    # GeoJSON wants [lon, lat]. The scraper stores 0/0 when it couldn't read
+    # coordinates from the URL, which must not end up in the geo index.
+    lat, lon = coordinates.get("lat", 0.0), coordinates.get("lon", 0.0)
+    if not lat and not lon:
+        return None
+    return {"type": "Point", "coordinates": [lon, lat]}
+
+async def ensure_indexes():
+    collection = await get_location_collection()
+    await collection.create_index([("geo", "2dsphere")])
+    await collection.create_index([("city", 1), ("category", 1)])
+    await collection.create_index([("city", 1), ("categories", 1)])
+    await collection.create_index([("place_id", 1)], sparse=True)
+    await collection.create_index([("processing_status", 1)])
+    sessions = await get_chat_sessions_collection()
+    await sessions.create_index([("expires_at", 1)], expireAfterSeconds=0)
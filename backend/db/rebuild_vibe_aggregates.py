@@ -0,0 +1,17 @@
+import asyncio
+
+from db.mongo import connect_to_mongo, close_mongo_connection
+from db.vibe_aggregates import rebuild_all
+
+async def rebuild_vibe_aggregates():
+
+    await connect_to_mongo()
+
+    print("Rebuilding per-city vibe aggregates from analyzed locations...")
+    slices = await rebuild_all()
+    print(f" Vibe aggregates rebuilt for {slices} city/category slices.")
+
+    await close_mongo_connection()
+
+if __name__ == "__main__":
+    asyncio.run(rebuild_vibe_aggregates())
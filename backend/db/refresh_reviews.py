@@ -0,0 +1,17 @@
+import argparse
+import asyncio
+
+from db.mongo import connect_to_mongo, close_mongo_connection
+from background_task.review_refresh import run_refresh_cycle, REFRESH_BATCH_SIZE
+
+async def refresh_reviews(limit: int):
+
+    await connect_to_mongo()
+    summary = await run_refresh_cycle(limit)
+    print(f" Refreshed {summary['refreshed']} locations, {summary['new_reviews']} new reviews.")
+    await close_mongo_connection()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape new reviews for the stalest, most popular locations.")
+    parser.add_argument("--limit", type=int, default=REFRESH_BATCH_SIZE, help="Locations to refresh.")
+    asyncio.run(refresh_reviews(parser.parse_args().limit))
@@ -1,14 +1,15 @@
-import motor.motor_asyncio
 import os
 import asyncio
 from dotenv import load_dotenv
 import google.generativeai as genai
 from pinecone import Pinecone
-from bson import ObjectId
+
+from db import location_repository
+from db.mongo import connect_to_mongo, close_mongo_connection
+from services.review_dedup import is_representative
 
 load_dotenv()
 
-MONGO_DB_URL = os.getenv("MONGO_DB_URL")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX_NAME = "vibe-navigator"
@@ -20,22 +21,12 @@ pinecone_index = pc.Index(PINECONE_INDEX_NAME)
 
 async def embed_and_index():
 
-    mongo_client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_DB_URL)
-    collection = mongo_client.vibe_navigator.locations
+    await connect_to_mongo()
 
     print("📦 Fetching reviews from MongoDB...")
-    cursor = collection.find({}, {
-        "_id": 1,
-        "name": 1,
-        "city": 1,
-        "category": 1,
-        "ai_analysis.vibe_tags": 1,
-        "raw_reviews.text": 1
-    })
-
     vectors_to_upsert = []
 
-    async for location in cursor:
+    async for location in location_repository.iter_for_indexing():
         location_id = str(location['_id'])
         location_name = location.get("name", "Unknown Location")
         city = location.get("city", "unknown").lower()
@@ -46,6 +37,8 @@ async def embed_and_index():
             review_text = review.get("text", "").strip()
             if not review_text or len(review_text.split()) < 5:
                 continue
+            if not is_representative(review):
+                continue
 
             vector_id = f"{location_id}#{review_index}"
 
@@ -61,6 +54,8 @@ async def embed_and_index():
                 }
             })
 
+    await close_mongo_connection()
+
     if not vectors_to_upsert:
         print("⚠️ No valid reviews found.")
         return
@@ -1,13 +1,15 @@
-import motor.motor_asyncio
 import os
 import asyncio
 from dotenv import load_dotenv
 import google.generativeai as genai
 import json
 
+from db import location_repository, vibe_aggregates
+from db.mongo import connect_to_mongo, close_mongo_connection
+from services.review_dedup import map_stage_lines
+
 load_dotenv()
 
-MONGO_DB_URL = os.getenv("MONGO_DB_URL")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GENERATION_MODEL = "gemini-1.5-flash-latest"
 REVIEWS_PER_BATCH = 30 
@@ -29,29 +31,26 @@ async def get_ai_response_as_json(prompt: str) -> dict:
 
 async def generate_vibe_card_data_scalable():
 
-    mongo_client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_DB_URL)
-    collection = mongo_client.vibe_navigator.locations
+    await connect_to_mongo()
 
     print("Finding locations that need AI analysis (Scalable Method)...")
-    cursor = collection.find({"ai_analysis": {"$exists": False}})
-    
-    locations_to_process = await cursor.to_list(length=None)
+    locations_to_process = await location_repository.find_without_analysis()
     if not locations_to_process:
         print(" All locations already have AI analysis.")
+        await close_mongo_connection()
         return
 
     print(f"Found {len(locations_to_process)} locations to process.")
 
     for location in locations_to_process:
         print(f"\n  > Analyzing '{location['name']}' with {len(location['raw_reviews'])} reviews...")
-        all_reviews = location['raw_reviews']
+        review_lines = map_stage_lines(location['raw_reviews'])
         
         partial_summaries = []
-        print(f"    - Mapping reviews in batches of {REVIEWS_PER_BATCH}...")
+        print(f"    - Mapping {len(review_lines)} distinct reviews in batches of {REVIEWS_PER_BATCH}...")
         
-        for i in range(0, len(all_reviews), REVIEWS_PER_BATCH):
-            batch_reviews = all_reviews[i:i+REVIEWS_PER_BATCH]
-            review_texts = "\n".join([f"- {r['text']}" for r in batch_reviews])
+        for i in range(0, len(review_lines), REVIEWS_PER_BATCH):
+            review_texts = "\n".join(review_lines[i:i+REVIEWS_PER_BATCH])
 
             map_prompt = f"""
                         Analyze the following batch of reviews for "{location['name']}".
@@ -112,16 +111,16 @@ async def generate_vibe_card_data_scalable():
         final_analysis = await get_ai_response_as_json(reduce_prompt)
 
         if final_analysis:
-            await collection.update_one(
-                {"_id": location["_id"]},
-                {"$set": {"ai_analysis": final_analysis}}
-            )
+            # LLM-tagged locations are what db.build_tag_prototypes learns from.
+            final_analysis["tag_source"] = "llm"
+            previous_tags = await location_repository.set_analysis(location["_id"], final_analysis, status=None)
+            await vibe_aggregates.apply_analysis_change(location, previous_tags, final_analysis.get("vibe_tags"))
             print(f"     Successfully updated '{location['name']}' with scalable vibe data.")
         else:
             print(f"     Failed to generate final analysis for '{location['name']}'.")
 
     print("\n Vibe Card processing complete.")
-    mongo_client.close()
+    await close_mongo_connection()
 
 if __name__ == "__main__":
     asyncio.run(generate_vibe_card_data_scalable())
\ No newline at end of file
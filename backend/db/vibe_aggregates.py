@@ -0,0 +1,155 @@
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+from db import location_repository
+from db.mongo import get_vibe_aggregates_collection
+
+# Materialized vibe-tag frequencies per (city, category), one document each:
+#
+#   {_id: "pune|cafe", city, category, location_count,
+#    tags: {"cozy": 12, ...}, representatives: {"cozy": [{location_id, name}, ...]}}
+#
+# analyze_locations applies the tag difference of every analysis it writes;
+# rebuild_all() recomputes everything from the locations collection.
+#
+# A location counts in every slice its slice queries match: its primary
+# `category` plus each entry of `categories` (see
+# location_repository._category_match). Callers that add a category to an
+# analyzed location apply it with apply_category_added.
+
+REPRESENTATIVES_PER_TAG = 5
+
+
+def aggregate_id(city: str, category: str) -> str:
+    return f"{city.lower()}|{category.lower()}"
+
+
+def location_categories(location: dict) -> List[str]:
+    categories = [location.get("category"), *(location.get("categories") or [])]
+    return list(dict.fromkeys(category.lower() for category in categories if category))
+
+
+def normalize_tags(tags: Optional[Iterable[str]]) -> List[str]:
+    # Tags become field names, so '.' and a leading '$' can't survive.
+    normalized = []
+    for tag in tags or []:
+        if not isinstance(tag, str):
+            continue
+        tag = tag.strip().lower().replace(".", "-").lstrip("$")
+        if tag and tag not in normalized:
+            normalized.append(tag)
+    return normalized
+
+
+async def apply_analysis_change(location: dict, old_tags: Optional[Iterable[str]], new_tags: Optional[Iterable[str]]):
+    old_tags, new_tags = normalize_tags(old_tags), normalize_tags(new_tags)
+    added = [tag for tag in new_tags if tag not in old_tags]
+    removed = [tag for tag in old_tags if tag not in new_tags]
+    location_delta = int(bool(new_tags)) - int(bool(old_tags))
+    if not added and not removed and not location_delta:
+        return
+
+    for category in location_categories(location):
+        await _apply_to_slice(location, category, added, removed, location_delta)
+
+
+async def apply_category_added(location: dict, category: str):
+    # The location now also matches `category`'s slice; `location` is the
+    # document from before the category was added.
+    tags = normalize_tags((location.get("ai_analysis") or {}).get("vibe_tags"))
+    if tags and category.lower() not in location_categories(location):
+        await _apply_to_slice(location, category.lower(), tags, [], 1)
+
+
+async def _apply_to_slice(location: dict, category: str, added: List[str], removed: List[str], location_delta: int):
+    city = location["city"].lower()
+    slice_id = aggregate_id(city, category)
+    increments = {f"tags.{tag}": 1 for tag in added}
+    increments.update({f"tags.{tag}": -1 for tag in removed})
+    if location_delta:
+        increments["location_count"] = location_delta
+
+    representative = {"location_id": str(location["_id"]), "name": location.get("name", "")}
+    collection = await get_vibe_aggregates_collection()
+    await collection.update_one(
+        {"_id": slice_id},
+        {"$inc": increments,
+         "$set": {"updated_at": datetime.now(timezone.utc)},
+         "$setOnInsert": {"city": city, "category": category}},
+        upsert=True
+    )
+    if removed:
+        await collection.update_one(
+            {"_id": slice_id},
+            {"$pull": {f"representatives.{tag}": {"location_id": representative["location_id"]} for tag in removed}}
+        )
+    for tag in added:
+        # Only fills free representative slots; the filter keeps it idempotent.
+        await collection.update_one(
+            {"_id": slice_id,
+             f"representatives.{tag}.{REPRESENTATIVES_PER_TAG - 1}": {"$exists": False},
+             f"representatives.{tag}.location_id": {"$ne": representative["location_id"]}},
+            {"$push": {f"representatives.{tag}": representative}}
+        )
+
+
+async def get_aggregate(city: str, category: str) -> Optional[dict]:
+    collection = await get_vibe_aggregates_collection()
+    return await collection.find_one({"_id": aggregate_id(city, category)})
+
+
+def summarize(aggregate: Optional[dict], city: str, category: str, limit: Optional[int] = None) -> dict:
+    aggregate = aggregate or {}
+    location_count = aggregate.get("location_count", 0)
+    representatives = aggregate.get("representatives", {})
+    counts = sorted(
+        ((tag, count) for tag, count in aggregate.get("tags", {}).items() if count > 0),
+        key=lambda item: (-item[1], item[0])
+    )
+    if limit:
+        counts = counts[:limit]
+    return {
+        "city": city.lower(),
+        "category": category.lower(),
+        "location_count": location_count,
+        "tags": [
+            {
+                "tag": tag,
+                "count": count,
+                "share": round(count / location_count, 3) if location_count else 0.0,
+                "locations": representatives.get(tag, []),
+            }
+            for tag, count in counts
+        ],
+        "updated_at": aggregate.get("updated_at"),
+    }
+
+
+async def rebuild_all() -> int:
+    slices: Dict[str, dict] = {}
+    async for location in location_repository.iter_analyzed_tags():
+        tags = normalize_tags(location["ai_analysis"]["vibe_tags"])
+        if not tags:
+            continue
+        city = location.get("city", "").lower()
+        for category in location_categories(location):
+            entry = slices.setdefault(aggregate_id(city, category), {
+                "city": city, "category": category, "location_count": 0,
+                "tags": Counter(), "representatives": {},
+            })
+            entry["location_count"] += 1
+            entry["tags"].update(tags)
+            for tag in tags:
+                representatives = entry["representatives"].setdefault(tag, [])
+                if len(representatives) < REPRESENTATIVES_PER_TAG:
+                    representatives.append({"location_id": str(location["_id"]), "name": location.get("name", "")})
+
+    now = datetime.now(timezone.utc)
+    collection = await get_vibe_aggregates_collection()
+    for slice_id, entry in slices.items():
+        await collection.replace_one(
+            {"_id": slice_id}, {**entry, "tags": dict(entry["tags"]), "updated_at": now}, upsert=True
+        )
+    await collection.delete_many({"_id": {"$nin": list(slices)}})
+    return len(slices)
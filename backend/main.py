@@ -1,9 +1,21 @@
-from fastapi import FastAPI
+import asyncio
+import os
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from db.mongo import connect_to_mongo, close_mongo_connection 
+from db import location_repository
+from db.mongo import db, connect_to_mongo, close_mongo_connection, ensure_indexes
+from services.clients import warm_up, check_dependencies
+from services.lexical_index import lexical_index
+from services.location_cache import location_cache
+from services.metrics import registry, request_duration, response_bytes, start_request_timing, server_timing_header
+from services.profiling import profile_store, RequestProfile, loop_block_detector, LOOP_BLOCK_DETECTOR
 
 from routers.vibes import router as vibe_router 
+from routers.pipeline import router as pipeline_router
+from routers.profiles import router as profiles_router
 
 app = FastAPI(
     title="Vibe Navigator API",
@@ -16,18 +28,90 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"], 
     allow_headers=["*"], 
+    expose_headers=["Server-Timing", "X-Profile-Id"],
 )
 
+@app.middleware("http")
+async def add_server_timing(request: Request, call_next):
+    stages = start_request_timing()
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    request_duration.observe(elapsed, path=path, method=request.method)
+    content_length = response.headers.get("content-length")
+    if content_length is not None:
+        response_bytes.set(int(content_length), path=path)
+
+    stages.append(("total", elapsed))
+    response.headers["Server-Timing"] = server_timing_header(stages)
+    return response
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    # Registered after add_server_timing, so it wraps it: the profile covers the whole request.
+    profile_store.requests_in_flight += 1
+    trigger = profile_store.should_profile(request.headers)
+    try:
+        if trigger is None:
+            return await call_next(request)
+
+        profile = RequestProfile(request.method, request.url.path, trigger, profile_store.requests_in_flight)
+        profile_store.active += 1
+        status_code = 500
+        try:
+            profile.start()
+            response = await call_next(request)
+            status_code = response.status_code
+        finally:
+            profile_store.active -= 1
+            files = profile.stop(status_code)
+            await profile_store.save(profile, files)
+        response.headers["X-Profile-Id"] = profile.profile_id
+        return response
+    finally:
+        profile_store.requests_in_flight -= 1
+
 @app.on_event("startup")
 async def startup_event():
     await connect_to_mongo()
+    await ensure_indexes()
+    await lexical_index.build(location_repository.iter_for_lexical_index())
+    location_cache.start()
+    if LOOP_BLOCK_DETECTOR:
+        loop_block_detector.start()
+    if os.getenv("REVIEW_REFRESH_ENABLED", "false").lower() in ("1", "true", "yes"):
+        # Imported here: the refresher pulls in selenium.
+        from background_task.review_refresh import refresh_scheduler
+        app.state.refresh_task = asyncio.create_task(refresh_scheduler())
+    if os.getenv("WARM_UP_CLIENTS", "false").lower() in ("1", "true", "yes"):
+        await warm_up()
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    await location_cache.stop()
+    await loop_block_detector.stop()
+    refresh_task = getattr(app.state, "refresh_task", None)
+    if refresh_task is not None:
+        refresh_task.cancel()
     await close_mongo_connection()
 
 app.include_router(vibe_router)
+app.include_router(pipeline_router)
+app.include_router(profiles_router)
 
 @app.api_route("/", methods=["GET", "HEAD"], tags=["Health Check"])
 async def read_root():
     return {"status": "Vibe Navigator API is vibing!"}
+
+@app.get("/ready", tags=["Health Check"])
+async def readiness():
+    dependencies = await check_dependencies(db.client)
+    ready = all(result["ok"] for result in dependencies.values())
+    return JSONResponse({"ready": ready, "dependencies": dependencies}, status_code=200 if ready else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Health Check"])
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -2,6 +2,7 @@ from pydantic import BaseModel, Field
 from bson import ObjectId
 from pydantic_core import core_schema
 from typing import Optional, List, Dict,Any
+from datetime import datetime
 
 class PyObjectId(ObjectId):
     @classmethod
@@ -42,6 +43,7 @@ class Review(BaseModel):
     text: str
     source: str
     author: Optional[str] = None
+    review_id: Optional[str] = None
 
 class AIAnalysis(BaseModel):
     vibe_summary: str
@@ -63,6 +65,26 @@ class Location(BaseModel):
         arbitrary_types_allowed = True
         json_encoders = {ObjectId: str} 
 
+class NearbyLocation(Location):
+    distance_m: float
+
+class TagLocation(BaseModel):
+    location_id: str
+    name: str
+
+class VibeTagCount(BaseModel):
+    tag: str
+    count: int
+    share: float
+    locations: List[TagLocation] = []
+
+class VibeTagsResponse(BaseModel):
+    city: str
+    category: str
+    location_count: int
+    tags: List[VibeTagCount]
+    updated_at: Optional[datetime] = None
+
 class ChatMessage(BaseModel):
     role: str 
     parts: str
@@ -71,6 +93,11 @@ class VibeAgentRequest(BaseModel):
     query: str
     city: str
     chat_history: Optional[List[ChatMessage]] = [] 
+    # None: stateless. "new" (or ""): start a server-side session; its id is
+    # returned and, sent back on later turns, replaces chat_history.
+    session_id: Optional[str] = None
+    lat: Optional[float] = Field(None, ge=-90, le=90)
+    lon: Optional[float] = Field(None, ge=-180, le=180)
 
 class SourceDocument(BaseModel):
     location_name: str
@@ -80,6 +107,7 @@ class SourceDocument(BaseModel):
 class VibeAgentResponse(BaseModel):
     reply: str
     sources: List[SourceDocument] 
+    session_id: Optional[str] = None
 
 class TourPlannerRequest(BaseModel):
     city: str
@@ -0,0 +1,28 @@
+from fastapi import APIRouter
+
+from db import location_repository
+from db.mongo import get_population_jobs_collection
+from services.pipeline_stats import pipeline_stats, WINDOWS
+
+router = APIRouter(
+    prefix="/pipeline",
+    tags=["Pipeline"]
+)
+
+
+@router.get("/stats")
+async def get_pipeline_stats():
+    # Stage latencies and throughput are per API worker (in-memory windows);
+    # queue depth comes from MongoDB and is shared.
+    queue = await location_repository.count_pipeline_queue()
+    jobs = await get_population_jobs_collection()
+    running_jobs = await jobs.count_documents({"status": "running"})
+    return {
+        "windows": list(WINDOWS),
+        "queue": {
+            "awaiting_analysis": queue.get("new", 0),
+            "awaiting_indexing": queue.get("analyzed", 0),
+            "running_population_jobs": running_jobs,
+        },
+        "stages": pipeline_stats.snapshot(),
+    }
@@ -0,0 +1,58 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response
+
+import orjson
+
+from services.profiling import profile_store, token_matches, PROFILE_TOKEN
+
+router = APIRouter(
+    prefix="/debug/profiles",
+    tags=["Debug"]
+)
+
+
+def _check_token(request: Request):
+    if not PROFILE_TOKEN:
+        raise HTTPException(status_code=404, detail="Profiles are disabled. Set PROFILE_TOKEN to enable them.")
+    if not token_matches(request.headers.get("x-profile-token")):
+        raise HTTPException(status_code=403, detail="A valid X-Profile-Token header is required.")
+
+
+@router.get("")
+async def list_profiles(request: Request, limit: int = Query(50, ge=1, le=500)):
+    _check_token(request)
+    return {"profiles": await profile_store.list(limit)}
+
+
+@router.get("/{profile_id}")
+async def get_profile(
+    request: Request,
+    profile_id: str,
+    format: str = Query("json", pattern="^(json|html|text|folded)$",
+                        description="json, html (pyinstrument only), text or folded (flame graph input)")
+):
+    _check_token(request)
+    if format == "html":
+        content = await profile_store.read(profile_id, ".html")
+        if content is None:
+            raise HTTPException(status_code=404, detail="No HTML profile with that id.")
+        return HTMLResponse(content)
+
+    content = await profile_store.read(profile_id)
+    if content is None:
+        raise HTTPException(status_code=404, detail="No profile with that id.")
+    if format == "json":
+        return Response(content, media_type="application/json")
+
+    profile = orjson.loads(content)
+    if format == "folded":
+        return PlainTextResponse("\n".join(profile.get("folded", [])))
+    if "text" in profile:
+        return PlainTextResponse(profile["text"])
+    lines = [f"{profile['method']} {profile['path']} -> {profile['status_code']} in {profile['duration_ms']} ms "
+             f"({profile['samples']} samples, {profile['concurrent_requests']} concurrent requests)", "",
+             "  self%  total%  function"]
+    lines += [f"{row['self_pct']:7.1f} {row['total_pct']:7.1f}  {row['function']}" for row in profile["top_functions"]]
+    for block in profile["loop_blocks"]:
+        lines += ["", f"Loop blocked {block['blocked_ms']} ms:"] + block["stack"]
+    return PlainTextResponse("\n".join(lines))
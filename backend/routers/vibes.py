@@ -1,9 +1,13 @@
-from fastapi import APIRouter, HTTPException, Query, Body
-from typing import List
-from models.place import Location, VibeAgentRequest, VibeAgentResponse, TourPlannerRequest
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, Body, Request, Response
+from typing import List, Optional
+from models.place import Location, NearbyLocation, VibeAgentRequest, VibeAgentResponse, TourPlannerRequest, VibeTagsResponse
 
-from db.mongo import get_location_collection
-from services import gemini_rag 
+from db import location_repository, vibe_aggregates
+from services import gemini_rag, chat_sessions
+from services.metrics import timed
+from services.snapshot_cache import snapshot_cache, snapshot_requests
+from services.admission import chat_admission, tour_admission
+from background_task.population import try_start_population, get_population_status
 
 router = APIRouter(
     prefix="/vibes",
@@ -13,52 +17,112 @@ router = APIRouter(
 
 @router.get("/locations", response_model=List[Location])
 async def get_locations_by_city_and_category(
+    request: Request,
+    background_tasks: BackgroundTasks,
     city: str = Query(..., description="City to search in, e.g., 'pune'"),
     category: str = Query(..., description="Category of the place, e.g., 'cafe'")
 ):
-    location_collection = await get_location_collection()
-    db_query = {
-        "city": city.lower(),
-        "category": category.lower()
-    }
-
-    locations_cursor = location_collection.find(db_query).limit(50)
-    results = await locations_cursor.to_list(length=50)
-
-    if results:
-        print(f"Found {len(results)} cached locations for {city}/{category}.")
-        return results
+    snapshot = snapshot_cache.get(city, category)
+    if snapshot is not None:
+        snapshot_requests.inc(outcome="hit")
     else:
-        print(f"No cached data for {city}/{category}. Returning empty list.")
-        return []
+        snapshot_requests.inc(outcome="miss")
+        with timed("mongo"):
+            results = await location_repository.find_visible_in_slice(city, category)
+
+        with timed("serialize"):
+            snapshot = snapshot_cache.build(city, category, results)
+
+        if results:
+            print(f"Found {len(results)} cached locations for {city}/{category}.")
+        else:
+            print(f"No cached data for {city}/{category}. Returning empty list.")
+            await try_start_population(city, category, background_tasks)
+
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if snapshot.etag in {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}:
+        snapshot_requests.inc(outcome="not_modified")
+        return Response(status_code=304, headers=headers)
+
+    encoding, body = snapshot.pick_encoding(request.headers.get("accept-encoding", ""))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@router.get("/locations/status")
+async def get_locations_population_status(
+    city: str = Query(..., description="City to search in, e.g., 'pune'"),
+    category: str = Query(..., description="Category of the place, e.g., 'cafe'")
+):
+    return await get_population_status(city, category)
+
+@router.get("/tags", response_model=VibeTagsResponse)
+async def get_vibe_tags(
+    city: str = Query(..., description="City to search in, e.g., 'pune'"),
+    category: str = Query(..., description="Category of the place, e.g., 'cafe'"),
+    limit: Optional[int] = Query(None, ge=1, le=200, description="Only the most common tags")
+):
+    with timed("mongo"):
+        aggregate = await vibe_aggregates.get_aggregate(city, category)
+    return vibe_aggregates.summarize(aggregate, city, category, limit)
+
+@router.get("/locations/nearby", response_model=List[NearbyLocation])
+async def get_nearby_locations(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_m: int = Query(2000, gt=0, le=50000, description="Search radius in meters"),
+    category: Optional[str] = Query(None, description="Category of the place, e.g., 'cafes'"),
+    vibe_tags: List[str] = Query([], description="Only places tagged with all of these vibes"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=50)
+):
+    with timed("mongo"):
+        results = await location_repository.find_nearby(
+            lat, lon, radius_m, category=category, vibe_tags=vibe_tags,
+            skip=(page - 1) * page_size, limit=page_size
+        )
+
+    print(f"Found {len(results)} locations within {radius_m}m of ({lat}, {lon}).")
+    return results
 
 @router.post("/agent/chat", response_model=VibeAgentResponse)
-async def chat_with_vibe_agent(request: VibeAgentRequest = Body(...)):
+async def chat_with_vibe_agent(http_request: Request, request: VibeAgentRequest = Body(...)):
 
     if not request.query or not request.city:
         raise HTTPException(status_code=400, detail="Query and city are required.")
     
-    history_as_dicts = [msg.dict() for msg in request.chat_history]
+    use_session = request.session_id is not None
+    resume = use_session and request.session_id not in ("", "new")
+    session = await chat_sessions.load_session(request.session_id) if resume else None
+    # Stateless clients still send the history themselves; an expired
+    # session starts over with whatever the client sent.
+    history_as_dicts = [] if session else [msg.model_dump() for msg in request.chat_history or []]
 
-    response_data = await gemini_rag.generate_conversational_response(
-        user_query=request.query,
-        city=request.city,
-        chat_history=history_as_dicts
-    )
+    async with chat_admission.slot(http_request):
+        response_data = await gemini_rag.generate_conversational_response(
+            user_query=request.query,
+            city=request.city,
+            chat_history=history_as_dicts,
+            near=(request.lat, request.lon) if request.lat is not None and request.lon is not None else None,
+            session=session,
+            use_session=use_session
+        )
     
     return response_data
 
 
 
 @router.post("/agent/tour", response_model=VibeAgentResponse)
-async def create_vibe_tour(request: TourPlannerRequest = Body(...)):
+async def create_vibe_tour(http_request: Request, request: TourPlannerRequest = Body(...)):
 
     if not request.vibe_tags:
         raise HTTPException(status_code=400, detail="At least one vibe tag is required.")
 
-    response_data = await gemini_rag.generate_tour_plan(
-        city=request.city,
-        vibe_tags=request.vibe_tags
-    )
+    async with tour_admission.slot(http_request):
+        response_data = await gemini_rag.generate_tour_plan(
+            city=request.city,
+            vibe_tags=request.vibe_tags
+        )
     
     return response_data
\ No newline at end of file
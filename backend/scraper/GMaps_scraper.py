@@ -1,3 +1,4 @@
+import os
 import time
 import json
 from selenium import webdriver
@@ -7,6 +8,8 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 import re
 
+from place_ids import canonical_place_id, VisitedCache
+
 TARGET_CITIES = {
     "pune": {"categories": ["cafes", "parks", "bars", "bookstores", "historic places", "restaurants"]},
     "mumbai": {"categories": ["cafes", "parks", "bars", "bookstores", "historic places", "beach"]},
@@ -19,6 +22,10 @@ TARGET_CITIES = {
 LOCATIONS_PER_CATEGORY = 5
 REVIEWS_PER_LOCATION = 15
 OUTPUT_FILE = "data.json"
+# Places opened within this window (this run or an earlier one) aren't loaded
+# again; their record from the previous OUTPUT_FILE is reused.
+VISITED_FILE = "visited_places.json"
+VISITED_MAX_AGE_HOURS = 24 * 7
 
 def get_driver():
     options = webdriver.ChromeOptions()
@@ -101,9 +108,11 @@ def scrape_google_maps_reviews(driver):
 
     return reviews_data
 
-def scrape_google_maps(driver, query):
+def scrape_google_maps(driver, query, city, category, matched, previous, visited):
+    # Adds every place the search returns to `matched` (place id -> record),
+    # opening only the places that weren't visited recently.
     print(f"\nScraping Google Maps for: '{query}'")
-    locations = []
+    page_loads_saved = 0
     search_url = f"https://www.google.com/maps/search/{query.replace(' ', '+')}?hl=en"
     driver.get(search_url)
 
@@ -115,11 +124,27 @@ def scrape_google_maps(driver, query):
         
         result_links = driver.find_elements(By.XPATH, f"{result_panel_xpath}//a[contains(@href, 'google.com/maps/place/')]")
         location_urls = [link.get_attribute('href') for link in result_links if link.get_attribute('href')]
-        unique_urls = list(dict.fromkeys(location_urls)) 
-
-        print(f"  Found {len(unique_urls)} potential locations. Processing top {LOCATIONS_PER_CATEGORY}...")
+        # Several links can point at the same place; keep one per place id.
+        candidates = {}
+        for url in location_urls:
+            candidates.setdefault(canonical_place_id(url) or url, url)
+
+        print(f"  Found {len(candidates)} potential locations. Processing top {LOCATIONS_PER_CATEGORY}...")
+
+        for place_id, url in list(candidates.items())[:LOCATIONS_PER_CATEGORY]:
+            if place_id in matched:
+                if category not in matched[place_id]["categories"]:
+                    matched[place_id]["categories"].append(category)
+                print(f"\n  > Already scraped this run: {matched[place_id]['name']} (+{category})")
+                page_loads_saved += 1
+                continue
+            if visited.is_fresh(place_id, VISITED_MAX_AGE_HOURS):
+                page_loads_saved += 1
+                if place_id in previous:
+                    matched[place_id] = {**previous[place_id], "city": city, "category": category, "categories": [category]}
+                    print(f"\n  > Fresh from an earlier run: {previous[place_id]['name']}")
+                continue
 
-        for url in unique_urls[:LOCATIONS_PER_CATEGORY]:
             try:
                 driver.get(url)
                 name = WebDriverWait(driver, 10).until(EC.visibility_of_element_located((By.XPATH, "//h1"))).text
@@ -135,9 +160,14 @@ def scrape_google_maps(driver, query):
 
                 gmaps_reviews = scrape_google_maps_reviews(driver)
                 print(f"    Scraped {len(gmaps_reviews)} reviews.")
+                visited.mark(canonical_place_id(url))
 
                 if gmaps_reviews:
-                    locations.append({"name": name, "address": address, "coordinates": {"lat": lat, "lon": lon}, "raw_reviews": gmaps_reviews})
+                    matched[place_id] = {
+                        "name": name, "address": address, "coordinates": {"lat": lat, "lon": lon},
+                        "raw_reviews": gmaps_reviews, "city": city, "category": category, "categories": [category],
+                        "place_id": canonical_place_id(url), "source_url": url,
+                    }
                 else:
                     print("    Skipping location due to no reviews found.")
                 
@@ -146,24 +176,32 @@ def scrape_google_maps(driver, query):
                 continue
     except Exception as e:
         print(f"An error occurred during search for '{query}': {e}")
-        
-    return locations
+
+    if page_loads_saved:
+        print(f"  Skipped {page_loads_saved} page loads for places already scraped.")
+
+def load_previous_output():
+    if not os.path.exists(OUTPUT_FILE):
+        return {}
+    with open(OUTPUT_FILE, 'r', encoding='utf-8') as f:
+        return {loc["place_id"]: loc for loc in json.load(f) if loc.get("place_id")}
 
 if __name__ == "__main__":
-    master_list = []
+    previous = load_previous_output()
+    visited = VisitedCache(VISITED_FILE)
+    matched = {}
     driver = get_driver()
     try:
         for city, data in TARGET_CITIES.items():
             for category in data['categories']:
                 query = f"{category} in {city}"
-                scraped_locations = scrape_google_maps(driver, query)
-                for loc in scraped_locations:
-                    loc['city'], loc['category'] = city, category
-                master_list.extend(scraped_locations)
+                scrape_google_maps(driver, query, city, category, matched, previous, visited)
+                visited.save()
                 print(f"--- Finished scraping for '{query}' ---")
     finally:
         driver.quit()
 
+    master_list = list(matched.values())
     with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
         json.dump(master_list, f, indent=4, ensure_ascii=False)
     print(f"\n All done! Scraped {len(master_list)} locations and saved to {OUTPUT_FILE}")
\ No newline at end of file
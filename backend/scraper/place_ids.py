@@ -0,0 +1,60 @@
+import json
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+from urllib.parse import unquote, urlsplit
+
+# One id per place, whatever search produced the /maps/place/ link. The
+# feature id (!1s0x...:0x...) is in every result link; the ChIJ place id and
+# name + coordinates are fallbacks for links that don't carry it.
+
+_FEATURE_ID_RE = re.compile(r"!1s(0x[0-9a-f]+:0x[0-9a-f]+)", re.IGNORECASE)
+_PLACE_ID_RE = re.compile(r"!19s(ChIJ[\w-]+)")
+_COORDS_RE = re.compile(r"!3d(-?\d+\.\d+)!4d(-?\d+\.\d+)")
+_AT_COORDS_RE = re.compile(r"/@(-?\d+\.\d+),(-?\d+\.\d+)")
+
+
+def canonical_place_id(url: Optional[str]) -> Optional[str]:
+    if not url or "/maps/place/" not in url:
+        return None
+    url = unquote(url)
+    match = _FEATURE_ID_RE.search(url)
+    if match:
+        return match.group(1).lower()
+    match = _PLACE_ID_RE.search(url)
+    if match:
+        return match.group(1)
+    match = _COORDS_RE.search(url) or _AT_COORDS_RE.search(url)
+    if not match:
+        return None
+    name = urlsplit(url).path.split("/maps/place/", 1)[1].split("/", 1)[0]
+    slug = re.sub(r"[^a-z0-9]+", "-", name.replace("+", " ").lower()).strip("-")
+    return f"{slug}@{float(match.group(1)):.5f},{float(match.group(2)):.5f}"
+
+
+class VisitedCache:
+    # place id -> when it was last opened, kept in a JSON file across runs.
+
+    def __init__(self, path: str):
+        self.path = path
+        self.visited: Dict[str, str] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.visited = json.load(f)
+
+    def is_fresh(self, place_id: Optional[str], max_age_hours: float) -> bool:
+        visited_at = self.visited.get(place_id) if place_id else None
+        if visited_at is None:
+            return False
+        return datetime.now(timezone.utc) - datetime.fromisoformat(visited_at) < timedelta(hours=max_age_hours)
+
+    def mark(self, place_id: Optional[str]):
+        if place_id:
+            self.visited[place_id] = datetime.now(timezone.utc).isoformat()
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.visited, f, indent=2)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,160 @@
+import asyncio
+import ipaddress
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Tuple
+
+from fastapi import HTTPException, Request
+
+from services.metrics import registry, Gauge, Counter
+
+# Per-endpoint concurrency limit with a bounded, deadline-limited wait queue,
+# plus a per-client token bucket. Excess load is rejected immediately with
+# 429/503 and Retry-After instead of queueing behind the Gemini quota.
+
+admission_in_flight = registry.register(Gauge(
+    "vibe_admission_in_flight", "Requests currently admitted per endpoint."))
+admission_queue_depth = registry.register(Gauge(
+    "vibe_admission_queue_depth", "Requests waiting for a slot per endpoint."))
+admission_limit = registry.register(Gauge(
+    "vibe_admission_limit", "Configured concurrency and queue limits per endpoint."))
+admission_rejected = registry.register(Counter(
+    "vibe_admission_rejected_total", "Requests rejected by admission control, by endpoint and reason."))
+
+MAX_TRACKED_CLIENTS = 10000
+
+# Rate limits are keyed on the peer address. X-Forwarded-For is only read when
+# the peer is one of TRUSTED_PROXIES (comma-separated IPs or CIDRs), and then
+# the client is the right-most entry not added by a trusted proxy; anything to
+# its left was sent by the client and can be forged.
+TRUSTED_PROXIES = [ipaddress.ip_network(p.strip(), strict=False)
+                   for p in os.getenv("TRUSTED_PROXIES", "").split(",") if p.strip()]
+
+
+def _is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in TRUSTED_PROXIES)
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, burst: int):
+        self.rate = rate_per_second
+        self.burst = burst
+        self.buckets: Dict[str, Tuple[float, float]] = {}
+
+    def try_acquire(self, client: str) -> float:
+        # Returns 0 when a token was taken, otherwise the seconds until one is available.
+        now = time.monotonic()
+        tokens, last = self.buckets.get(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        if tokens >= 1:
+            self.buckets[client] = (tokens - 1, now)
+            self._prune(now)
+            return 0.0
+        self.buckets[client] = (tokens, now)
+        return (1 - tokens) / self.rate
+
+    def _prune(self, now: float):
+        if len(self.buckets) <= MAX_TRACKED_CLIENTS:
+            return
+        # A bucket that would have refilled completely carries no state.
+        full_after = self.burst / self.rate
+        self.buckets = {k: v for k, v in self.buckets.items() if now - v[1] < full_after}
+
+
+class AdmissionController:
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout_s: float,
+                 rate_per_minute: int, burst: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout_s = queue_timeout_s
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.rate_limiter = TokenBucket(rate_per_minute / 60, burst) if rate_per_minute > 0 else None
+        admission_limit.set(max_concurrency, endpoint=name, limit="concurrency")
+        admission_limit.set(max_queue, endpoint=name, limit="queue")
+
+    def _reject(self, status_code: int, reason: str, retry_after: float):
+        admission_rejected.inc(endpoint=self.name, reason=reason)
+        raise HTTPException(
+            status_code=status_code,
+            detail=f"The vibe agent is busy ({reason}). Please retry shortly.",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    @staticmethod
+    def client_id(request: Request) -> str:
+        peer = request.client.host if request.client else "unknown"
+        if not _is_trusted_proxy(peer):
+            return peer
+        hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+        for hop in reversed(hops):
+            if not _is_trusted_proxy(hop):
+                return hop
+        return hops[0] if hops else peer
+
+    def _update_gauges(self):
+        admission_in_flight.set(self.in_flight, endpoint=self.name)
+        admission_queue_depth.set(self.waiting, endpoint=self.name)
+
+    @asynccontextmanager
+    async def slot(self, request: Request):
+        # A request turned away for a full queue doesn't spend a rate token.
+        if self.semaphore.locked() and self.waiting >= self.max_queue:
+            self._reject(503, "queue_full", self.queue_timeout_s)
+
+        if self.rate_limiter is not None:
+            wait = self.rate_limiter.try_acquire(self.client_id(request))
+            if wait:
+                self._reject(429, "rate_limited", wait)
+
+        if self.semaphore.locked():
+            self.waiting += 1
+            self._update_gauges()
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), timeout=self.queue_timeout_s)
+            except asyncio.TimeoutError:
+                self._reject(503, "queue_timeout", self.queue_timeout_s)
+            finally:
+                self.waiting -= 1
+                self._update_gauges()
+        else:
+            await self.semaphore.acquire()
+
+        self.in_flight += 1
+        self._update_gauges()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.semaphore.release()
+            self._update_gauges()
+
+
+chat_admission = AdmissionController(
+    "chat",
+    max_concurrency=_env_int("CHAT_MAX_CONCURRENCY", 8),
+    max_queue=_env_int("CHAT_MAX_QUEUE", 32),
+    queue_timeout_s=_env_int("CHAT_QUEUE_TIMEOUT_S", 5),
+    rate_per_minute=_env_int("CHAT_RATE_LIMIT_PER_MINUTE", 30),
+    burst=_env_int("CHAT_RATE_LIMIT_BURST", 10),
+)
+tour_admission = AdmissionController(
+    "tour",
+    max_concurrency=_env_int("TOUR_MAX_CONCURRENCY", 4),
+    max_queue=_env_int("TOUR_MAX_QUEUE", 16),
+    queue_timeout_s=_env_int("TOUR_QUEUE_TIMEOUT_S", 5),
+    rate_per_minute=_env_int("TOUR_RATE_LIMIT_PER_MINUTE", 10),
+    burst=_env_int("TOUR_RATE_LIMIT_BURST", 5),
+)
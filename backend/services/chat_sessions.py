@@ -0,0 +1,83 @@
+import os
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+from bson import Binary
+
+from db.mongo import get_chat_sessions_collection
+from services.metrics import registry, Counter
+
+# Server-side /vibes/agent/chat sessions. The history lives in MongoDB as
+# compact [role, text] pairs, capped at CHAT_SESSION_MAX_MESSAGES and expired
+# by a TTL index, so clients only send their session id. Each session also
+# keeps the evidence of its last retrieval with the query vector it was
+# retrieved for; a follow-up close enough to that query reuses it instead of
+# searching again.
+
+CHAT_SESSION_TTL_MINUTES = int(os.getenv("CHAT_SESSION_TTL_MINUTES", "60"))
+CHAT_SESSION_MAX_MESSAGES = int(os.getenv("CHAT_SESSION_MAX_MESSAGES", "40"))
+SESSION_EVIDENCE_SIMILARITY = float(os.getenv("SESSION_EVIDENCE_SIMILARITY", "0.8"))
+STORED_SOURCE_FIELDS = ("location_id", "location_name", "review_text", "author", "coordinates")
+
+chat_sessions = registry.register(Counter(
+    "vibe_chat_sessions_total", "Chat requests by session outcome (created, resumed, expired)."))
+session_evidence = registry.register(Counter(
+    "vibe_chat_session_evidence_total", "Follow-up turns that reused session evidence or retrieved again."))
+
+
+def new_session_id() -> str:
+    return secrets.token_urlsafe(16)
+
+
+async def load_session(session_id: str) -> Optional[dict]:
+    collection = await get_chat_sessions_collection()
+    # The TTL monitor only runs once a minute.
+    session = await collection.find_one({"_id": session_id, "expires_at": {"$gt": datetime.now(timezone.utc)}})
+    chat_sessions.inc(outcome="resumed" if session else "expired")
+    return session
+
+
+def history_for_model(session: Optional[dict]) -> List[Dict[str, str]]:
+    return [{"role": role, "parts": text} for role, text in (session or {}).get("history", [])]
+
+
+def reusable_evidence(session: Optional[dict], city: str, query_embedding: Optional[List[float]]) -> Optional[List[dict]]:
+    evidence = (session or {}).get("evidence")
+    if not evidence or query_embedding is None or evidence.get("city") != city.lower():
+        return None
+    previous = np.frombuffer(evidence["vector"], dtype=np.float32)
+    current = np.asarray(query_embedding, dtype=np.float32)
+    norms = np.linalg.norm(previous) * np.linalg.norm(current)
+    similarity = float(previous @ current / norms) if norms else 0.0
+    reused = similarity >= SESSION_EVIDENCE_SIMILARITY
+    session_evidence.inc(outcome="reused" if reused else "retrieved")
+    return evidence["sources"] if reused else None
+
+
+async def append_turn(session_id: Optional[str], city: str, query: str, reply: str,
+                      query_embedding: Optional[List[float]] = None, sources: Optional[List[dict]] = None,
+                      prior_history: Optional[List[Dict[str, str]]] = None) -> str:
+    # Creates the session when session_id is None, seeded with any history the
+    # client sent itself. New evidence replaces the stored one.
+    if session_id is None:
+        session_id = new_session_id()
+        chat_sessions.inc(outcome="created")
+    now = datetime.now(timezone.utc)
+    messages = [[message["role"], message["parts"]] for message in prior_history or []]
+    messages += [["user", query], ["model", reply]]
+    update = {
+        "$push": {"history": {"$each": messages, "$slice": -CHAT_SESSION_MAX_MESSAGES}},
+        "$set": {"city": city.lower(), "updated_at": now, "expires_at": now + timedelta(minutes=CHAT_SESSION_TTL_MINUTES)},
+        "$setOnInsert": {"created_at": now},
+    }
+    if query_embedding is not None and sources:
+        update["$set"]["evidence"] = {
+            "city": city.lower(),
+            "vector": Binary(np.asarray(query_embedding, dtype=np.float32).tobytes()),
+            "sources": [{field: source.get(field) for field in STORED_SOURCE_FIELDS} for source in sources],
+        }
+    collection = await get_chat_sessions_collection()
+    await collection.update_one({"_id": session_id}, update, upsert=True)
+    return session_id
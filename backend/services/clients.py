@@ -0,0 +1,108 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Dict
+
+import google.generativeai as genai
+from dotenv import load_dotenv
+from pinecone import Pinecone
+
+# Gemini and Pinecone clients are created on first use and shared by the API
+# and the background tasks, so importing a module no longer costs a network
+# round trip (pc.Index resolves the index host) or fails on a missing key.
+
+load_dotenv()
+
+PINECONE_INDEX_NAME = "vibe-navigator"
+EMBEDDING_MODEL = "models/embedding-001"
+GENERATION_MODEL = "gemini-1.5-flash-latest"
+
+# /ready probes: each dependency check gets READY_CHECK_TIMEOUT_MS, and a
+# passing Gemini check (a real get_model API call) is reused for
+# GEMINI_CHECK_TTL_SECONDS so frequent probes don't spend quota.
+READY_CHECK_TIMEOUT_MS = int(os.getenv("READY_CHECK_TIMEOUT_MS", "2000"))
+GEMINI_CHECK_TTL_SECONDS = float(os.getenv("GEMINI_CHECK_TTL_SECONDS", "60"))
+
+_lock = threading.Lock()
+_genai_configured = False
+_pinecone_index = None
+_generation_models: Dict[str, "genai.GenerativeModel"] = {}
+_gemini_checked_at = None
+
+
+def _require_env(name: str) -> str:
+    value = os.getenv(name)
+    if not value:
+        raise ValueError(f"Environment variable {name} is missing.")
+    return value
+
+
+def configure_genai():
+    global _genai_configured
+    if _genai_configured:
+        return
+    with _lock:
+        if not _genai_configured:
+            genai.configure(api_key=_require_env("GEMINI_API_KEY"))
+            _genai_configured = True
+
+
+def get_generation_model(model_name: str = GENERATION_MODEL) -> "genai.GenerativeModel":
+    configure_genai()
+    model = _generation_models.get(model_name)
+    if model is None:
+        model = _generation_models[model_name] = genai.GenerativeModel(model_name)
+    return model
+
+
+def get_pinecone_index():
+    global _pinecone_index
+    if _pinecone_index is not None:
+        return _pinecone_index
+    with _lock:
+        if _pinecone_index is None:
+            pc = Pinecone(api_key=_require_env("PINECONE_API_KEY"))
+            _pinecone_index = pc.Index(PINECONE_INDEX_NAME)
+    return _pinecone_index
+
+
+async def warm_up():
+    start = time.perf_counter()
+    configure_genai()
+    await asyncio.to_thread(get_pinecone_index)
+    print(f"Clients warmed up in {time.perf_counter() - start:.2f}s.")
+
+
+async def _timed_check(check) -> Dict:
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(check(), timeout=READY_CHECK_TIMEOUT_MS / 1000)
+        return {"ok": True, "latency_ms": round((time.perf_counter() - start) * 1000, 1)}
+    except asyncio.TimeoutError:
+        return {"ok": False, "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+                "error": f"timed out after {READY_CHECK_TIMEOUT_MS}ms"}
+    except Exception as e:
+        return {"ok": False, "latency_ms": round((time.perf_counter() - start) * 1000, 1), "error": str(e)}
+
+
+async def check_dependencies(mongo_client) -> Dict[str, Dict]:
+    async def check_mongo():
+        await mongo_client.admin.command("ping")
+
+    async def check_pinecone():
+        index = await asyncio.to_thread(get_pinecone_index)
+        await asyncio.to_thread(index.describe_index_stats)
+
+    async def check_gemini():
+        global _gemini_checked_at
+        configure_genai()
+        if _gemini_checked_at is not None and time.monotonic() - _gemini_checked_at < GEMINI_CHECK_TTL_SECONDS:
+            return
+        await asyncio.to_thread(genai.get_model, EMBEDDING_MODEL)
+        _gemini_checked_at = time.monotonic()
+
+    results = await asyncio.gather(
+        _timed_check(check_mongo), _timed_check(check_pinecone), _timed_check(check_gemini)
+    )
+    return dict(zip(("mongo", "pinecone", "gemini"), results))
@@ -0,0 +1,134 @@
+import asyncio
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+from services.metrics import registry, Counter, Histogram
+
+try:
+    from google.api_core.exceptions import BadRequest
+    INPUT_ERRORS = (ValueError, TypeError, BadRequest)
+except ImportError:
+    INPUT_ERRORS = (ValueError, TypeError)
+
+# Query embeddings requested within EMBED_BATCH_WINDOW_MS of each other go
+# upstream as one embed_content call with a list of texts (at most
+# EMBED_BATCH_MAX_SIZE; a full batch is sent right away). A batch rejected
+# for its input (400 / ValueError) is bisected, at most
+# EMBED_BISECT_CONCURRENCY calls at a time, so one bad text only fails its
+# own requests. Any other error is treated as upstream trouble: the batch is
+# retried once after EMBED_BATCH_RETRY_BACKOFF_MS and then fails as a whole,
+# rather than multiplying calls against a struggling API.
+
+EMBED_BATCHING = os.getenv("EMBED_BATCHING", "true").lower() in ("1", "true", "yes")
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "100"))
+EMBED_BISECT_CONCURRENCY = int(os.getenv("EMBED_BISECT_CONCURRENCY", "2"))
+EMBED_BATCH_RETRY_BACKOFF_MS = float(os.getenv("EMBED_BATCH_RETRY_BACKOFF_MS", "200"))
+
+embed_batch_size = registry.register(Histogram(
+    "vibe_embed_batch_size", "Texts per batched embedding call.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 100)))
+embed_batch_calls = registry.register(Counter(
+    "vibe_embed_batch_calls_total", "Upstream embedding calls made by the batcher, by kind (batch, retry, split) and outcome."))
+
+
+class EmbeddingBatcher:
+    def __init__(self, name: str, embed_many: Callable[[List[str]], List[List[float]]],
+                 window_ms: float = EMBED_BATCH_WINDOW_MS, max_size: int = EMBED_BATCH_MAX_SIZE):
+        # embed_many is blocking (the Gemini SDK); it runs in a worker thread.
+        self.name = name
+        self.embed_many = embed_many
+        self.window_seconds = window_ms / 1000
+        self.max_size = max_size
+        self.pending: List[Tuple[str, asyncio.Future]] = []
+        self.requests = 0
+        self.upstream_calls = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    async def embed(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((text, future))
+        self.requests += 1
+        if len(self.pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # Waiters that were cancelled meanwhile don't need a vector.
+        batch = [(text, future) for text, future in self.pending if not future.done()]
+        self.pending = []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _call(self, texts: List[str], kind: str) -> List[List[float]]:
+        self.upstream_calls += 1
+        try:
+            vectors = await asyncio.to_thread(self.embed_many, texts)
+            if len(vectors) != len(texts):
+                raise RuntimeError(f"expected {len(texts)} embeddings, got {len(vectors)}")
+        except Exception:
+            embed_batch_calls.inc(batcher=self.name, kind=kind, outcome="error")
+            raise
+        embed_batch_calls.inc(batcher=self.name, kind=kind, outcome="ok")
+        return vectors
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]):
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        embed_batch_size.observe(len(texts), batcher=self.name)
+        try:
+            results = dict(zip(texts, await self._call(texts, "batch")))
+        except INPUT_ERRORS as e:
+            if len(texts) == 1:
+                results = {texts[0]: e}
+            else:
+                print(f"Batched embedding of {len(texts)} texts was rejected ({e}); bisecting it.")
+                results = await self._bisect(texts, asyncio.Semaphore(EMBED_BISECT_CONCURRENCY))
+        except Exception as e:
+            print(f"Batched embedding of {len(texts)} texts failed ({e}); retrying the batch once.")
+            await asyncio.sleep(EMBED_BATCH_RETRY_BACKOFF_MS / 1000)
+            try:
+                results = dict(zip(texts, await self._call(texts, "retry")))
+            except Exception as retry_error:
+                results = {text: retry_error for text in texts}
+
+        for text, future in batch:
+            if future.done():
+                continue
+            result = results[text]
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _bisect(self, texts: List[str], limit: asyncio.Semaphore) -> Dict[str, object]:
+        middle = len(texts) // 2
+        halves = await asyncio.gather(self._embed_part(texts[:middle], limit), self._embed_part(texts[middle:], limit))
+        return {**halves[0], **halves[1]}
+
+    async def _embed_part(self, texts: List[str], limit: asyncio.Semaphore) -> Dict[str, object]:
+        # The slot is released before splitting further, so nested halves
+        # can't wait on their parent's slot.
+        async with limit:
+            try:
+                return dict(zip(texts, await self._call(texts, "split")))
+            except Exception as e:
+                error = e
+        if len(texts) == 1 or not isinstance(error, INPUT_ERRORS):
+            return {text: error for text in texts}
+        return await self._bisect(texts, limit)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "upstream_calls": self.upstream_calls,
+            "pending": len(self.pending),
+        }
@@ -0,0 +1,135 @@
+import os
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Retrieval over-fetches, then this stage picks a short, diverse set of
+# reviews for the prompt: near-duplicates are collapsed, MMR balances rank
+# against similarity to what's already chosen, and the result is trimmed to
+# an approximate token budget.
+
+EVIDENCE_TOKEN_BUDGET = int(os.getenv("EVIDENCE_TOKEN_BUDGET", "1200"))
+MAX_TOKENS_PER_REVIEW = 160
+MMR_LAMBDA = 0.7
+DUPLICATE_VECTOR_SIMILARITY = 0.97
+DUPLICATE_TEXT_SIMILARITY = 0.8
+SAME_PLACE_SIMILARITY = 0.5
+CHARS_PER_TOKEN = 4
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def _trim_to_tokens(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    trimmed = text[:max_tokens * CHARS_PER_TOKEN].rsplit(" ", 1)[0]
+    return trimmed.rstrip(" .,;…") + "…"
+
+
+def trim_review_text(text: str) -> str:
+    return _trim_to_tokens(text, MAX_TOKENS_PER_REVIEW)
+
+
+def _word_set(text: str) -> set:
+    return set(_WORD_RE.findall(text.lower()))
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _similarity_matrix(reviews: List[Dict]) -> np.ndarray:
+    n = len(reviews)
+    word_sets = [_word_set(r["review_text"]) for r in reviews]
+    sims = np.zeros((n, n), dtype=np.float32)
+
+    vector_rows = [i for i, r in enumerate(reviews) if r.get("vector")]
+    if vector_rows:
+        vectors = np.asarray([reviews[i]["vector"] for i in vector_rows], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        sims[np.ix_(vector_rows, vector_rows)] = vectors @ vectors.T
+
+    # Lexical-only hits have no vector; fall back to word overlap for any pair
+    # that involves one of them.
+    has_vector = {i for i in vector_rows}
+    for i in range(n):
+        for j in range(i + 1, n):
+            if i in has_vector and j in has_vector:
+                continue
+            sims[i, j] = sims[j, i] = _jaccard(word_sets[i], word_sets[j])
+    return sims
+
+
+def _is_duplicate(sims: np.ndarray, i: int, j: int, reviews: List[Dict]) -> bool:
+    if reviews[i]["review_text"].strip() == reviews[j]["review_text"].strip():
+        return True
+    if reviews[i].get("vector") and reviews[j].get("vector"):
+        return sims[i, j] >= DUPLICATE_VECTOR_SIMILARITY
+    return sims[i, j] >= DUPLICATE_TEXT_SIMILARITY
+
+
+def pack_evidence(
+    reviews: List[Dict],
+    max_items: int = 10,
+    token_budget: Optional[int] = EVIDENCE_TOKEN_BUDGET,
+    mmr_lambda: float = MMR_LAMBDA,
+    trim: bool = True
+) -> List[Dict]:
+    # `reviews` is expected in ranked order; the rank stands in for relevance.
+    # The budget always counts trimmed reviews; trim=False returns the full
+    # text for callers that also show the reviews as sources and trim them
+    # (trim_review_text) only when building the prompt.
+    reviews = [r for r in reviews if r.get("review_text")]
+    if not reviews:
+        return []
+
+    n = len(reviews)
+    sims = _similarity_matrix(reviews)
+    relevance = 1.0 - np.arange(n, dtype=np.float32) / n
+
+    # Same-place pairs count as at least somewhat similar so MMR spreads
+    # picks across places before it piles onto one.
+    for i in range(n):
+        for j in range(i + 1, n):
+            if reviews[i]["location_name"] == reviews[j]["location_name"]:
+                sims[i, j] = sims[j, i] = max(sims[i, j], SAME_PLACE_SIMILARITY)
+
+    candidates = []
+    for i in range(n):
+        if not any(_is_duplicate(sims, i, kept, reviews) for kept in candidates):
+            candidates.append(i)
+
+    selected: List[int] = []
+    remaining = list(candidates)
+    tokens_used = 0
+    packed = []
+
+    while remaining and len(selected) < max_items:
+        if selected:
+            redundancy = sims[np.ix_(remaining, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining), dtype=np.float32)
+        scores = mmr_lambda * relevance[remaining] - (1 - mmr_lambda) * redundancy
+        best = remaining.pop(int(np.argmax(scores)))
+
+        review = {k: v for k, v in reviews[best].items() if k != "vector"}
+        trimmed = trim_review_text(review["review_text"])
+        if trim:
+            review["review_text"] = trimmed
+        cost = estimate_tokens(trimmed)
+        if token_budget is not None and tokens_used + cost > token_budget:
+            if packed:
+                continue
+        tokens_used += cost
+        selected.append(best)
+        packed.append(review)
+
+    return packed
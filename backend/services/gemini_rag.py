@@ -1,67 +1,103 @@
+import asyncio
+import time
 import google.generativeai as genai
 import os
 from dotenv import load_dotenv
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from bson import ObjectId
-from pinecone import Pinecone
 
-from db.mongo import get_location_collection
+from db import location_repository
+from services.clients import (
+    configure_genai, get_generation_model, get_pinecone_index, EMBEDDING_MODEL, GENERATION_MODEL
+)
+from services import chat_sessions
+from services.embed_batcher import EmbeddingBatcher, EMBED_BATCHING
+from services.lexical_index import lexical_index
+from services.location_cache import location_cache
+from services import place_popularity
+from services.reply_cache import reply_cache
+from services.evidence_packer import pack_evidence, trim_review_text
+from services.metrics import timed, prompt_chars, evidence_items
+from services.route_planner import plan_route, MAX_TOUR_STOPS
+from services.single_flight import SingleFlight, normalize_text
 
 load_dotenv()
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-PINECONE_INDEX_NAME = "vibe-navigator"
+RETRIEVAL_BUDGET_MS = int(os.getenv("RETRIEVAL_BUDGET_MS", "1500"))
+RRF_K = 60
+FLIGHT_BUDGET_STEP_MS = 100
+EVIDENCE_OVERFETCH_K = 30
+NEAR_BIAS_RADIUS_M = int(os.getenv("NEAR_BIAS_RADIUS_M", "3000"))
+# Which retrievers run and get fused: "vector" (Pinecone), "lexical" (BM25).
+RETRIEVAL_BACKENDS = tuple(b.strip() for b in os.getenv("RETRIEVAL_BACKENDS", "vector,lexical").split(",") if b.strip())
 
-if not all([GEMINI_API_KEY, PINECONE_API_KEY, PINECONE_INDEX_NAME]):
-    raise ValueError("One or more environment variables (Gemini, Pinecone) are missing.")
+retrieval_flights = SingleFlight("retrieval")
+tour_flights = SingleFlight("tour")
 
-genai.configure(api_key=GEMINI_API_KEY)
-pc = Pinecone(api_key=PINECONE_API_KEY)
-pinecone_index = pc.Index(PINECONE_INDEX_NAME)
 
-EMBEDDING_MODEL = "models/embedding-001"
-GENERATION_MODEL = "gemini-1.5-flash-latest"
+def _embed_queries(texts: List[str]) -> List[List[float]]:
+    configure_genai()
+    embed_response = genai.embed_content(
+        model=EMBEDDING_MODEL,
+        content=texts,
+        task_type="RETRIEVAL_QUERY"
+    )
+    return embed_response['embedding']
 
-async def find_relevant_reviews_with_pinecone(
-    query: str,
-    city: str,
-    category: Optional[str] = None,
-    top_k: int = 5
-) -> List[Dict]:
 
-    try:
-        embed_response = genai.embed_content(
-            model=EMBEDDING_MODEL,
-            content=query,
-            task_type="RETRIEVAL_QUERY"
-        )
-        query_embedding = embed_response['embedding']
-    except Exception as e:
-        print(f"Embedding generation failed: {e}")
-        return []
+query_embeddings = EmbeddingBatcher("query", _embed_queries)
 
-    metadata_filter = {"city": city.lower()}
-    if category:
-        metadata_filter["category"] = category.lower()
 
-    try:
-        pinecone_results = pinecone_index.query(
+async def _embed_query(query: str) -> List[float]:
+    with timed("embed"):
+        if EMBED_BATCHING:
+            return await query_embeddings.embed(query)
+        return (await asyncio.to_thread(_embed_queries, [query]))[0]
+
+
+async def _vector_search(
+    query: str,
+    metadata_filter: Dict,
+    top_k: int,
+    query_embedding: Optional[List[float]] = None
+) -> List[Dict]:
+    if query_embedding is None:
+        query_embedding = await _embed_query(query)
+
+    pinecone_index = await asyncio.to_thread(get_pinecone_index)
+    with timed("pinecone"):
+        pinecone_results = await asyncio.to_thread(
+            pinecone_index.query,
             vector=query_embedding,
             top_k=top_k,
-            include_metadata=True, 
+            include_metadata=True,
+            include_values=True,
             filter=metadata_filter
         )
-    except Exception as e:
-        print(f"Pinecone query failed: {e}")
-        return []
+    return pinecone_results.get('matches', [])
+
+
+def _fuse_rankings(*rankings: List[str], top_k: int) -> List[str]:
+    # Reciprocal rank fusion: robust to the two backends using unrelated score scales.
+    fused_scores = {}
+    for ranking in rankings:
+        for rank, vector_id in enumerate(ranking):
+            fused_scores[vector_id] = fused_scores.get(vector_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return sorted(fused_scores, key=fused_scores.get, reverse=True)[:top_k]
 
+
+async def _nearby_location_ids(city: str, near: Tuple[float, float], radius_m: int = NEAR_BIAS_RADIUS_M) -> List[str]:
+    with timed("geo"):
+        return await location_repository.find_nearby_ids(city, near, radius_m)
+
+
+async def _hydrate_reviews(vector_ids: List[str], vectors_by_id: Optional[Dict[str, List[float]]] = None) -> List[Dict]:
     location_ids_to_fetch = set()
     review_ids_map = {}
 
-    for match in pinecone_results.get('matches', []):
+    for vector_id in vector_ids:
         try:
-            location_id, review_index_str = match['id'].split('#')
+            location_id, review_index_str = vector_id.split('#')
             review_index = int(review_index_str)
 
             location_ids_to_fetch.add(ObjectId(location_id))
@@ -74,39 +110,191 @@ async def find_relevant_reviews_with_pinecone(
     if not location_ids_to_fetch:
         return []
 
-    location_collection = await get_location_collection()
-    retrieved_reviews = []
+    reviews_by_id = {}
 
-    cursor = location_collection.find({"_id": {"$in": list(location_ids_to_fetch)}})
+    with timed("mongo"):
+        locations = await location_cache.get_many(list(location_ids_to_fetch))
+    place_popularity.record_retrievals(review_ids_map)
 
-    async for location in cursor:
+    for location in locations:
         loc_id_str = str(location['_id'])
         for index_to_get in review_ids_map.get(loc_id_str, []):
             try:
                 review = location['raw_reviews'][index_to_get]
-                retrieved_reviews.append({
+                vector_id = f"{loc_id_str}#{index_to_get}"
+                reviews_by_id[vector_id] = {
+                    "location_id": loc_id_str,
                     "location_name": location['name'],
                     "review_text": review['text'],
-                    "author": review.get('author', 'N/A')
-                })
+                    "author": review.get('author', 'N/A'),
+                    "coordinates": location.get('coordinates')
+                }
+                if vectors_by_id is not None:
+                    reviews_by_id[vector_id]["vector"] = vectors_by_id.get(vector_id)
             except (IndexError, KeyError):
                 continue
 
-    return retrieved_reviews
+    # Keep the ranking order rather than Mongo's cursor order.
+    return [reviews_by_id[vector_id] for vector_id in vector_ids if vector_id in reviews_by_id]
+
+
+async def find_relevant_reviews_with_pinecone(
+    query: str,
+    city: str,
+    category: Optional[str] = None,
+    top_k: int = 5,
+    budget_ms: Optional[int] = None,
+    query_embedding: Optional[List[float]] = None,
+    include_vectors: bool = False,
+    near: Optional[Tuple[float, float]] = None,
+    backends: Tuple[str, ...] = RETRIEVAL_BACKENDS
+) -> List[Dict]:
+
+    key = (normalize_text(query), city.lower(), (category or "").lower(), top_k, include_vectors, near, backends)
+    # A caller only shares a retrieval started with at least its own vector
+    # budget, so a spent or tiny budget can't hand lexical-only results to
+    # callers that asked for the full one. Budgets are compared in
+    # FLIGHT_BUDGET_STEP_MS steps so chat turns with a few ms less left still
+    # coalesce.
+    budget = budget_ms if budget_ms is not None else RETRIEVAL_BUDGET_MS
+    budget = budget // FLIGHT_BUDGET_STEP_MS if budget > 0 else -1
+    return await retrieval_flights.do(key, lambda: _find_relevant_reviews(
+        query, city, category, top_k, budget_ms, query_embedding, include_vectors, near, backends
+    ), budget=budget)
+
+
+async def _find_relevant_reviews(
+    query: str,
+    city: str,
+    category: Optional[str] = None,
+    top_k: int = 5,
+    budget_ms: Optional[int] = None,
+    query_embedding: Optional[List[float]] = None,
+    include_vectors: bool = False,
+    near: Optional[Tuple[float, float]] = None,
+    backends: Tuple[str, ...] = RETRIEVAL_BACKENDS
+) -> List[Dict]:
+
+    metadata_filter = {"city": city.lower()}
+    if category:
+        metadata_filter["category"] = category.lower()
+
+    budget_seconds = (budget_ms if budget_ms is not None else RETRIEVAL_BUDGET_MS) / 1000
+    vector_task = None
+    # A caller that already spent the budget (e.g. on a timed-out query
+    # embedding) gets lexical results instead of a second embed.
+    if "vector" in backends and budget_seconds > 0:
+        vector_task = asyncio.create_task(_vector_search(query, metadata_filter, top_k, query_embedding))
+    nearby_task = asyncio.create_task(_nearby_location_ids(city, near)) if near is not None else None
+
+    # The lexical index is in-process and answers in milliseconds, so it runs
+    # while the embedding + Pinecone round trip is in flight.
+    lexical_ids = []
+    if "lexical" in backends:
+        with timed("lexical"):
+            lexical_ids = [doc_id for doc_id, _ in lexical_index.search(query, city, category, top_k)]
+
+    vector_matches = None
+    if vector_task is not None:
+        try:
+            vector_matches = await asyncio.wait_for(vector_task, timeout=budget_seconds)
+        except asyncio.TimeoutError:
+            print(f"Vector retrieval exceeded {budget_seconds:.2f}s budget. Falling back to lexical results.")
+        except Exception as e:
+            print(f"Vector retrieval failed: {e}. Falling back to lexical results.")
+
+    vector_ids = [match['id'] for match in vector_matches or []]
+    rankings = [ranking for ranking in (vector_ids, lexical_ids) if ranking]
+
+    if nearby_task is not None:
+        # Location bias: candidates at places near the user form an extra
+        # ranking ordered by distance, so fusion lifts them without dropping
+        # strong matches further away.
+        try:
+            nearby_rank = {location_id: rank for rank, location_id in enumerate(await nearby_task)}
+        except Exception as e:
+            print(f"Nearby lookup failed: {e}. Continuing without location bias.")
+            nearby_rank = {}
+        candidates = list(dict.fromkeys(vector_ids + lexical_ids))
+        near_ranking = sorted(
+            (c for c in candidates if c.split('#')[0] in nearby_rank),
+            key=lambda c: nearby_rank[c.split('#')[0]]
+        )
+        if near_ranking:
+            rankings.append(near_ranking)
+
+    if len(rankings) > 1:
+        ranked_ids = _fuse_rankings(*rankings, top_k=top_k)
+    else:
+        ranked_ids = rankings[0][:top_k] if rankings else []
+
+    if not ranked_ids:
+        return []
+
+    vectors_by_id = None
+    if include_vectors:
+        vectors_by_id = {match['id']: match.get('values') for match in vector_matches or []}
+
+    return await _hydrate_reviews(ranked_ids, vectors_by_id)
 
 async def generate_conversational_response(
     user_query: str,
     city: str,
     category: Optional[str] = None,
-    chat_history: List[Dict[str, str]] = []
+    chat_history: List[Dict[str, str]] = [],
+    near: Optional[Tuple[float, float]] = None,
+    session: Optional[dict] = None,
+    use_session: bool = False
 ) -> dict:
-
-    context_reviews = await find_relevant_reviews_with_pinecone(
-        query=f"{user_query} in {city}",
-        city=city,
-        category=category,
-        top_k=10
-    )
+    # With a server-side session its stored history replaces chat_history,
+    # and the reply carries the session id to send with the next turn. A new
+    # session is only created when the client opted in (use_session).
+
+    retrieval_query = f"{user_query} in {city}"
+    query_embedding = None
+    session_id = session["_id"] if session else None
+    if session:
+        chat_history = chat_sessions.history_for_model(session)
+
+    # The query vector serves the reply cache, the session evidence check and
+    # the retrieval itself, all within one RETRIEVAL_BUDGET_MS.
+    deadline = time.monotonic() + RETRIEVAL_BUDGET_MS / 1000
+    try:
+        query_embedding = await asyncio.wait_for(_embed_query(retrieval_query), timeout=RETRIEVAL_BUDGET_MS / 1000)
+    except Exception as e:
+        print(f"Query embedding failed: {e}")
+
+    # First-turn answers don't depend on any history, so near-identical
+    # openers in the same city can share one reply.
+    use_reply_cache = not chat_history and not category and near is None and query_embedding is not None
+    if use_reply_cache:
+        cached_response = reply_cache.lookup(city, query_embedding)
+        if cached_response is not None:
+            print(f"Reply cache hit for '{user_query}' in {city}.")
+            if use_session:
+                session_id = await chat_sessions.append_turn(
+                    session_id, city, user_query, cached_response["reply"], query_embedding, cached_response["sources"])
+            return {**cached_response, "session_id": session_id}
+
+    context_reviews = None
+    if session and near is None:
+        context_reviews = chat_sessions.reusable_evidence(session, city, query_embedding)
+        if context_reviews is not None:
+            print(f"Reusing session evidence for follow-up '{user_query}'.")
+    fresh_evidence = context_reviews is None
+    if fresh_evidence:
+        retrieved_reviews = await find_relevant_reviews_with_pinecone(
+            query=retrieval_query,
+            city=city,
+            category=category,
+            top_k=EVIDENCE_OVERFETCH_K,
+            budget_ms=max(0, (deadline - time.monotonic()) * 1000),
+            query_embedding=query_embedding,
+            include_vectors=True,
+            near=near
+        )
+        with timed("pack"):
+            context_reviews = pack_evidence(retrieved_reviews, max_items=10, trim=False)
 
     system_prompt = f"""
         You are 'Vibe Navigator', a friendly, witty, and super knowledgeable friend who knows the city of {city} inside out.
@@ -123,33 +311,66 @@ async def generate_conversational_response(
 
     if context_reviews:
         evidence_str = "\n".join(
-            [f"- From a review for '{r['location_name']}': \"{r['review_text']}\"" for r in context_reviews]
+            [f"- From a review for '{r['location_name']}': \"{trim_review_text(r['review_text'])}\"" for r in context_reviews]
         )
         evidence_prompt = f"\n\n**Retrieved Evidence to use for your response:**\n{evidence_str}"
     else:
         evidence_prompt = "\n\n**Retrieved Evidence:**\nNo specific reviews found for this query. Rely on the chat history or general knowledge, but state that you couldn't find a specific vibe."
 
     full_prompt = system_prompt + evidence_prompt
+    prompt_chars.set(len(full_prompt), endpoint="chat")
+    evidence_items.set(len(context_reviews), endpoint="chat")
 
     try:
+        configure_genai()
         model = genai.GenerativeModel(GENERATION_MODEL, system_instruction=full_prompt)
         chat_session = model.start_chat(history=chat_history)
-        response = await chat_session.send_message_async(user_query)
+        with timed("generate"):
+            response = await chat_session.send_message_async(user_query)
     except Exception as e:
         print(f"Gemini generation failed: {e}")
         return {
             "reply": "Sorry, I couldn't generate a response at this time.",
-            "sources": context_reviews
+            "sources": context_reviews,
+            "session_id": session_id
         }
 
-    return {
+    response_data = {
         "reply": response.text,
         "sources": context_reviews
     }
+    if use_reply_cache and context_reviews:
+        reply_cache.store(city, query_embedding, response_data)
+
+    if use_session:
+        session_id = await chat_sessions.append_turn(
+            session_id, city, user_query, response.text,
+            query_embedding if fresh_evidence else None, context_reviews if fresh_evidence else None,
+            prior_history=None if session else chat_history
+        )
+    return {**response_data, "session_id": session_id}
+
+
+def _order_tour_stops(candidates: List[Dict]) -> List[Dict]:
+    # Places the scraper couldn't geolocate (0/0) can't be routed; they only
+    # fill in when too few located candidates are left.
+    located = [c for c in candidates if c["coordinates"].get("lat") or c["coordinates"].get("lon")]
+    unlocated = sorted((c for c in candidates if c not in located), key=lambda c: c["score"], reverse=True)
+
+    stops = plan_route(located, max_stops=MAX_TOUR_STOPS) if len(located) >= 2 else located
+    for candidate in unlocated[:max(0, MAX_TOUR_STOPS - len(stops))]:
+        stops.append(dict(candidate, leg_km=None))
+    return stops
 
 
 async def generate_tour_plan(city: str, vibe_tags: List[str]) -> dict:
 
+    key = (city.lower(), tuple(sorted({normalize_text(tag) for tag in vibe_tags})))
+    return await tour_flights.do(key, lambda: _generate_tour_plan(city, vibe_tags))
+
+
+async def _generate_tour_plan(city: str, vibe_tags: List[str]) -> dict:
+
     print(f"Generating tour plan for {city} with vibes: {vibe_tags}")
     
     candidate_locations = {}
@@ -159,18 +380,41 @@ async def generate_tour_plan(city: str, vibe_tags: List[str]) -> dict:
         query = f"A place in {city} with a '{tag}' vibe"
         print(f"  > Retrieving candidates for vibe: '{tag}'")
         
-        reviews = await find_relevant_reviews_with_pinecone(query=query, city=city, top_k=10)
+        retrieved_reviews = await find_relevant_reviews_with_pinecone(
+            query=query, city=city, top_k=EVIDENCE_OVERFETCH_K, include_vectors=True
+        )
+        with timed("pack"):
+            reviews = pack_evidence(retrieved_reviews, max_items=10, token_budget=None, trim=False)
         all_source_reviews.extend(reviews)
         
+        seen_for_tag = []
         for review in reviews:
-
-            if review['location_name'] not in candidate_locations:
-                candidate_locations[review['location_name']] = f"It has a '{tag}' vibe, as one review mentions: \"{review['review_text']}\""
+            location_id = review['location_id']
+            if location_id in seen_for_tag:
+                continue
+            seen_for_tag.append(location_id)
+
+            candidate = candidate_locations.setdefault(location_id, {
+                "name": review['location_name'],
+                "coordinates": review.get('coordinates') or {},
+                "score": 0.0,
+                "reasons": []
+            })
+            # Places that rank high for several of the selected vibes score highest.
+            candidate["score"] += 1.0 / len(seen_for_tag)
+            candidate["reasons"].append(f"It has a '{tag}' vibe, as one review mentions: \"{trim_review_text(review['review_text'])}\"")
 
     if not candidate_locations:
         return {"reply": "I'm sorry, I couldn't find enough spots with those vibes to build a tour. Try a different combination!", "sources": []}
 
-    ingredients_str = "\n".join([f"- **{name}**: {reason}" for name, reason in candidate_locations.items()])
+    with timed("route"):
+        stops = _order_tour_stops(list(candidate_locations.values()))
+
+    ingredients_str = "\n".join(
+        f"{n}. **{stop['name']}**" + (f" ({stop['leg_km']} km from the previous stop)" if stop.get('leg_km') else "")
+        + ": " + " ".join(stop['reasons'])
+        for n, stop in enumerate(stops, start=1)
+    )
 
     prompt = f"""
             You are 'Vibe Navigator', a warm and enthusiastic AI city tour concierge who crafts personalized, story-driven day plans. Your personality is friendly, creative, and a bit poetic — like a passionate local friend who knows the city inside out.
@@ -179,7 +423,7 @@ async def generate_tour_plan(city: str, vibe_tags: List[str]) -> dict:
 
             **User's Selected Vibes:** {', '.join(vibe_tags)}
 
-            **Available Locations to Choose From (Your Ingredients):**
+            **Your Stops, Already Ordered by Route (Your Ingredients):**
             {ingredients_str}
 
             **How to Craft the Tour Plan:**
@@ -189,7 +433,7 @@ async def generate_tour_plan(city: str, vibe_tags: List[str]) -> dict:
             - “For lunch, find a quiet spot at...”  
             - “As evening falls, feel the lively buzz of...”
 
-            2. **Use the Ingredients:** Include at least 2-3 of the provided locations. Decide the best order to keep the narrative exciting and balanced.
+            2. **Use the Ingredients:** Visit the stops in the order given — it has been planned to avoid criss-crossing the city. You may skip a stop if it doesn't fit, but don't reorder them.
 
             3. **Ground Your Recommendations:** For every spot you mention, weave in insights from real user reviews — quoting or paraphrasing them naturally to back up your suggestions.
 
@@ -201,9 +445,16 @@ async def generate_tour_plan(city: str, vibe_tags: List[str]) -> dict:
 
             Now, please generate the personalized tour plan based on the above instructions.
             """
-    model = genai.GenerativeModel(GENERATION_MODEL)
-    response = await model.generate_content_async(prompt)
-    unique_sources = list({v['review_text']:v for v in all_source_reviews}.values())
+    prompt_chars.set(len(prompt), endpoint="tour")
+    evidence_items.set(len(stops), endpoint="tour")
+
+    model = get_generation_model()
+    with timed("generate"):
+        response = await model.generate_content_async(prompt)
+    stop_names = {stop['name'] for stop in stops}
+    all_source_reviews = [r for r in all_source_reviews if r['location_name'] in stop_names]
+    # Every review a stop was picked on, in full; only the prompt is trimmed.
+    unique_sources = list({(r['location_id'], r['review_text']): r for r in all_source_reviews}.values())
 
     return {
         "reply": response.text,
@@ -0,0 +1,130 @@
+import math
+import re
+from collections import Counter, defaultdict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+# BM25 over raw_reviews.text, partitioned by city. Doc ids use the same
+# "<location_id>#<review_index>" scheme as the Pinecone vectors so results
+# from both backends can be fused and hydrated the same way.
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+MIN_REVIEW_WORDS = 5
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "from", "has", "have",
+    "i", "in", "is", "it", "its", "me", "my", "of", "on", "or", "so", "that", "the",
+    "this", "to", "was", "we", "were", "with", "you", "place", "vibe",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS and len(t) > 1]
+
+
+class CityPartition:
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.doc_lengths: Dict[str, int] = {}
+        self.doc_categories: Dict[str, str] = {}
+        self.doc_terms: Dict[str, List[str]] = {}
+        self.total_length = 0
+
+    def add(self, doc_id: str, text: str, category: str):
+        if doc_id in self.doc_lengths:
+            self.remove(doc_id)
+        tokens = tokenize(text)
+        if not tokens:
+            return
+        counts = Counter(tokens)
+        for term, tf in counts.items():
+            self.postings[term][doc_id] = tf
+        self.doc_lengths[doc_id] = len(tokens)
+        self.doc_categories[doc_id] = category
+        self.doc_terms[doc_id] = list(counts)
+        self.total_length += len(tokens)
+
+    def remove(self, doc_id: str):
+        if doc_id not in self.doc_lengths:
+            return
+        for term in self.doc_terms.pop(doc_id):
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        self.doc_categories.pop(doc_id, None)
+
+    def search(self, query: str, category: Optional[str], top_k: int) -> List[Tuple[str, float]]:
+        n_docs = len(self.doc_lengths)
+        if not n_docs:
+            return []
+        avg_len = self.total_length / n_docs
+        scores: Dict[str, float] = defaultdict(float)
+
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                if category and self.doc_categories.get(doc_id) != category:
+                    continue
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / avg_len)
+                scores[doc_id] += idf * tf * (BM25_K1 + 1) / norm
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+
+class LexicalIndex:
+    def __init__(self):
+        self.partitions: Dict[str, CityPartition] = defaultdict(CityPartition)
+        self.location_docs: Dict[str, Tuple[str, List[str]]] = {}
+
+    def add_location(self, location: dict):
+        location_id = str(location["_id"])
+        city = location.get("city", "unknown").lower()
+        category = location.get("category", "misc").lower()
+        self.remove_location(location_id)
+
+        partition = self.partitions[city]
+        doc_ids = []
+        for review_index, review in enumerate(location.get("raw_reviews", [])):
+            review_text = (review.get("text") or "").strip()
+            if not review_text or len(review_text.split()) < MIN_REVIEW_WORDS:
+                continue
+            if review.get("duplicate_of") is not None:
+                continue
+            doc_id = f"{location_id}#{review_index}"
+            partition.add(doc_id, review_text, category)
+            doc_ids.append(doc_id)
+        self.location_docs[location_id] = (city, doc_ids)
+
+    def remove_location(self, location_id: str):
+        previous = self.location_docs.pop(location_id, None)
+        if previous is None:
+            return
+        city, doc_ids = previous
+        partition = self.partitions.get(city)
+        if partition is not None:
+            for doc_id in doc_ids:
+                partition.remove(doc_id)
+
+    def search(self, query: str, city: str, category: Optional[str] = None, top_k: int = 5) -> List[Tuple[str, float]]:
+        partition = self.partitions.get(city.lower())
+        if partition is None:
+            return []
+        return partition.search(query, category.lower() if category else None, top_k)
+
+    def __len__(self):
+        return sum(len(p.doc_lengths) for p in self.partitions.values())
+
+    async def build(self, locations: AsyncIterator[dict]):
+        async for location in locations:
+            self.add_location(location)
+        print(f"Lexical index built with {len(self)} reviews across {len(self.partitions)} cities.")
+
+
+lexical_index = LexicalIndex()
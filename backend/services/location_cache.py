@@ -0,0 +1,191 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from db import location_repository
+from db.mongo import get_location_collection
+from services.metrics import registry, Counter, Gauge
+
+# Hydration records (name, coordinates, review text/author) of the locations
+# retrieval keeps returning, keyed by location id. A change stream on
+# `locations` evicts entries as soon as a document changes; without one
+# (standalone mongod, or the stream keeps failing) entries simply expire
+# after LOCATION_CACHE_TTL_SECONDS.
+
+LOCATION_CACHE_MAX_ENTRIES = int(os.getenv("LOCATION_CACHE_MAX_ENTRIES", "2000"))
+LOCATION_CACHE_TTL_SECONDS = int(os.getenv("LOCATION_CACHE_TTL_SECONDS", "60"))
+# Upper bound on entry age while the change stream is live.
+LOCATION_CACHE_STREAM_TTL_SECONDS = int(os.getenv("LOCATION_CACHE_STREAM_TTL_SECONDS", "3600"))
+CHANGE_STREAM_RETRY_SECONDS = 5
+# "$changeStream is only supported on replica sets"
+CHANGE_STREAM_UNSUPPORTED_CODES = {40573}
+
+location_cache_lookups = registry.register(Counter(
+    "vibe_location_cache_lookups_total", "Hydration cache lookups per location id, by outcome (hit or miss)."))
+location_cache_round_trips_saved = registry.register(Counter(
+    "vibe_location_cache_round_trips_saved_total", "Hydration requests answered without a MongoDB query."))
+location_cache_invalidations = registry.register(Counter(
+    "vibe_location_cache_invalidations_total", "Hydration cache entries evicted, by source (change_stream, reset)."))
+location_cache_hit_ratio = registry.register(Gauge(
+    "vibe_location_cache_hit_ratio", "Hydration cache hit ratio since the process started."))
+location_cache_entries = registry.register(Gauge(
+    "vibe_location_cache_entries", "Locations held in the hydration cache."))
+
+
+class LocationCache:
+    def __init__(self, max_entries: int = LOCATION_CACHE_MAX_ENTRIES, ttl_seconds: float = LOCATION_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.round_trips_saved = 0
+        self.streaming = False
+        self._task: Optional[asyncio.Task] = None
+        # A fetch that started before an invalidation must not store what it read.
+        self._generation = 0
+        self._invalidated_at: Dict[str, int] = {}
+        self._cleared_at = 0
+        self._fetches_in_flight = 0
+
+    def _entry_ttl(self) -> float:
+        return LOCATION_CACHE_STREAM_TTL_SECONDS if self.streaming else self.ttl_seconds
+
+    def _lookup(self, location_id: str) -> Optional[dict]:
+        entry = self.entries.get(location_id)
+        if entry is None:
+            return None
+        record, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self.entries[location_id]
+            return None
+        self.entries.move_to_end(location_id)
+        return record
+
+    def _store(self, location: dict, fetch_generation: int):
+        location_id = str(location["_id"])
+        if fetch_generation < self._cleared_at or self._invalidated_at.get(location_id, -1) > fetch_generation:
+            return
+        self.entries[location_id] = (location, time.monotonic() + self._entry_ttl())
+        self.entries.move_to_end(location_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def get_many(self, location_ids: List) -> List[dict]:
+        found, missing = [], []
+        for location_id in location_ids:
+            record = self._lookup(str(location_id))
+            if record is None:
+                missing.append(location_id)
+            else:
+                found.append(record)
+        self.hits += len(found)
+        self.misses += len(missing)
+        location_cache_lookups.inc(len(found), outcome="hit")
+        location_cache_lookups.inc(len(missing), outcome="miss")
+        if self.hits + self.misses:
+            location_cache_hit_ratio.set(round(self.hits / (self.hits + self.misses), 4))
+
+        if not missing:
+            if found:
+                self.round_trips_saved += 1
+                location_cache_round_trips_saved.inc()
+            return found
+
+        fetch_generation = self._generation
+        self._fetches_in_flight += 1
+        try:
+            fetched = await location_repository.find_for_hydration(missing)
+        finally:
+            self._fetches_in_flight -= 1
+        for location in fetched:
+            self._store(location, fetch_generation)
+        if not self._fetches_in_flight:
+            self._invalidated_at.clear()
+        location_cache_entries.set(len(self.entries))
+        return found + fetched
+
+    def invalidate(self, location_id, source: str = "change_stream"):
+        location_id = str(location_id)
+        self._generation += 1
+        if self._fetches_in_flight:
+            self._invalidated_at[location_id] = self._generation
+        if self.entries.pop(location_id, None) is not None:
+            location_cache_invalidations.inc(source=source)
+            location_cache_entries.set(len(self.entries))
+
+    def clear(self):
+        # Fetches still in flight may have read before the missed events.
+        self._generation += 1
+        self._cleared_at = self._generation
+        location_cache_invalidations.inc(len(self.entries), source="reset")
+        self.entries.clear()
+        location_cache_entries.set(0)
+
+    async def _watch(self):
+        # Any change to a location (update, replace, delete) evicts it; the
+        # cache is dropped whenever the stream (re)starts since events may
+        # have been missed while it was down.
+        pipeline = [{"$match": {"operationType": {"$in": ["update", "replace", "delete"]}}}]
+        resume_token = None
+        opened = False
+        while True:
+            try:
+                collection = await get_location_collection()
+                async with collection.watch(pipeline, resume_after=resume_token) as stream:
+                    self.clear()
+                    self.streaming = opened = True
+                    print("Location cache: change stream open, invalidating on writes.")
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        self.invalidate(change["documentKey"]["_id"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Server or driver can't do change streams at all (standalone
+                # mongod, no permission): stay on the TTL for this process.
+                unsupported = not isinstance(e, PyMongoError) or (
+                    isinstance(e, OperationFailure) and (e.code in CHANGE_STREAM_UNSUPPORTED_CODES or not opened))
+                if unsupported:
+                    print(f"Location cache: change streams unavailable ({e}). Using a {self.ttl_seconds}s TTL.")
+                    self.streaming = False
+                    return
+                print(f"Location cache: change stream failed ({e}). Retrying in {CHANGE_STREAM_RETRY_SECONDS}s.")
+                if isinstance(e, OperationFailure):
+                    # e.g. the resume token fell off the oplog.
+                    resume_token = None
+            self.streaming = False
+            self.clear()
+            await asyncio.sleep(CHANGE_STREAM_RETRY_SECONDS)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.streaming = False
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "streaming": self.streaming,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "round_trips_saved": self.round_trips_saved,
+        }
+
+
+location_cache = LocationCache()
@@ -0,0 +1,166 @@
+import time
+from collections import Counter as TallyCounter, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional, Tuple
+
+from services.metrics import registry, Histogram, Counter, Gauge
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+# Timeline of the scrape -> analyze -> index pipeline. Each stage run is
+# timed in-process (sliding windows for /pipeline/stats, Prometheus
+# histograms), persisted on the locations it touched (pipeline.stages.<stage>
+# plus call/failure counts) and traced as an OpenTelemetry span when the SDK
+# is installed. Waits between stages are recorded as wait_analyze/wait_index
+# from the pipeline.status_at timestamps.
+
+PIPELINE_STAGES = ("scrape", "wait_analyze", "analyze", "wait_index", "index")
+WINDOWS = {"1m": 60, "5m": 300, "15m": 900}
+MAX_SAMPLES_PER_STAGE = 5000
+
+pipeline_stage_duration = registry.register(Histogram(
+    "vibe_pipeline_stage_seconds", "Duration of background pipeline stages and of the waits between them.",
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 900.0)))
+pipeline_calls = registry.register(Counter(
+    "vibe_pipeline_calls_total", "Upstream calls made by the background pipeline, by stage, kind and outcome."))
+pipeline_in_flight = registry.register(Gauge(
+    "vibe_pipeline_in_flight", "Background pipeline stage runs in progress."))
+
+_tracer = trace.get_tracer("vibe_navigator.pipeline") if trace is not None else None
+
+
+def _span_attributes(attributes: dict) -> dict:
+    return {f"pipeline.{k}": v if isinstance(v, (str, int, float, bool)) else str(v)
+            for k, v in attributes.items() if v is not None}
+
+
+class StageRun:
+    __slots__ = ("stage", "location_ids", "started_at", "start", "calls", "failures", "span")
+
+    def __init__(self, stage: str, location_ids: List, attributes: dict):
+        self.stage = stage
+        self.location_ids = list(location_ids)
+        self.started_at = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        self.calls: TallyCounter = TallyCounter()
+        self.failures: TallyCounter = TallyCounter()
+        self.span = _tracer.start_span(f"pipeline.{stage}", attributes=_span_attributes(attributes)) if _tracer else None
+
+    def call(self, kind: str, count: int = 1):
+        self.calls[kind] += count
+        pipeline_calls.inc(count, stage=self.stage, kind=kind, outcome="ok")
+
+    def failure(self, kind: str, count: int = 1):
+        self.failures[kind] += count
+        pipeline_calls.inc(count, stage=self.stage, kind=kind, outcome="error")
+
+    @contextmanager
+    def batch(self, name: str, **attributes):
+        # Child span for one batch (map prompt, embed + upsert, ...).
+        if self.span is None:
+            yield
+            return
+        context = trace.set_span_in_context(self.span)
+        with _tracer.start_as_current_span(f"pipeline.{self.stage}.{name}", context=context,
+                                           attributes=_span_attributes(attributes)):
+            yield
+
+
+class PipelineStats:
+    def __init__(self):
+        self.samples: Dict[str, Deque[Tuple[float, float, bool]]] = {
+            stage: deque(maxlen=MAX_SAMPLES_PER_STAGE) for stage in PIPELINE_STAGES
+        }
+        self.in_flight: TallyCounter = TallyCounter()
+        self.calls: Dict[str, TallyCounter] = {stage: TallyCounter() for stage in PIPELINE_STAGES}
+        self.failures: Dict[str, TallyCounter] = {stage: TallyCounter() for stage in PIPELINE_STAGES}
+
+    def observe(self, stage: str, seconds: float, ok: bool = True):
+        self.samples[stage].append((time.monotonic(), seconds, ok))
+        pipeline_stage_duration.observe(seconds, stage=stage)
+
+    def observe_queue_wait(self, stage: str, location: dict, waiting_status: str, next_status: str):
+        # Time since the location entered waiting_status, unless it already
+        # passed next_status after that (e.g. a refresh re-indexing an old location).
+        status_at = (location.get("pipeline") or {}).get("status_at") or {}
+        since, passed = _aware(status_at.get(waiting_status)), _aware(status_at.get(next_status))
+        if since is None or (passed is not None and passed >= since):
+            return
+        self.observe(stage, max(0.0, (datetime.now(timezone.utc) - since).total_seconds()))
+
+    def start(self, stage: str, location_ids: List = (), **attributes) -> StageRun:
+        self.in_flight[stage] += 1
+        pipeline_in_flight.set(self.in_flight[stage], stage=stage)
+        return StageRun(stage, location_ids, attributes)
+
+    async def finish(self, run: StageRun, ok: bool = True, error: Optional[str] = None):
+        seconds = time.perf_counter() - run.start
+        self.in_flight[run.stage] -= 1
+        pipeline_in_flight.set(self.in_flight[run.stage], stage=run.stage)
+        self.observe(run.stage, seconds, ok)
+        self.calls[run.stage].update(run.calls)
+        self.failures[run.stage].update(run.failures)
+
+        if run.span is not None:
+            for kind, count in run.calls.items():
+                run.span.set_attribute(f"pipeline.calls.{kind}", count)
+            for kind, count in run.failures.items():
+                run.span.set_attribute(f"pipeline.failures.{kind}", count)
+            if not ok:
+                run.span.set_status(trace.Status(trace.StatusCode.ERROR, error or "failed"))
+            run.span.end()
+
+        if run.location_ids:
+            from db import location_repository
+            await location_repository.record_pipeline_stage(run.location_ids, run.stage, {
+                "started_at": run.started_at,
+                "finished_at": datetime.now(timezone.utc),
+                "duration_ms": round(seconds * 1000, 1),
+                "ok": ok,
+                **({"error": error} if error else {}),
+            }, dict(run.calls), dict(run.failures))
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        stages = {}
+        for stage, samples in self.samples.items():
+            windows = {}
+            for window, seconds in WINDOWS.items():
+                recent = [(duration, ok) for finished, duration, ok in samples if now - finished <= seconds]
+                durations = sorted(duration for duration, _ in recent)
+                windows[window] = {
+                    "count": len(recent),
+                    "failed": sum(1 for _, ok in recent if not ok),
+                    "throughput_per_min": round(len(recent) * 60 / seconds, 2),
+                    "p50_ms": _percentile_ms(durations, 50),
+                    "p95_ms": _percentile_ms(durations, 95),
+                    "p99_ms": _percentile_ms(durations, 99),
+                }
+            stages[stage] = {
+                "in_flight": self.in_flight.get(stage, 0),
+                "windows": windows,
+                "calls": dict(self.calls[stage]),
+                "failures": dict(self.failures[stage]),
+            }
+        return stages
+
+
+def _aware(moment: Optional[datetime]) -> Optional[datetime]:
+    # Mongo hands back naive UTC datetimes.
+    if moment is not None and moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment
+
+
+def _percentile_ms(sorted_seconds: List[float], pct: float) -> Optional[float]:
+    if not sorted_seconds:
+        return None
+    index = min(len(sorted_seconds) - 1, max(0, round(pct / 100 * len(sorted_seconds)) - 1))
+    return round(sorted_seconds[index] * 1000, 1)
+
+
+pipeline_stats = PipelineStats()
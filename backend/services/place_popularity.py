@@ -0,0 +1,38 @@
+import asyncio
+import os
+import time
+from collections import Counter
+from typing import Iterable
+
+from db import location_repository
+
+# How often each location shows up in retrieval results. Counted in-process
+# and added to popularity.retrievals at most every POPULARITY_FLUSH_SECONDS;
+# the review refresh scheduler uses it to re-scrape popular places first.
+
+POPULARITY_FLUSH_SECONDS = int(os.getenv("POPULARITY_FLUSH_SECONDS", "60"))
+
+_pending: Counter = Counter()
+_last_flush = time.monotonic()
+_flush_task = None
+
+
+def record_retrievals(location_ids: Iterable[str]):
+    # Called on the request path: the write happens in a background task.
+    global _flush_task
+    _pending.update(str(location_id) for location_id in location_ids)
+    if time.monotonic() - _last_flush >= POPULARITY_FLUSH_SECONDS and (_flush_task is None or _flush_task.done()):
+        _flush_task = asyncio.create_task(flush())
+
+
+async def flush():
+    global _last_flush
+    _last_flush = time.monotonic()
+    if not _pending:
+        return
+    counts = dict(_pending)
+    _pending.clear()
+    try:
+        await location_repository.add_retrievals(counts)
+    except Exception as e:
+        print(f"Could not record retrieval counts: {e}")
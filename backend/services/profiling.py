@@ -0,0 +1,307 @@
+import asyncio
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter as TallyCounter, deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional
+
+import orjson
+
+from services.metrics import registry, Counter, Histogram
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+# Opt-in request profiling. A request is profiled when it sends
+# `X-Profile: 1` with `X-Profile-Token: <PROFILE_TOKEN>` or is picked by
+# PROFILE_SAMPLE_RATE. Without a PROFILE_TOKEN only sampling works and the
+# /debug/profiles endpoints are disabled. pyinstrument is used when installed; otherwise a
+# thread samples the event loop thread's stack every PROFILE_INTERVAL_MS.
+# Both see the whole loop, so concurrent requests show up in each other's
+# profiles; `concurrent_requests` in the profile says how many were running.
+#
+# Independently, a watchdog thread notices when the loop hasn't run for
+# LOOP_BLOCK_THRESHOLD_MS and logs the stack that is holding it.
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+PROFILE_MAX_CONCURRENT = 2
+LOOP_BLOCK_DETECTOR = os.getenv("LOOP_BLOCK_DETECTOR", "true").lower() in ("1", "true", "yes")
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100"))
+LOOP_BLOCK_STACK_FRAMES = 12
+TOP_FUNCTIONS = 30
+
+_PROFILE_ID_RE = re.compile(r"^[0-9]{8}T[0-9]{6}-[a-z0-9_]+-[0-9a-f]{8}$")
+
+profiles_captured = registry.register(Counter(
+    "vibe_profiles_captured_total", "Request profiles written, by trigger (header or sampled)."))
+loop_blocks = registry.register(Histogram(
+    "vibe_event_loop_block_seconds", "Times the event loop was held longer than LOOP_BLOCK_THRESHOLD_MS.",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)))
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame) -> str:
+    # Root-first "a;b;c", the folded format flame graph tools read.
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class StackSampler:
+    def __init__(self, thread_id: int, interval_seconds: float):
+        self.thread_id = thread_id
+        self.interval_seconds = interval_seconds
+        self.samples: TallyCounter = TallyCounter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[_collapse(frame)] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> TallyCounter:
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+
+def _top_functions(samples: TallyCounter) -> List[dict]:
+    own, total = TallyCounter(), TallyCounter()
+    for stack, count in samples.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for label in set(frames):
+            total[label] += count
+    sample_count = sum(samples.values()) or 1
+    return [
+        {"function": label, "self_pct": round(100 * own[label] / sample_count, 1),
+         "total_pct": round(100 * count / sample_count, 1)}
+        for label, count in total.most_common(TOP_FUNCTIONS)
+    ]
+
+
+class LoopBlockDetector:
+    def __init__(self, threshold_ms: float = LOOP_BLOCK_THRESHOLD_MS):
+        self.threshold_seconds = threshold_ms / 1000
+        self.check_seconds = self.threshold_seconds / 4
+        self.recent: Deque[dict] = deque(maxlen=100)
+        self.listeners: List[list] = []
+        self._beat = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    async def _heartbeat(self):
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.check_seconds)
+
+    def _watch(self, loop_thread_id: int):
+        blocked_since, stack = None, None
+        while not self._stop.wait(self.check_seconds):
+            beat = self._beat
+            lag = time.monotonic() - beat
+            if lag > self.threshold_seconds + self.check_seconds:
+                if blocked_since != beat:
+                    # Captured while the loop is still stuck: this is the culprit.
+                    frame = sys._current_frames().get(loop_thread_id)
+                    stack = traceback.format_stack(frame)[-LOOP_BLOCK_STACK_FRAMES:] if frame else []
+                    blocked_since = beat
+            elif blocked_since is not None:
+                self._report(time.monotonic() - blocked_since - self.check_seconds, stack)
+                blocked_since, stack = None, None
+
+    def _report(self, seconds: float, stack: List[str]):
+        event = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "blocked_ms": round(seconds * 1000, 1),
+            "stack": [line.rstrip() for line in stack],
+        }
+        loop_blocks.observe(seconds)
+        self.recent.append(event)
+        for events in list(self.listeners):
+            events.append(event)
+        where = stack[-1].strip().splitlines()[0] if stack else "unknown"
+        print(f"Event loop blocked for {event['blocked_ms']:.0f} ms at {where}")
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._task = asyncio.create_task(self._heartbeat())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, args=(threading.get_ident(),),
+                                        name="loop-block-detector", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        await asyncio.to_thread(self._thread.join)
+        self._task, self._thread = None, None
+
+
+loop_block_detector = LoopBlockDetector()
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str, trigger: str, concurrent_requests: int):
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.concurrent_requests = concurrent_requests
+        self.started_at = datetime.now(timezone.utc)
+        slug = re.sub(r"[^a-z0-9]+", "_", path.lower()).strip("_") or "root"
+        self.profile_id = f"{self.started_at:%Y%m%dT%H%M%S}-{slug}-{uuid.uuid4().hex[:8]}"
+        self.loop_blocks: List[dict] = []
+        self._start = time.perf_counter()
+        self._profiler = None
+        self._sampler = None
+
+    def start(self):
+        loop_block_detector.listeners.append(self.loop_blocks)
+        if Profiler is not None:
+            profiler = Profiler(interval=PROFILE_INTERVAL_MS / 1000, async_mode="enabled")
+            profiler.start()
+            self._profiler = profiler
+        else:
+            sampler = StackSampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000)
+            sampler.start()
+            self._sampler = sampler
+
+    def stop(self, status_code: int) -> Dict[str, bytes]:
+        # Returns the files to write: <id>.json always, plus <id>.html with
+        # pyinstrument. Safe to call when start() failed part way.
+        duration = time.perf_counter() - self._start
+        # By identity: another profile's empty list compares equal to ours.
+        loop_block_detector.listeners[:] = [l for l in loop_block_detector.listeners if l is not self.loop_blocks]
+        profile = {
+            "id": self.profile_id,
+            "method": self.method,
+            "path": self.path,
+            "status_code": status_code,
+            "trigger": self.trigger,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(duration * 1000, 1),
+            "concurrent_requests": self.concurrent_requests,
+            "loop_blocks": self.loop_blocks,
+        }
+        files = {}
+        if self._profiler is not None:
+            self._profiler.stop()
+            profile["profiler"] = "pyinstrument"
+            profile["text"] = self._profiler.output_text(unicode=True, show_all=False)
+            files[".html"] = self._profiler.output_html().encode()
+        else:
+            samples = self._sampler.stop() if self._sampler is not None else TallyCounter()
+            profile["profiler"] = "stack_sampler" if self._sampler is not None else "none"
+            profile["interval_ms"] = PROFILE_INTERVAL_MS
+            profile["samples"] = sum(samples.values())
+            profile["top_functions"] = _top_functions(samples)
+            profile["folded"] = [f"{stack} {count}" for stack, count in samples.most_common()]
+        files[".json"] = orjson.dumps(profile)
+        return files
+
+
+def token_matches(token: Optional[str]) -> bool:
+    # No PROFILE_TOKEN configured means nobody can ask for a profile.
+    return bool(PROFILE_TOKEN) and token is not None and secrets.compare_digest(token, PROFILE_TOKEN)
+
+
+class ProfileStore:
+    def __init__(self, directory: str = PROFILE_DIR, max_files: int = PROFILE_MAX_FILES):
+        self.directory = directory
+        self.max_files = max_files
+        self.active = 0
+        self.requests_in_flight = 0
+
+    def should_profile(self, headers) -> Optional[str]:
+        if self.active >= PROFILE_MAX_CONCURRENT:
+            return None
+        if headers.get("x-profile") in ("1", "true"):
+            if token_matches(headers.get("x-profile-token")):
+                return "header"
+        if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+            return "sampled"
+        return None
+
+    def _write(self, profile_id: str, files: Dict[str, bytes]):
+        os.makedirs(self.directory, exist_ok=True)
+        for suffix, content in files.items():
+            with open(os.path.join(self.directory, profile_id + suffix), "wb") as f:
+                f.write(content)
+        profiles = sorted(name for name in os.listdir(self.directory) if name.endswith(".json"))
+        for name in profiles[:max(0, len(profiles) - self.max_files)]:
+            for suffix in (".json", ".html"):
+                path = os.path.join(self.directory, name[:-5] + suffix)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    async def save(self, profile: RequestProfile, files: Dict[str, bytes]):
+        await asyncio.to_thread(self._write, profile.profile_id, files)
+        profiles_captured.inc(trigger=profile.trigger)
+
+    def _path(self, profile_id: str, suffix: str) -> Optional[str]:
+        if not _PROFILE_ID_RE.match(profile_id):
+            return None
+        path = os.path.join(self.directory, profile_id + suffix)
+        return path if os.path.exists(path) else None
+
+    def _list(self, limit: int) -> List[dict]:
+        if not os.path.isdir(self.directory):
+            return []
+        names = sorted((name for name in os.listdir(self.directory) if name.endswith(".json")), reverse=True)
+        summaries = []
+        for name in names[:limit]:
+            with open(os.path.join(self.directory, name), "rb") as f:
+                profile = orjson.loads(f.read())
+            summaries.append({key: profile.get(key) for key in (
+                "id", "method", "path", "status_code", "trigger", "started_at", "duration_ms", "profiler")})
+            summaries[-1]["loop_blocks"] = len(profile.get("loop_blocks", []))
+        return summaries
+
+    async def list(self, limit: int = 50) -> List[dict]:
+        return await asyncio.to_thread(self._list, limit)
+
+    @staticmethod
+    def _read(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    async def read(self, profile_id: str, suffix: str = ".json") -> Optional[bytes]:
+        path = self._path(profile_id, suffix)
+        if path is None:
+            return None
+        return await asyncio.to_thread(self._read, path)
+
+
+profile_store = ProfileStore()
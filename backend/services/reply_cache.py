@@ -0,0 +1,106 @@
+import os
+import time
+import itertools
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+REPLY_CACHE_MAX_ENTRIES = int(os.getenv("REPLY_CACHE_MAX_ENTRIES", "512"))
+REPLY_CACHE_TTL_SECONDS = int(os.getenv("REPLY_CACHE_TTL_SECONDS", "3600"))
+REPLY_CACHE_SIMILARITY = float(os.getenv("REPLY_CACHE_SIMILARITY", "0.95"))
+
+
+class _CacheEntry:
+    __slots__ = ("city", "vector", "response", "expires_at")
+
+    def __init__(self, city: str, vector: np.ndarray, response: dict, expires_at: float):
+        self.city = city
+        self.vector = vector
+        self.response = response
+        self.expires_at = expires_at
+
+
+class SemanticReplyCache:
+    # Replies to first-turn chat queries, looked up by cosine similarity of the
+    # query embedding within a city. LRU-bounded, with a per-entry TTL.
+
+    def __init__(self, max_entries: int = REPLY_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = REPLY_CACHE_TTL_SECONDS,
+                 similarity_threshold: float = REPLY_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.entries: "OrderedDict[int, _CacheEntry]" = OrderedDict()
+        self.city_entries: Dict[str, set] = {}
+        self.hits = 0
+        self.misses = 0
+        self._ids = itertools.count()
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return None
+        return vector / norm
+
+    def _drop(self, entry_id: int):
+        entry = self.entries.pop(entry_id, None)
+        if entry is not None:
+            ids = self.city_entries.get(entry.city)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self.city_entries[entry.city]
+
+    def lookup(self, city: str, embedding: List[float]) -> Optional[dict]:
+        city = city.lower()
+        query_vector = self._normalize(embedding)
+        ids = list(self.city_entries.get(city, ()))
+        if query_vector is None or not ids:
+            self.misses += 1
+            return None
+
+        now = time.monotonic()
+        for entry_id in ids:
+            if self.entries[entry_id].expires_at <= now:
+                self._drop(entry_id)
+        ids = [entry_id for entry_id in ids if entry_id in self.entries]
+        if not ids:
+            self.misses += 1
+            return None
+
+        matrix = np.stack([self.entries[entry_id].vector for entry_id in ids])
+        similarities = matrix @ query_vector
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            self.misses += 1
+            return None
+
+        entry_id = ids[best]
+        self.entries.move_to_end(entry_id)
+        self.hits += 1
+        return self.entries[entry_id].response
+
+    def store(self, city: str, embedding: List[float], response: dict):
+        city = city.lower()
+        vector = self._normalize(embedding)
+        if vector is None:
+            return
+        entry_id = next(self._ids)
+        self.entries[entry_id] = _CacheEntry(city, vector, response, time.monotonic() + self.ttl_seconds)
+        self.city_entries.setdefault(city, set()).add(entry_id)
+        while len(self.entries) > self.max_entries:
+            oldest_id = next(iter(self.entries))
+            self._drop(oldest_id)
+
+    def invalidate_city(self, city: str):
+        for entry_id in list(self.city_entries.get(city.lower(), ())):
+            self._drop(entry_id)
+
+    def stats(self) -> dict:
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+reply_cache = SemanticReplyCache()
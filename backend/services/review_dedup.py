@@ -0,0 +1,133 @@
+import os
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+from services.evidence_packer import estimate_tokens
+from services.lexical_index import MIN_REVIEW_WORDS
+
+# MinHash/LSH near-duplicate detection over a location's raw_reviews.
+# Duplicates get `duplicate_of: <index of the cluster's first review>`; only
+# representatives (no duplicate_of) are embedded, BM25-indexed and sent to
+# the analyzer's map prompts. Vector ids keep using the original indices.
+
+SHINGLE_WORDS = 3
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 16  # 16 bands x 8 rows: candidates from roughly 0.7 Jaccard up
+DUPLICATE_JACCARD = float(os.getenv("REVIEW_DUPLICATE_JACCARD", "0.8"))
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_rng = np.random.default_rng(20240601)
+# Multiply-shift hashing: ((a * x + b) mod 2^64) >> 32 with odd a.
+_PERM_A = _rng.integers(1, 2**63, size=NUM_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _rng.integers(0, 2**63, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def shingles(text: str) -> Set[str]:
+    words = _WORD_RE.findall((text or "").lower())
+    if len(words) < SHINGLE_WORDS:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def minhash_signature(shingle_set: Set[str]) -> np.ndarray:
+    hashes = np.array([zlib.crc32(s.encode("utf-8")) for s in shingle_set], dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        permuted = (hashes[:, None] * _PERM_A[None, :] + _PERM_B[None, :]) >> np.uint64(32)
+    return permuted.min(axis=0)
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def find_duplicates(texts: List[str], threshold: float = DUPLICATE_JACCARD) -> List[Optional[int]]:
+    # For each text, the index of its cluster representative, or None if it
+    # is a representative itself. The earliest text of a cluster represents
+    # it, so appending reviews never changes an existing representative.
+    shingle_sets = [shingles(text) for text in texts]
+    parent = list(range(len(texts)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    rows = NUM_PERMUTATIONS // LSH_BANDS
+    buckets: Dict[tuple, List[int]] = defaultdict(list)
+    for i, shingle_set in enumerate(shingle_sets):
+        if not shingle_set:
+            continue
+        signature = minhash_signature(shingle_set)
+        for band in range(LSH_BANDS):
+            buckets[(band, signature[band * rows:(band + 1) * rows].tobytes())].append(i)
+
+    checked = set()
+    for members in buckets.values():
+        for position, i in enumerate(members):
+            for j in members[position + 1:]:
+                if (i, j) in checked:
+                    continue
+                checked.add((i, j))
+                # LSH only proposes candidates; the exact Jaccard decides.
+                if find(i) != find(j) and _jaccard(shingle_sets[i], shingle_sets[j]) >= threshold:
+                    root_i, root_j = find(i), find(j)
+                    parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    return [None if find(i) == i else find(i) for i in range(len(texts))]
+
+
+def mark_duplicates(reviews: List[dict]) -> int:
+    # Sets or clears `duplicate_of` on each review in place; returns the number of duplicates.
+    representatives = find_duplicates([review.get("text") or "" for review in reviews])
+    duplicates = 0
+    for review, representative in zip(reviews, representatives):
+        if representative is None:
+            review.pop("duplicate_of", None)
+        else:
+            review["duplicate_of"] = representative
+            duplicates += 1
+    return duplicates
+
+
+def is_representative(review: dict) -> bool:
+    return review.get("duplicate_of") is None
+
+
+def cluster_sizes(reviews: List[dict]) -> Dict[int, int]:
+    sizes = {i: 1 for i, review in enumerate(reviews) if is_representative(review)}
+    for review in reviews:
+        representative = review.get("duplicate_of")
+        if representative in sizes:
+            sizes[representative] += 1
+    return sizes
+
+
+def map_stage_lines(reviews: List[dict]) -> List[str]:
+    # One bullet per cluster; the count keeps how often a point was made.
+    sizes = cluster_sizes(reviews)
+    lines = []
+    for index, size in sizes.items():
+        text = reviews[index].get("text")
+        if not text:
+            continue
+        suffix = f" (repeated in {size - 1} near-identical reviews)" if size > 1 else ""
+        lines.append(f"- {text}{suffix}")
+    return lines
+
+
+def dedup_report(reviews: List[dict]) -> Dict[str, int]:
+    # What the marks save for one location: embedded reviews and map-prompt tokens.
+    embeddable = [r for r in reviews if len((r.get("text") or "").split()) >= MIN_REVIEW_WORDS]
+    return {
+        "reviews": len(reviews),
+        "duplicates": sum(1 for r in reviews if not is_representative(r)),
+        "embedded_before": len(embeddable),
+        "embedded_after": sum(1 for r in embeddable if is_representative(r)),
+        "map_tokens_before": sum(estimate_tokens(f"- {r['text']}") for r in reviews if r.get("text")),
+        "map_tokens_after": sum(estimate_tokens(line) for line in map_stage_lines(reviews)),
+    }
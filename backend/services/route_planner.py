@@ -0,0 +1,81 @@
+import os
+from typing import Dict, List
+
+import numpy as np
+
+# Picks and orders tour stops locally so the LLM only narrates a short,
+# geographically sensible route instead of guessing an order itself.
+
+EARTH_RADIUS_KM = 6371.0088
+MAX_TOUR_STOPS = int(os.getenv("MAX_TOUR_STOPS", "5"))
+# How many relevance points one extra kilometre of walking/driving costs when
+# choosing the next stop.
+DETOUR_PENALTY_PER_KM = 0.08
+
+
+def haversine_matrix(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    lat = np.radians(lats)[:, None]
+    lon = np.radians(lons)[:, None]
+    dlat = lat - lat.T
+    dlon = lon - lon.T
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat) * np.cos(lat.T) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _two_opt(order: List[int], distances: np.ndarray) -> List[int]:
+    # Open-path 2-opt: reverse a segment whenever that shortens the route.
+    improved = True
+    while improved:
+        improved = False
+        for i in range(len(order) - 2):
+            for j in range(i + 2, len(order)):
+                a, b = order[i], order[i + 1]
+                c = order[j]
+                d = order[j + 1] if j + 1 < len(order) else None
+                before = distances[a, b] + (distances[c, d] if d is not None else 0.0)
+                after = distances[a, c] + (distances[b, d] if d is not None else 0.0)
+                if after + 1e-9 < before:
+                    order[i + 1:j + 1] = reversed(order[i + 1:j + 1])
+                    improved = True
+    return order
+
+
+def plan_route(candidates: List[Dict], max_stops: int = MAX_TOUR_STOPS) -> List[Dict]:
+    # Each candidate needs "score" and "coordinates" ({"lat", "lon"}).
+    # Returns the chosen stops in visiting order, each with "leg_km" (distance
+    # from the previous stop; 0 for the first).
+    if not candidates:
+        return []
+    max_stops = min(max_stops, len(candidates))
+
+    lats = np.array([c["coordinates"]["lat"] for c in candidates], dtype=np.float64)
+    lons = np.array([c["coordinates"]["lon"] for c in candidates], dtype=np.float64)
+    scores = np.array([c["score"] for c in candidates], dtype=np.float64)
+    distances = haversine_matrix(lats, lons)
+
+    # Nearest-neighbour, weighted by relevance: start at the best match, then
+    # repeatedly take the stop with the best score-minus-detour trade-off.
+    order = [int(np.argmax(scores))]
+    available = np.ones(len(candidates), dtype=bool)
+    available[order[0]] = False
+    while len(order) < max_stops:
+        gain = scores - DETOUR_PENALTY_PER_KM * distances[order[-1]]
+        gain[~available] = -np.inf
+        next_stop = int(np.argmax(gain))
+        order.append(next_stop)
+        available[next_stop] = False
+
+    order = _two_opt(order, distances)
+
+    stops = []
+    previous = None
+    for index in order:
+        stop = dict(candidates[index])
+        stop["leg_km"] = round(float(distances[previous, index]), 2) if previous is not None else 0.0
+        stops.append(stop)
+        previous = index
+    return stops
+
+
+def route_length_km(stops: List[Dict]) -> float:
+    return round(sum(stop.get("leg_km", 0.0) for stop in stops), 2)
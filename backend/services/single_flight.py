@@ -0,0 +1,72 @@
+import asyncio
+import math
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from services.metrics import registry, Counter
+
+# Concurrent callers with the same key share one in-flight call. The shared
+# call runs as its own task, so a cancelled caller doesn't cancel it for the
+# others; it's only cancelled once every caller waiting on it has gone away.
+# Exceptions reach every caller, and the key is released as soon as the call
+# finishes so failures aren't cached.
+#
+# A caller may pass the time budget the call runs with (e.g. retrieval's
+# vector budget). It only joins a flight started with at least that budget;
+# otherwise it starts its own flight, which later callers with the same key
+# join instead.
+
+single_flight_calls = registry.register(Counter(
+    "vibe_single_flight_calls_total", "Calls through a single-flight group, by role (leader runs upstream, follower coalesced)."))
+
+
+class _Flight:
+    __slots__ = ("task", "waiters", "budget")
+
+    def __init__(self, task: asyncio.Task, budget: float):
+        self.task = task
+        self.waiters = 0
+        self.budget = budget
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self.flights: Dict[Hashable, _Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]], budget: float = math.inf) -> Any:
+        flight = self.flights.get(key)
+        if flight is None or flight.budget < budget:
+            flight = _Flight(asyncio.create_task(fn()), budget)
+            self.flights[key] = flight
+            flight.task.add_done_callback(lambda _task, key=key, flight=flight: self._release(key, flight))
+            self.leaders += 1
+            single_flight_calls.inc(group=self.name, role="leader")
+        else:
+            self.followers += 1
+            single_flight_calls.inc(group=self.name, role="follower")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _release(self, key: Hashable, flight: _Flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+        if not flight.task.cancelled():
+            # Mark the exception as retrieved even if every waiter left.
+            flight.task.exception()
+
+    def stats(self) -> dict:
+        return {"leaders": self.leaders, "followers": self.followers, "in_flight": len(self.flights)}
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.lower().split())
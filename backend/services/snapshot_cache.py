@@ -0,0 +1,79 @@
+import gzip
+import hashlib
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+
+from models.place import Location
+from services.metrics import registry, Counter
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Pre-serialized /vibes/locations responses per (city, category). The body is
+# validated and encoded once, compressed once per encoding, and served with an
+# ETag until the pipeline changes a location in that slice (in-process hooks)
+# or the snapshot ages out (covers changes made by other workers).
+
+SNAPSHOT_MAX_AGE_SECONDS = int(os.getenv("SNAPSHOT_MAX_AGE_SECONDS", "300"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+snapshot_requests = registry.register(Counter(
+    "vibe_snapshot_requests_total", "/vibes/locations snapshot lookups by outcome (hit, miss, not_modified)."))
+
+
+class Snapshot:
+    __slots__ = ("body", "encoded", "etag", "count", "built_at")
+
+    def __init__(self, body: bytes, count: int):
+        self.body = body
+        self.count = count
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        self.encoded: Dict[str, bytes] = {"gzip": gzip.compress(body, compresslevel=GZIP_LEVEL)}
+        if brotli is not None:
+            self.encoded["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+        self.built_at = time.monotonic()
+
+    def pick_encoding(self, accept_encoding: str) -> Tuple[Optional[str], bytes]:
+        accepted = {part.split(";")[0].strip() for part in (accept_encoding or "").lower().split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in self.encoded:
+                return encoding, self.encoded[encoding]
+        return None, self.body
+
+
+class SnapshotCache:
+    def __init__(self, max_age_seconds: float = SNAPSHOT_MAX_AGE_SECONDS):
+        self.max_age_seconds = max_age_seconds
+        self.snapshots: Dict[Tuple[str, str], Snapshot] = {}
+
+    @staticmethod
+    def _key(city: str, category: str) -> Tuple[str, str]:
+        return city.lower(), category.lower()
+
+    def get(self, city: str, category: str) -> Optional[Snapshot]:
+        snapshot = self.snapshots.get(self._key(city, category))
+        if snapshot is None or time.monotonic() - snapshot.built_at > self.max_age_seconds:
+            return None
+        return snapshot
+
+    def build(self, city: str, category: str, documents: List[dict]) -> Snapshot:
+        payload = [Location.model_validate(doc).model_dump(mode="json", by_alias=True) for doc in documents]
+        snapshot = Snapshot(orjson.dumps(payload), len(payload))
+        self.snapshots[self._key(city, category)] = snapshot
+        return snapshot
+
+    def invalidate(self, city: str, category: str):
+        self.snapshots.pop(self._key(city, category), None)
+
+    def invalidate_locations(self, locations: List[dict]):
+        for location in locations:
+            self.invalidate(location.get("city", ""), location.get("category", ""))
+
+
+snapshot_cache = SnapshotCache()
@@ -0,0 +1,202 @@
+import math
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from db.mongo import get_tag_prototypes_collection
+from services.metrics import registry, Counter
+
+# Local vibe tagging: a location's review embeddings are centred on the corpus
+# mean, averaged, and scored against one prototype vector per tag. Prototypes
+# are the centred centroids of the locations the LLM gave that tag
+# (db.build_tag_prototypes). Confident results skip the map/reduce prompts;
+# the LLM then only writes the prose summary.
+
+TAGGER_MIN_TAGS = 3
+TAGGER_MAX_TAGS = 5
+TAGGER_MIN_REVIEWS = int(os.getenv("TAGGER_MIN_REVIEWS", "12"))
+TAGGER_MIN_SCORE = float(os.getenv("TAGGER_MIN_SCORE", "0.0"))
+TAGGER_MIN_SEPARATION = float(os.getenv("TAGGER_MIN_SEPARATION", "0.05"))
+TAG_MIN_SUPPORT = int(os.getenv("TAG_MIN_SUPPORT", "5"))
+TAGGER_RELOAD_SECONDS = 600
+SUMMARY_REVIEWS = 8
+PROTOTYPES_DOC_ID = "current"
+
+vibe_tagging = registry.register(Counter(
+    "vibe_tagging_total", "Locations tagged during analysis, by tag source (local or llm)."))
+analysis_llm_calls_avoided = registry.register(Counter(
+    "vibe_analysis_llm_calls_avoided_total", "Map/reduce LLM calls skipped because tags were assigned locally."))
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+class TaggingResult:
+    __slots__ = ("tags", "scores", "separation", "confident")
+
+    def __init__(self, tags: List[str], scores: Dict[str, float], separation: float, confident: bool):
+        self.tags = tags
+        self.scores = scores
+        self.separation = separation
+        self.confident = confident
+
+
+class VibeTagger:
+    def __init__(self, tags: List[str], prototypes: np.ndarray, center: np.ndarray, support: Dict[str, int]):
+        self.tags = tags
+        self.prototypes = _unit_rows(np.asarray(prototypes, dtype=np.float32))
+        self.center = np.asarray(center, dtype=np.float32)
+        self.support = support
+
+    def centroid(self, review_vectors: np.ndarray) -> np.ndarray:
+        reviews = _unit_rows(np.asarray(review_vectors, dtype=np.float32))
+        return _unit_rows(reviews.mean(axis=0) - self.center)
+
+    def tag(self, review_vectors: np.ndarray) -> TaggingResult:
+        scores = self.prototypes @ self.centroid(review_vectors)
+        order = np.argsort(-scores)
+        ranked = scores[order]
+        # Cut the ranking where it drops the most between MIN and MAX tags.
+        limit = min(TAGGER_MAX_TAGS, len(ranked) - 1)
+        if limit < TAGGER_MIN_TAGS:
+            tags = [self.tags[i] for i in order[:limit + 1]]
+            return TaggingResult(tags, {}, 0.0, False)
+        gaps = ranked[TAGGER_MIN_TAGS - 1:limit] - ranked[TAGGER_MIN_TAGS:limit + 1]
+        count = TAGGER_MIN_TAGS + int(np.argmax(gaps))
+        separation = float(gaps.max())
+        chosen = order[:count]
+        confident = (len(review_vectors) >= TAGGER_MIN_REVIEWS
+                     and separation >= TAGGER_MIN_SEPARATION
+                     and float(scores[chosen].min()) >= TAGGER_MIN_SCORE)
+        return TaggingResult(
+            [self.tags[i] for i in chosen],
+            {self.tags[i]: round(float(scores[i]), 4) for i in order[:count + 3]},
+            separation, confident
+        )
+
+    def central_reviews(self, review_vectors: np.ndarray, k: int = SUMMARY_REVIEWS) -> List[int]:
+        reviews = _unit_rows(np.asarray(review_vectors, dtype=np.float32))
+        closeness = reviews @ _unit_rows(reviews.mean(axis=0))
+        return [int(i) for i in np.argsort(-closeness)[:k]]
+
+    @classmethod
+    def build(cls, location_vectors: Sequence[np.ndarray], labels: Sequence[Sequence[str]],
+              min_support: int = TAG_MIN_SUPPORT) -> Optional["VibeTagger"]:
+        means = _unit_rows(np.stack([
+            _unit_rows(np.asarray(vectors, dtype=np.float32)).mean(axis=0) for vectors in location_vectors
+        ]))
+        center = means.mean(axis=0)
+        centred = _unit_rows(means - center)
+
+        members: Dict[str, List[int]] = {}
+        for i, tags in enumerate(labels):
+            for tag in {t.strip().lower() for t in tags if t and t.strip()}:
+                members.setdefault(tag, []).append(i)
+        tags = sorted(tag for tag, rows in members.items() if len(rows) >= min_support)
+        if len(tags) <= TAGGER_MIN_TAGS:
+            return None
+        prototypes = np.stack([centred[members[tag]].mean(axis=0) for tag in tags])
+        return cls(tags, prototypes, center, {tag: len(members[tag]) for tag in tags})
+
+    def to_document(self, embedding_model: str) -> dict:
+        return {
+            "_id": PROTOTYPES_DOC_ID,
+            "embedding_model": embedding_model,
+            "tags": self.tags,
+            "prototypes": self.prototypes.tolist(),
+            "center": self.center.tolist(),
+            "support": self.support,
+            "built_at": datetime.now(timezone.utc),
+        }
+
+    @classmethod
+    def from_document(cls, document: dict) -> "VibeTagger":
+        return cls(document["tags"], np.array(document["prototypes"]), np.array(document["center"]), document.get("support", {}))
+
+
+# (loaded_at, tagger); None until the first load.
+_loaded: Optional[Tuple[float, Optional[VibeTagger]]] = None
+
+
+async def load_tagger(embedding_model: str) -> Optional[VibeTagger]:
+    # Cached per process; picks up rebuilt prototypes within TAGGER_RELOAD_SECONDS.
+    global _loaded
+    if _loaded is not None and time.monotonic() - _loaded[0] < TAGGER_RELOAD_SECONDS:
+        return _loaded[1]
+    collection = await get_tag_prototypes_collection()
+    document = await collection.find_one({"_id": PROTOTYPES_DOC_ID})
+    # Prototypes from another embedding model live in a different space.
+    if document and document.get("embedding_model") == embedding_model:
+        tagger = VibeTagger.from_document(document)
+    else:
+        tagger = None
+    _loaded = (time.monotonic(), tagger)
+    return tagger
+
+
+async def save_tagger(tagger: VibeTagger, embedding_model: str):
+    global _loaded
+    collection = await get_tag_prototypes_collection()
+    await collection.replace_one({"_id": PROTOTYPES_DOC_ID}, tagger.to_document(embedding_model), upsert=True)
+    _loaded = (time.monotonic(), tagger)
+
+
+def map_reduce_calls(review_lines: int, reviews_per_batch: int) -> int:
+    return math.ceil(review_lines / reviews_per_batch) + 1
+
+
+def evaluate(tagger: VibeTagger, samples: Sequence[Tuple[np.ndarray, Sequence[str], int]],
+             reviews_per_batch: int) -> dict:
+    # samples: (review vectors, LLM tags, distinct review lines) per location.
+    confident = 0
+    precision = recall = jaccard = 0.0
+    calls_before = calls_after = 0
+    for vectors, llm_tags, review_lines in samples:
+        result = tagger.tag(vectors)
+        before = map_reduce_calls(review_lines, reviews_per_batch)
+        calls_before += before
+        if not result.confident:
+            calls_after += before
+            continue
+        calls_after += 1
+        confident += 1
+        local, expected = set(result.tags), {t.lower() for t in llm_tags}
+        overlap = len(local & expected)
+        precision += overlap / len(local)
+        recall += overlap / len(expected) if expected else 0.0
+        jaccard += overlap / len(local | expected)
+    return {
+        "locations": len(samples),
+        "confident": confident,
+        "precision": precision / confident if confident else 0.0,
+        "recall": recall / confident if confident else 0.0,
+        "jaccard": jaccard / confident if confident else 0.0,
+        "llm_calls_before": calls_before,
+        "llm_calls_after": calls_after,
+    }
+
+
+def summary_prompt(location_name: str, tags: List[str], review_texts: List[str]) -> str:
+    reviews = "\n".join(f"- {text}" for text in review_texts)
+    return f"""
+                You are a witty and insightful city guide writing a Vibe Card for "{location_name}".
+                Its vibe tags are already decided: {", ".join(tags)}.
+
+                Representative reviews:
+                {reviews}
+
+                Based ONLY on these reviews and tags, respond with ONLY a valid JSON object:
+                1.  **vibe_summary:** A playful, 1-2 sentence summary of the location's overall vibe.
+                2.  **emojis:** 3 emojis that best represent the vibe, as a single string.
+
+                Example:
+                {{
+                "vibe_summary": "A bustling paradise for book lovers with mountains of books, though it can get a bit crowded.",
+                "emojis": "📚❤️✨"
+                }}
+                """
@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("mongomock_motor")
+
+from benchmark import fakes
+
+# The fakes replace the Gemini and Pinecone SDK entry points, so they go in
+# before any app module is imported.
+fake_genai, fake_index = fakes.install(embed_latency_ms=50, generate_latency_ms=100, pinecone_latency_ms=30)
+
+from mongomock_motor import AsyncMongoMockClient
+
+from benchmark.corpus import generate_corpus
+from db.mongo import db, get_location_collection
+from services import gemini_rag
+from services.single_flight import SingleFlight
+
+CONCURRENT_REQUESTS = 100
+
+
+@pytest.fixture(scope="module", autouse=True)
+def corpus():
+    db.client = AsyncMongoMockClient()
+    locations = generate_corpus(locations_per_slice=3, reviews_per_location=5)
+
+    async def seed():
+        await (await get_location_collection()).insert_many(locations)
+
+    asyncio.run(seed())
+    fake_index.upsert(vectors=[
+        {"id": f"{loc['_id']}#{i}", "values": fakes.fake_embedding(review["text"]),
+         "metadata": {"city": loc["city"], "category": loc["category"]}}
+        for loc in locations for i, review in enumerate(loc["raw_reviews"])
+    ])
+    return locations
+
+
+def test_identical_retrievals_make_one_upstream_call():
+    embed_calls, query_calls = fake_genai.embed_calls, fake_index.query_calls
+
+    async def run():
+        return await asyncio.gather(*(
+            gemini_rag.find_relevant_reviews_with_pinecone(query="Cozy  cafe with good coffee", city="Pune", top_k=10)
+            for _ in range(CONCURRENT_REQUESTS)
+        ))
+
+    results = asyncio.run(run())
+    assert fake_genai.embed_calls - embed_calls == 1
+    assert fake_index.query_calls - query_calls == 1
+    assert results[0] and all(result == results[0] for result in results)
+
+
+def test_identical_tour_plans_make_one_generation():
+    generate_calls = fake_genai.generate_calls
+
+    async def run():
+        return await asyncio.gather(*(
+            gemini_rag.generate_tour_plan(city="pune", vibe_tags=["quiet", "cozy"])
+            for _ in range(CONCURRENT_REQUESTS)
+        ))
+
+    results = asyncio.run(run())
+    assert fake_genai.generate_calls - generate_calls == 1
+    assert all(result == results[0] for result in results)
+
+
+def test_retrieval_does_not_join_a_leader_with_a_smaller_budget():
+    query_calls = fake_index.query_calls
+
+    async def run():
+        spent = gemini_rag.find_relevant_reviews_with_pinecone(query="quiet park", city="pune", budget_ms=0)
+        full = gemini_rag.find_relevant_reviews_with_pinecone(query="quiet park", city="pune")
+        return await asyncio.gather(spent, full)
+
+    asyncio.run(run())
+    # Only the full-budget caller searches vectors; it didn't get the spent leader's lexical results.
+    assert fake_index.query_calls - query_calls == 1
+
+
+def test_leader_exception_reaches_every_waiter():
+    flights = SingleFlight("test")
+    calls = 0
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def run():
+        return await asyncio.gather(*(flights.do("k", failing) for _ in range(10)), return_exceptions=True)
+
+    outcomes = asyncio.run(run())
+    assert calls == 1
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+
+    # Failures aren't cached: the next call goes upstream again.
+    asyncio.run(run())
+    assert calls == 2
+
+
+def test_cancelling_one_waiter_keeps_the_shared_flight():
+    flights = SingleFlight("test")
+    calls = 0
+
+    async def slow():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def run():
+        first = asyncio.create_task(flights.do("k", slow))
+        second = asyncio.create_task(flights.do("k", slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == "ok"
+    assert calls == 1
@@ -28,19 +28,34 @@ export interface AgentApiResponse {
     review_text: string;
     author: string | null;
   }[];
+  session_id?: string | null;
 }
 
 export const chatWithAgent = async (
   query: string,
   city: string,
-  chatHistory: ChatTurn[]
+  chatHistory: ChatTurn[],
+  sessionId: string | null = null
 ): Promise<AgentApiResponse> => {
   try {
+    // With a session the server keeps the history; only send ours without one.
     const response = await api.post<AgentApiResponse>("/vibes/agent/chat", {
       query,
       city,
-      chat_history: chatHistory,
+      session_id: sessionId ?? "new",
+      chat_history: sessionId ? [] : chatHistory,
     });
+    // A different id means our session expired and the server started a new
+    // one without the history: ask again with ours.
+    if (sessionId && response.data.session_id !== sessionId && chatHistory.length) {
+      const retry = await api.post<AgentApiResponse>("/vibes/agent/chat", {
+        query,
+        city,
+        session_id: "new",
+        chat_history: chatHistory,
+      });
+      return retry.data;
+    }
     return response.data;
   } catch (error: any) {
     if (error.response?.status === 422) {
@@ -29,6 +29,7 @@ export const ChatModal = ({ isOpen, onClose }: ChatModalProps) => {
   ]);
   const [inputValue, setInputValue] = useState("");
   const [isLoading, setIsLoading] = useState(false);
+  const [sessionId, setSessionId] = useState<string | null>(null);
   const scrollAreaRef = useRef<HTMLDivElement>(null);
   const SUPPORTED_CITIES = [
   "pune",
@@ -87,7 +88,8 @@ function extractFirstCity(text: string): string | null {
         return;
       }
 
-      const data = await chatWithAgent(inputValue, city, apiChatHistory);
+      const data = await chatWithAgent(inputValue, city, apiChatHistory, sessionId);
+      if (data.session_id) setSessionId(data.session_id);
       
       const aiMessage: UIMessage = {
         id: (Date.now() + 1).toString(),